@@ -0,0 +1,641 @@
+import sys
+import json
+import sqlite3
+
+from array import array
+from glob import glob
+from os import path, mkdir, remove, replace
+from HeavyHitters import SpaceSaving
+from UserTable import HyperLogLog
+from TimeSeries import HourlySeries, DEFAULT_RETENTION, ITEM_SIZE
+from TopicStorage import topic_codec
+from Compression import EXTENSIONS, find_stored, read_stored, write_stored
+from Metrics import METRICS
+
+"""
+Accumulated analysis of a topic in a language, kept in an SQLite file (analyses/<topic>_<language>.db).
+Extractor counts only the tweets that are new since the previous analysis, saving adds these counts to the stored
+ones (and loading reads just a few numbers), so both cost as much as the changed keys, not the whole vocabulary.
+The human readable json analysis (analyses/<topic>_<language>.json) is an optional export, see --export.
+Charts and dashboards read summaries instead (analyses/<topic>.summary.json): dates, trending terms, totals and hourly
+numbers of every analyzed language of the topic in a single small file, rewritten by Extractor after each analysis.
+It is compressed with the codec of the topic's tweets, if they are compressed (see Compression.py).
+A json analysis saved by older versions is imported the first time the state is loaded.
+In approximate mode words and hashtags are Space-Saving summaries (see HeavyHitters.py), their estimated counts are
+kept in the same table (so readers do not notice) along with maximum errors, and replaced as a whole on save.
+Users estimated by HyperLogLog (see UserTable.py) replace the users counters with registers of the estimate.
+Hourly numbers of tweets of every language are kept as array bytes (see TimeSeries.py), sliced by range queries.
+The state is kept in write-ahead-log mode: a save is a single transaction appending the changed pages (new last_id
+included) to the journal (<state>.db-wal), readers see the stored pages plus the journal, and a crash during a save
+leaves the previous analysis. SQLite folds the journal into the state file at checkpoints, every few saves the file
+is compacted as well, so space freed by replaced summaries or filtered words is given back.
+"""
+
+FORMAT_VERSION = 1
+WORDS = 'words'
+HASHTAGS = 'hashtags'
+USERS = 'users'
+DATES = 'dates'
+LANGUAGES = 'languages'
+KINDS = (WORDS, HASHTAGS, USERS, DATES, LANGUAGES)  # counters kept in the state, named like Extractor attributes
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (kind TEXT, key TEXT, count INTEGER, PRIMARY KEY (kind, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ranking ON counters (kind, count);
+CREATE TABLE IF NOT EXISTS errors (kind TEXT, key TEXT, error INTEGER, PRIMARY KEY (kind, key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS registers (kind TEXT PRIMARY KEY, data BLOB) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (language TEXT PRIMARY KEY, start INTEGER, counts BLOB) WITHOUT ROWID;
+'''
+UPSERT = 'INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count'
+QUERY_LIMIT = 500  # maximum number of parameters bound to a single query
+COMPACTION_INTERVAL = 20  # saves between two compactions of the state file
+FREE_RATIO = .25  # part of the state file that has to be free for a compaction to rebuild it
+JOURNAL_SUFFIXES = ('-wal', '-shm')  # files SQLite keeps next to a state in write-ahead-log mode
+EXPORT_INDENT = 3  # indentation of json analyses, their top level keys are found by it without parsing the rest
+SUMMARY_SECTIONS = ('last_id', 'tweets_count', 'tweets_applying_for_analysis', 'followers', 'languages', 'dates',
+                    'trending')  # parts of a json analysis making its summary
+
+
+def state_path(topic, language, extension='.db'):
+    """
+    Gives path of the analysis state (or its json export).\n
+    :param topic: topic of the analysis
+    :param language: language of the analysis
+    :param extension: '.db' for the state, '.json' for the export
+    :return: path to the file
+    """
+    return 'analyses/' + topic + '_' + language + extension
+
+
+def analyzed_languages(topic):
+    """
+    Lists languages the topic was analyzed in, including ones only having a json analysis.\n
+    :param topic: topic of the analyses
+    :return: sorted list of language codes
+    """
+    prefix = 'analyses/' + topic + '_'
+    languages = set()
+    for extension in ('.db', '.json') + tuple('.json' + extension for extension in EXTENSIONS.values()):
+        for file_path in glob(prefix + '*' + extension):
+            code = file_path[len(prefix):-len(extension)]
+            if '_' not in code:  # other topics starting with the same name
+                languages.add(code)
+    return sorted(languages)
+
+
+def remove_state(file_path):
+    """
+    Removes a state file with its journal, a journal left behind would be applied to a new state of the same path.\n
+    :param file_path: path to the state file
+    """
+    for suffix in ('',) + JOURNAL_SUFFIXES:
+        if path.exists(file_path + suffix):
+            remove(file_path + suffix)
+
+
+def summary_path(topic):
+    """
+    Gives path of the summaries of a topic's analyses.\n
+    :param topic: topic of the analyses
+    :return: path to the file
+    """
+    return 'analyses/' + topic + '.summary.json'
+
+
+def load_summaries(topic):
+    """
+    Loads summaries of a topic's analyses.\n
+    :param topic: topic of the analyses
+    :return: dictionary language -> summary (see AnalysisState.summary), None if there are no summaries
+    """
+    try:
+        with open(summary_path(topic), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_summaries(topic, summaries):
+    """
+    Saves summaries of a topic's analyses, replacing the previous ones at once.\n
+    :param topic: topic of the analyses
+    :param summaries: dictionary language -> summary
+    """
+    with open(summary_path(topic) + '.tmp', 'w') as file:
+        json.dump(summaries, file)
+    replace(summary_path(topic) + '.tmp', summary_path(topic))
+
+
+def read_sections(file_path, keys):
+    """
+    Reads some top level values of a json analysis, only the values themselves are parsed.\n
+    Files not indented like exported analyses are parsed as a whole.\n
+    :param file_path: path of the json file, plain or compressed
+    :param keys: top level keys to read
+    :return: dictionary key -> value, missing keys are left out
+    """
+    text = read_stored(file_path).decode('utf-8')
+    decoder = json.JSONDecoder()
+    sections = {}
+    for key in keys:
+        marker = '\n' + ' ' * EXPORT_INDENT + json.dumps(key) + ': '  # nested keys are indented deeper
+        position = text.find(marker)
+        if position < 0:
+            content = json.loads(text)
+            return {key: content[key] for key in keys if key in content}
+        sections[key] = decoder.raw_decode(text, position + len(marker))[0]
+    return sections
+
+
+def summarize(topic, language):
+    """
+    Makes the summary of an analysis from its state, or from its json analysis if it was not imported yet.\n
+    :param topic: topic of the analysis
+    :param language: language of the analysis
+    :return: summary (see AnalysisState.summary), None if there is no analysis
+    """
+    if path.exists(state_path(topic, language)):
+        state = AnalysisState(topic, language)
+        summary = state.summary()
+        state.close()
+        return summary
+    json_path = find_stored(state_path(topic, language, '.json'))
+    return read_sections(json_path, SUMMARY_SECTIONS) if json_path is not None else None
+
+
+def update_summaries(topic, languages=()):
+    """
+    Rewrites summaries of passed languages of a topic, adds summaries of analyzed languages missing from the file.\n
+    :param topic: topic of the analyses
+    :param languages: languages whose analyses changed
+    :return: dictionary language -> summary
+    """
+    with METRICS.timer('analysis.summaries'):
+        summaries = load_summaries(topic) or {}
+        for language in analyzed_languages(topic):
+            if language in languages or language not in summaries:
+                summary = summarize(topic, language)
+                if summary is not None:
+                    summaries[language] = summary
+        if summaries:
+            save_summaries(topic, summaries)
+    return summaries
+
+
+def topic_summaries(topic):
+    """
+    Gives summaries of every analysis of a topic, read from a single file.\n
+    Summaries of analyses saved by older versions are made (and saved) the first time.\n
+    :param topic: topic of the analyses
+    :return: dictionary language -> summary
+    """
+    summaries = load_summaries(topic)
+    return summaries if summaries is not None else update_summaries(topic)
+
+
+class AnalysisState:
+    """
+    Stored counters and totals of the analysis of a topic in a language.\n
+    """
+
+    def __init__(self, topic, language):
+        """
+        Constructor of AnalysisState class.\n
+        :param topic: topic of the analysis
+        :param language: language of the analysis
+        """
+        self.topic = topic
+        self.language = language
+        self.path = state_path(topic, language)
+        self.connection = None
+
+    def exists(self):
+        """
+        Checks if the topic was analyzed in the language.\n
+        :return: True if there is a state or a json analysis to import
+        """
+        return path.exists(self.path) or find_stored(state_path(self.topic, self.language, '.json')) is not None
+
+    def open(self):
+        """
+        Opens (creating if needed) the state file.\n
+        :return: the state itself
+        """
+        if self.connection is None:
+            if not path.exists('analyses'):
+                mkdir('analyses')
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(SCHEMA)
+        return self
+
+    def close(self):
+        """
+        Closes the state file.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def load(self):
+        """
+        Reads totals of the analysis, imports a json analysis if there is no state yet.\n
+        :return: dictionary with last_id, tweets_count, followers, sketch_capacity (None if counted exactly),
+                 users_precision (None if every user is counted) and stemmed (None if whole words are counted)
+                 or None if there was no analysis
+        """
+        if not path.exists(self.path):
+            json_path = find_stored(state_path(self.topic, self.language, '.json'))
+            if json_path is None:
+                return None
+            self.import_json(json_path)
+        self.open()
+        meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        return {'last_id': meta.get('last_id'), 'tweets_count': meta.get('tweets_count', 0),
+                'followers': meta.get('followers', 0), 'sketch_capacity': meta.get('sketch_capacity'),
+                'users_precision': meta.get('users_precision'), 'stemmed': meta.get('stemmed')}
+
+    def load_sketch(self, kind, sketch):
+        """
+        Loads stored counts of words or hashtags into a summary.\n
+        Exactly counted terms are turned into a summary of the most frequent ones (when switching to approximate mode).\n
+        :param kind: WORDS or HASHTAGS
+        :param sketch: SpaceSaving to load the counts into
+        """
+        self.open()
+        meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+        if meta.get('sketch_capacity'):
+            rows = self.connection.execute('SELECT c.key, c.count, COALESCE(e.error, 0) FROM counters c LEFT JOIN errors e '
+                                           'ON e.kind = c.kind AND e.key = c.key WHERE c.kind = ?', (kind,))
+            sketch.load(rows, meta.get(kind + '_total', 0))
+        else:
+            total = self.connection.execute('SELECT SUM(count) FROM counters WHERE kind = ?', (kind,)).fetchone()[0]
+            sketch.load([(key, count, 0) for key, count in self.counters(kind, sketch.capacity).items()], total or 0)
+
+    def load_users(self, users):
+        """
+        Loads the stored estimate of distinct users.\n
+        Counted users are added to the estimate one by one (when switching to the estimate).\n
+        :param users: HyperLogLog to load the registers into
+        """
+        self.open()
+        row = self.connection.execute('SELECT data FROM registers WHERE kind = ?', (USERS,)).fetchone()
+        if row is not None:
+            users.registers = bytearray(row[0])
+        else:
+            for (screen_name,) in self.connection.execute('SELECT key FROM counters WHERE kind = ?', (USERS,)):
+                users.add(screen_name)
+
+    def distinct_users(self):
+        """
+        Gives the number of users who posted about the topic.\n
+        :return: number of users, estimated if they are not counted one by one
+        """
+        self.open()
+        row = self.connection.execute('SELECT data FROM registers WHERE kind = ?', (USERS,)).fetchone()
+        if row is not None:
+            users = HyperLogLog(len(row[0]).bit_length() - 1)
+            users.registers = bytearray(row[0])
+            return round(users.estimate())
+        return self.connection.execute('SELECT COUNT(*) FROM counters WHERE kind = ?', (USERS,)).fetchone()[0]
+
+    def hours_end(self):
+        """
+        Gives the hour following the newest hourly number.\n
+        :return: hour number (see TimeSeries.py), None if no hours were counted
+        """
+        self.open()
+        return self.connection.execute('SELECT MAX(start + LENGTH(counts) / ?) FROM series', (ITEM_SIZE,)).fetchone()[0]
+
+    def hourly(self, first=None, end=None, language=None):
+        """
+        Reads numbers of tweets per hour in a range, only the stored bytes of the range are read.\n
+        :param first: first hour of the range, the oldest kept hour by default
+        :param end: hour following the range, the one following the newest hour by default
+        :param language: language of the tweets, None for all of them
+        :return: HourlySeries covering the range
+        """
+        self.open()
+        if end is None:
+            end = self.hours_end()
+        if first is None:
+            first = self.connection.execute('SELECT MIN(start) FROM series').fetchone()[0]
+        if first is None or end is None or first >= end:
+            return HourlySeries()
+        result = HourlySeries(first, array('I', bytes(ITEM_SIZE * (end - first))))
+        query = 'SELECT MAX(start, ?), SUBSTR(counts, (MAX(start, ?) - start) * ? + 1, (? - MAX(start, ?)) * ?) ' \
+                'FROM series WHERE start < ? AND start + LENGTH(counts) / ? > ?'
+        parameters = [first, first, ITEM_SIZE, end, first, ITEM_SIZE, end, ITEM_SIZE, first]
+        if language is not None:
+            query += ' AND language = ?'
+            parameters.append(language)
+        for start, data in self.connection.execute(query, parameters):
+            for offset, count in enumerate(HourlySeries.from_bytes(start, data).counts, start - first):
+                result.counts[offset] += count
+        return result
+
+    def series(self):
+        """
+        Reads hourly numbers of tweets of every language.\n
+        :return: dictionary language -> HourlySeries
+        """
+        self.open()
+        return {language: HourlySeries.from_bytes(start, data)
+                for language, start, data in self.connection.execute('SELECT language, start, counts FROM series')}
+
+    def counters(self, kind, limit=None):
+        """
+        Reads stored counts of a kind, from the most to the least frequent (alphabetically when equal).\n
+        :param kind: one of KINDS
+        :param limit: maximum number of keys, None for all of them
+        :return: dictionary key -> count
+        """
+        self.open()
+        query = 'SELECT key, count FROM counters WHERE kind = ? ORDER BY count DESC, key'
+        if limit is not None:
+            return dict(self.connection.execute(query + ' LIMIT ?', (kind, limit)))
+        return dict(self.connection.execute(query, (kind,)))
+
+    def count(self, kind, key):
+        """
+        Reads a single stored count.\n
+        :param kind: one of KINDS
+        :param key: counted key
+        :return: the count, None if the key was never counted
+        """
+        self.open()
+        row = self.connection.execute('SELECT count FROM counters WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return row[0] if row else None
+
+    def known(self, kind, keys):
+        """
+        Finds which of the keys were counted before.\n
+        :param kind: one of KINDS
+        :param keys: list of keys
+        :return: set of stored keys
+        """
+        return set(self.counts(kind, keys))
+
+    def counts(self, kind, keys):
+        """
+        Reads stored counts of several keys, each one found by the primary key.\n
+        :param kind: one of KINDS
+        :param keys: list of keys
+        :return: dictionary key -> count of the stored keys
+        """
+        self.open()
+        found = {}
+        for start in range(0, len(keys), QUERY_LIMIT):
+            chunk = keys[start:start + QUERY_LIMIT]
+            query = 'SELECT key, count FROM counters WHERE kind = ? AND key IN ({})'.format(','.join('?' * len(chunk)))
+            found.update(self.connection.execute(query, [kind] + chunk))
+        return found
+
+    def save(self, extractor):
+        """
+        Adds counts of newly analyzed tweets in a single transaction.\n
+        Followers of users who did not post about the topic before are added to the total.\n
+        :param extractor: Extractor holding counts of the new tweets and totals loaded from this state
+        """
+        self.open()
+        if not isinstance(extractor.users, HyperLogLog):
+            known = self.known(USERS, list(extractor.users))
+            extractor.followers += sum(followers for user, followers in extractor.users.first_followers()
+                                       if user not in known)
+        with self.connection:
+            for kind in KINDS:
+                counter = getattr(extractor, kind)
+                if isinstance(counter, SpaceSaving):
+                    self.save_sketch(kind, counter)
+                elif isinstance(counter, HyperLogLog):
+                    self.save_registers(kind, counter)
+                else:
+                    self.connection.executemany(UPSERT, ((kind, k, v) for k, v in counter.items()))
+            self.save_hours(extractor.hours, extractor.retention)
+            if extractor.filtered_words:
+                self.connection.executemany('DELETE FROM counters WHERE kind = ? AND key = ?',
+                                            ((WORDS, word) for word in extractor.filtered_words))
+            if extractor.stem:
+                self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('stemmed', 1))
+            saves = (self.connection.execute('SELECT value FROM meta WHERE key = ?', ('saves',)).fetchone() or (0,))[0]
+            self.connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', (
+                ('format', FORMAT_VERSION), ('last_id', extractor.new_last_id),
+                ('tweets_count', extractor.tweets_count + extractor.new_tweets_count),
+                ('followers', extractor.followers), ('saves', saves + 1)))
+        if (saves + 1) % COMPACTION_INTERVAL == 0:
+            with METRICS.timer('analysis.compact'):
+                self.compact()
+
+    def compact(self):
+        """
+        Folds the journal into the state file, rebuilds the file if a big part of it is free.\n
+        :return: True if the file was rebuilt
+        """
+        self.open()
+        self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        pages = self.connection.execute('PRAGMA page_count').fetchone()[0]
+        free = self.connection.execute('PRAGMA freelist_count').fetchone()[0]
+        if free <= pages * FREE_RATIO:
+            return False
+        self.connection.execute('VACUUM')  # atomic, goes through the journal as well
+        self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return True
+
+    def save_sketch(self, kind, sketch):
+        """
+        Replaces stored counts of words or hashtags with a summary, called inside the save transaction.\n
+        :param kind: WORDS or HASHTAGS
+        :param sketch: SpaceSaving holding all the counts (loaded ones included)
+        """
+        for table in ('counters', 'errors'):
+            self.connection.execute('DELETE FROM {} WHERE kind = ?'.format(table), (kind,))
+        rows = sketch.rows()
+        self.connection.executemany('INSERT INTO counters VALUES (?, ?, ?)', ((kind, k, c) for k, c, _ in rows))
+        self.connection.executemany('INSERT INTO errors VALUES (?, ?, ?)', ((kind, k, e) for k, _, e in rows if e))
+        self.connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', (
+            ('sketch_capacity', sketch.capacity), (kind + '_total', sketch.total)))
+
+    def save_hours(self, hours, retention=None):
+        """
+        Adds hourly numbers of new tweets and drops hours older than the retention window, called inside the save
+        transaction.\n
+        :param hours: dictionary (language, hour) -> number of tweets
+        :param retention: number of hours kept before the newest one, None keeps the stored window
+        """
+        if retention:
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('retention', retention))
+        else:
+            row = self.connection.execute('SELECT value FROM meta WHERE key = ?', ('retention',)).fetchone()
+            retention = row[0] if row else DEFAULT_RETENTION
+        series = self.series()
+        for (language, hour), count in hours.items():
+            if language not in series:
+                series[language] = HourlySeries()
+            series[language].add(hour, count)
+        if not series:
+            return
+        end = max(counts.end() for counts in series.values())
+        for language, counts in series.items():
+            counts.trim(retention, end)
+            if counts:
+                self.connection.execute('INSERT OR REPLACE INTO series VALUES (?, ?, ?)',
+                                        (language, counts.start, counts.to_bytes()))
+            else:
+                self.connection.execute('DELETE FROM series WHERE language = ?', (language,))
+
+    def save_registers(self, kind, estimate):
+        """
+        Replaces stored users with an estimate of their number, called inside the save transaction.\n
+        :param kind: USERS
+        :param estimate: HyperLogLog holding all the users (loaded ones included)
+        """
+        self.connection.execute('DELETE FROM counters WHERE kind = ?', (kind,))
+        self.connection.execute('INSERT OR REPLACE INTO registers VALUES (?, ?)', (kind, bytes(estimate.registers)))
+        self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (kind + '_precision', estimate.precision))
+
+    def adopt(self, other):
+        """
+        Starts the state as a copy of another language's state without its words and hashtags.\n
+        Used for languages that appear in a topic for the first time, their statistics not depending on the language
+        have to include the previously analyzed tweets.\n
+        :param other: state of the same topic in another language
+        """
+        self.close()
+        remove_state(self.path + '.tmp')
+        target = sqlite3.connect(self.path + '.tmp')
+        other.open().connection.backup(target)  # includes changes still kept in the journal
+        target.close()
+        other.close()
+        remove_state(self.path)
+        replace(self.path + '.tmp', self.path)
+        self.open()
+        with self.connection:
+            for table in ('counters', 'errors'):
+                self.connection.execute('DELETE FROM {} WHERE kind IN (?, ?)'.format(table), (WORDS, HASHTAGS))
+            self.connection.execute('DELETE FROM meta WHERE key IN (?, ?)', (WORDS + '_total', HASHTAGS + '_total'))
+
+    def trending(self):
+        """
+        Gives the 5 most popular hashtags and 10 most popular words.\n
+        :return: dictionary term -> count
+        """
+        trending = self.counters(HASHTAGS, 5)
+        trending.update(self.counters(WORDS, 10))
+        return trending
+
+    def summary(self):
+        """
+        Gives what charts and dashboards are drawn from, leaving out the full counters.\n
+        :return: dictionary with last_id, tweets_count, tweets_applying_for_analysis, followers, distinct_users,
+                 languages, dates, trending and hours (start hour and counts of tweets of every language)
+        """
+        totals = self.load()
+        languages = self.counters(LANGUAGES)
+        hours = self.hourly()
+        return {'last_id': totals['last_id'], 'tweets_count': totals['tweets_count'],
+                'tweets_applying_for_analysis': languages.get(self.language), 'followers': totals['followers'],
+                'distinct_users': self.distinct_users(), 'languages': languages, 'dates': self.counters(DATES),
+                'trending': self.trending(), 'hours': {'start': hours.start, 'counts': hours.counts.tolist()}}
+
+    def export(self, file_path=None):
+        """
+        Writes the analysis as human readable json.\n
+        :param file_path: path of the plain json file, analyses/<topic>_<language>.json (compressed like the topic's
+                          tweets) by default
+        :return: path of the written file
+        """
+        totals = self.load()
+        languages = self.counters(LANGUAGES)
+        collection = {'last_id': totals['last_id'], 'tweets_count': totals['tweets_count'],
+                      'tweets_applying_for_analysis': languages.get(self.language), 'followers': totals['followers'],
+                      'languages': languages, 'dates': self.counters(DATES), 'trending': self.trending(),
+                      'hashtags': self.counters(HASHTAGS), 'words': self.counters(WORDS), 'users': self.counters(USERS),
+                      'distinct_users': self.distinct_users(),
+                      'hours': {language: counts.labeled() for language, counts in self.series().items()}}
+        if totals['sketch_capacity']:
+            meta = dict(self.connection.execute('SELECT key, value FROM meta'))
+            collection['sketch'] = {'capacity': totals['sketch_capacity']}
+            for kind in (WORDS, HASHTAGS):
+                collection['sketch'][kind + '_total'] = meta.get(kind + '_total', 0)
+                collection['sketch'][kind + '_error_bound'] = meta.get(kind + '_total', 0) / totals['sketch_capacity']
+        if file_path:
+            with open(file_path + '.tmp', 'w') as file:
+                json.dump(collection, file, indent=EXPORT_INDENT)
+            replace(file_path + '.tmp', file_path)
+            return file_path
+        return write_stored(state_path(self.topic, self.language, '.json'),
+                            json.dumps(collection, indent=EXPORT_INDENT).encode('utf-8'), topic_codec(self.topic))
+
+    def import_json(self, file_path):
+        """
+        Creates the state from a json analysis.\n
+        :param file_path: path of the json file, plain or compressed
+        """
+        content = json.loads(read_stored(file_path))
+        self.close()
+        remove_state(self.path)
+        self.open()
+        last_id = int(content['last_id']) if content['last_id'] is not None else None  # v1 kept ids as text
+        with self.connection:
+            for kind in KINDS:
+                self.connection.executemany(UPSERT, ((kind, k, v) for k, v in content[kind].items()))
+            self.connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', (
+                ('format', FORMAT_VERSION), ('last_id', last_id), ('tweets_count', content['tweets_count']),
+                ('followers', content['followers'])))
+
+
+def export_topics(topic_list):
+    """
+    Exports analyses of passed topics as json, or of every analyzed topic if no topics passed.\n
+    :param topic_list: list of topics to export
+    """
+    if not topic_list:
+        topic_list = sorted({path.basename(file_path)[:-len('.db')].rsplit('_', 1)[0]
+                             for file_path in glob('analyses/*_*.db')})
+    for topic in topic_list:
+        languages = [language for language in analyzed_languages(topic) if path.exists(state_path(topic, language))]
+        if not languages:
+            print('Could not find analyses of {}, proceeding.'.format(topic))
+        for language in languages:
+            state = AnalysisState(topic, language)
+            print('Exported \x1b[1;34;40m{}\x1b[0m'.format(state.export()))
+            state.close()
+
+
+def compact_topics(topic_list):
+    """
+    Compacts analysis states of passed topics, or of every analyzed topic if no topics passed.\n
+    :param topic_list: list of topics to compact
+    """
+    if not topic_list:
+        topic_list = sorted({path.basename(file_path)[:-len('.db')].rsplit('_', 1)[0]
+                             for file_path in glob('analyses/*_*.db')})
+    for topic in topic_list:
+        for language in analyzed_languages(topic):
+            if not path.exists(state_path(topic, language)):
+                continue
+            state = AnalysisState(topic, language)
+            size = path.getsize(state.path)
+            rebuilt = state.compact()
+            state.close()
+            print('Compacted \x1b[1;34;40m{}\x1b[0m: {} kB -> {} kB{}.'.format(
+                state.path, size // 1024, path.getsize(state.path) // 1024, ', rebuilt' if rebuilt else ''))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and (sys.argv[1] == '-e' or sys.argv[1] == '--export'):
+        export_topics([arg.lower() for arg in sys.argv[2:] if arg[0] != '-'])
+    elif len(sys.argv) > 1 and (sys.argv[1] == '-c' or sys.argv[1] == '--compact'):
+        compact_topics([arg.lower() for arg in sys.argv[2:] if arg[0] != '-'])
+    else:
+        print('usage: python3 AnalysisState.py [-h] [-e [a b c...]] [-c [a b c...]]\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -e, --export [a,b...]\t\t exports analyses of topics a, b, c... as json\n'
+              '  -c, --compact [a,b...]\t folds journals of analyses of topics a, b, c... into their states\n'
+              '\n'
+              'If no topics passed to --export or --compact, every analyzed topic is exported or compacted.\n'
+              'States are compacted every {} saves anyway.\n'.format(COMPACTION_INTERVAL))
@@ -0,0 +1,462 @@
+import sys
+import json
+import random
+import shutil
+import platform
+import datetime
+import subprocess
+
+from io import StringIO
+from contextlib import redirect_stdout
+from os import chdir, getcwd, path, makedirs
+from tempfile import mkdtemp
+from time import perf_counter
+from TweetCodec import FIELDS, encode_tweet, decode_line, project_line, unwrap_line_to_dictionary
+from TopicStorage import TopicStorage
+from Compression import BLOCK_SIZE, available_codecs, compress_block, decompress_block
+from Extractor import Extractor, PYTHON
+from AnalysisState import AnalysisState, topic_summaries
+
+"""
+End-to-end benchmark of the analysis pipeline on generated corpora.
+CorpusGenerator writes realistic topic segments - a mix of languages, bots, hashtags, quotes, links and
+punctuation with zipf-distributed words - so every stage can be timed on 100k, 1M or 10M tweets without fetching.
+Stages (decoding, compression, Extractor.analyze, filter_words, save_the_analysis, load_previous_analysis, json export,
+Plotter.plot) are timed separately and written to a json file, results of two versions can be compared with --compare.
+"""
+
+RESULTS_FORMAT = 1  # version of the results file layout
+TOPIC = 'benchmark'  # topic of generated corpora, appears in most of the generated texts
+DEFAULT_SIZES = (100000, 1000000, 10000000)
+LANGUAGES = {'en': .55, 'es': .12, 'pt': .08, 'fr': .06, 'ja': .05, 'de': .04, 'und': .04, 'it': .03, 'tr': .03}
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'shi', 'va', 'de', 'qu', 'an', 'el', 'os', 'ur', 'in', 'ba', 'ze']
+COMMON_WORDS = ['people', 'today', 'time', 'news', 'world', 'great', 'love', 'new', 'good', 'think', 'year',
+                'first', 'day', 'state', 'life', 'week', 'work', 'health', 'game', 'home']
+
+
+class CorpusGenerator:
+    """
+    Generates tweets resembling the ones gathered by TweetPeeker.py and stores them as topic segments.\n
+    """
+
+    def __init__(self, topic=TOPIC, seed=0, vocabulary=5000):
+        """
+        Constructor of CorpusGenerator class.\n
+        :param topic: keyword the tweets are about
+        :param seed: seed of the generator, the same seed gives the same corpus
+        :param vocabulary: number of distinct words of every language
+        """
+        self.topic = topic
+        self.random = random.Random(seed)
+        self.languages = list(LANGUAGES)
+        self.language_weights = list(LANGUAGES.values())
+        self.vocabularies = {language: self.make_vocabulary(language, vocabulary) for language in self.languages}
+        self.hashtags = ['#' + self.make_word() for _ in range(500)] + ['#' + self.topic, '#' + self.topic.upper()]
+        self.zipf = {}  # size -> cumulative zipf weights, shared by vocabularies of the same size
+
+    def make_word(self):
+        """
+        Makes up a word from random syllables.\n
+        :return: the word
+        """
+        return ''.join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4)))
+
+    def make_vocabulary(self, language, size):
+        """
+        Makes up words of a language, ordered from the most to the least frequent.\n
+        English vocabulary starts with blacklisted and common words, so filtering has something to remove.\n
+        :param language: language code
+        :param size: number of words
+        :return: list of words
+        """
+        words = []
+        if language == 'en':
+            words = load_blacklist() + COMMON_WORDS
+        words += [self.make_word() for _ in range(size - len(words))]
+        words += [word.capitalize() for word in words[-size // 10:]]  # names and sentence starts
+        words += ['NASA', 'USA', 'UK', 'EU', 'UN', 'AI']
+        return words
+
+    def weights(self, size):
+        """
+        Gives cumulative zipf weights for a vocabulary.\n
+        :param size: number of words
+        :return: list of cumulative weights
+        """
+        if size not in self.zipf:
+            total = 0.0
+            cumulative = []
+            for rank in range(size):
+                total += 1.0 / (rank + 1)
+                cumulative.append(total)
+            self.zipf[size] = cumulative
+        return self.zipf[size]
+
+    def text(self, language):
+        """
+        Generates a tweet text.\n
+        :param language: language of the text
+        :return: the text
+        """
+        generator = self.random
+        vocabulary = self.vocabularies[language]
+        words = generator.choices(vocabulary, cum_weights=self.weights(len(vocabulary)), k=generator.randint(5, 22))
+        if generator.random() < .9:
+            words.insert(generator.randrange(len(words)), self.topic if generator.random() < .8 else self.topic.upper())
+        tags = generator.choices(self.hashtags, cum_weights=self.weights(len(self.hashtags)),
+                                 k=generator.choice((0, 0, 1, 1, 2, 3)))
+        for tag in tags:
+            words.insert(generator.randrange(len(words) + 1), tag)
+
+        for position in range(len(words)):
+            chance = generator.random()
+            if chance < .04:
+                words[position] += generator.choice((',', '.', '!', '?', ':', ';'))
+            elif chance < .05:
+                words[position] = '"' + words[position] + '"'
+            elif chance < .055:
+                words[position] = '‘' + words[position] + '’'
+            elif chance < .06:
+                words[position] += '’s'
+            elif chance < .065:
+                words[position] = '(' + words[position] + ')'
+            elif chance < .07:
+                words[position] = '-' + words[position]
+            elif chance < .075:
+                words[position] = '@' + words[position]
+        if generator.random() < .3:
+            words.append('https://t.co/' + ''.join(generator.choice('abcdefghijk0123456789') for _ in range(10)))
+        return ' '.join(words)
+
+    def users(self, count):
+        """
+        Generates authors, about 5% of them are bots.\n
+        :param count: number of authors
+        :return: list of (screen name, followers) pairs
+        """
+        generator = self.random
+        authors = []
+        for number in range(count):
+            chance = generator.random()
+            if chance < .02:
+                name = self.make_word() + 'bot' + str(number)
+            elif chance < .04:
+                name = 'Bot' + self.make_word() + str(number)
+            elif chance < .05:
+                name = 'iembot_' + self.make_word()
+            else:
+                name = self.make_word().capitalize() + generator.choice(('', '_', '')) + str(number)
+            authors.append((name, int(generator.paretovariate(1.2) * 50)))
+        return authors
+
+    def tweets(self, count, newest_id=1300000000000000000, end=datetime.datetime(2020, 6, 7)):
+        """
+        Generates tweets ordered from the newest to the oldest, posted within 7 days before end.\n
+        :param count: number of tweets
+        :param newest_id: id of the newest tweet
+        :param end: date of the newest tweet
+        :return: generator of tweet dictionaries
+        """
+        generator = self.random
+        authors = self.users(max(100, count // 8))
+        step = 7 * 24 * 3600 / count
+        tweet_id = newest_id
+        for number in range(count):
+            screen_name, followers = generator.choice(authors)
+            language = generator.choices(self.languages, self.language_weights)[0]
+            yield {
+                'id': tweet_id,
+                'date': str(end - datetime.timedelta(seconds=int(number * step))),
+                'screen_name': screen_name,
+                'user_location': generator.choice(('', '', 'London', 'New York, USA', 'São Paulo', 'Berlin')),
+                'user_followers': followers,
+                'retweet_count': int(generator.expovariate(.2)),
+                'favorite_count': int(generator.expovariate(.1)),
+                'language': language,
+                'full_text': self.text(language)
+            }
+            tweet_id -= generator.randint(1, 5000)
+
+    def write(self, count, batch=10000):
+        """
+        Stores generated tweets as topic segments in outputs/, replacing tweets stored before.\n
+        :param count: number of tweets
+        :param batch: number of tweets appended at once
+        :return: size of the stored tweets in bytes
+        """
+        if path.exists('outputs/' + self.topic):
+            shutil.rmtree('outputs/' + self.topic)
+        makedirs('outputs', exist_ok=True)
+        storage = TopicStorage(self.topic).load()
+        pending = []
+        for tweet in self.tweets(count):
+            pending.append((tweet['id'], encode_tweet(tweet)))
+            if len(pending) == batch:
+                storage.append(pending, head=False)
+                pending = []
+        if pending:
+            storage.append(pending, head=False)
+        storage.seal()
+        return sum(segment['size'] for segment in storage.segments)
+
+
+def load_blacklist():
+    """
+    Loads words filtered off the analyses.\n
+    :return: list of words, empty if there is no blacklist
+    """
+    try:
+        with open('assets/word_blacklist.txt', 'r') as file:
+            return file.read().split()
+    except FileNotFoundError:
+        return []
+
+
+def legacy_line(tweet):
+    """
+    Encodes a tweet in the legacy (version 1) format, used to time unwrap_line_to_dictionary.\n
+    :param tweet: dictionary form of the tweet
+    :return: encoded line
+    """
+    return '{ \'' + '\', \''.join(key + '\':\'' + str(tweet[key]) for key in FIELDS if key in tweet) + '\' }\n'
+
+
+def stage(seconds, tweets=None):
+    """
+    Describes a timed stage.\n
+    :param seconds: time the stage took
+    :param tweets: number of processed tweets, if the stage depends on it
+    :return: dictionary of the stage results
+    """
+    result = {'seconds': round(seconds, 6)}
+    if tweets:
+        result['tweets'] = tweets
+        result['per_tweet_us'] = round(seconds * 1000000 / tweets, 3)
+    return result
+
+
+def benchmark_size(size, sample=100000, processes=1, plot=True, seed=0, backend=PYTHON):
+    """
+    Generates a corpus of a given size in the current directory (unless it is already there) and times every stage.\n
+    :param size: number of tweets in the corpus
+    :param sample: number of lines decoded by the codec stages
+    :param processes: number of processes analyzing the corpus
+    :param plot: whether to time plotting (needs matplotlib)
+    :param seed: seed of the corpus
+    :param backend: analysis backend of the Extractor, PYTHON or PANDAS
+    :return: dictionary of stage results
+    """
+    stages = {}
+    storage = TopicStorage(TOPIC).load()
+    if storage.lines() != size:
+        start_time = perf_counter()
+        size_bytes = CorpusGenerator(TOPIC, seed).write(size)
+        stages['generate'] = stage(perf_counter() - start_time, size)
+        stages['generate']['bytes'] = size_bytes
+
+    lines = []
+    for line in TopicStorage(TOPIC).load().read():
+        lines.append(line)
+        if len(lines) == sample:
+            break
+    start_time = perf_counter()
+    tweets = [decode_line(line) for line in lines]
+    stages['decode_line'] = stage(perf_counter() - start_time, len(lines))
+    start_time = perf_counter()
+    for line in lines:
+        project_line(line).id  # full_text stays undecoded, as for tweets in languages that are not analyzed
+    stages['project_line'] = stage(perf_counter() - start_time, len(lines))
+
+    data = ''.join(lines).encode('utf-8')
+    for codec in available_codecs():
+        start_time = perf_counter()
+        blocks = [compress_block(data[start:start + BLOCK_SIZE], codec) for start in range(0, len(data), BLOCK_SIZE)]
+        stages['compress_' + codec] = stage(perf_counter() - start_time, len(lines))
+        stages['compress_' + codec]['ratio'] = round(len(data) / max(sum(len(block) for block in blocks), 1), 3)
+        start_time = perf_counter()
+        for block in blocks:
+            decompress_block(block, codec)
+        stages['decompress_' + codec] = stage(perf_counter() - start_time, len(lines))
+    del data
+
+    lines = [legacy_line(tweet) for tweet in tweets]
+    start_time = perf_counter()
+    for line in lines:
+        unwrap_line_to_dictionary(line)
+    stages['unwrap_line_to_dictionary'] = stage(perf_counter() - start_time, len(lines))
+    del lines, tweets
+
+    if path.exists('analyses'):
+        shutil.rmtree('analyses')
+    brain = Extractor(TOPIC, 'en')
+    with redirect_stdout(StringIO()):
+        start_time = perf_counter()
+        brain.analyze(processes, backend)
+        stages['analyze'] = stage(perf_counter() - start_time, brain.new_tweets_count)
+        start_time = perf_counter()
+        brain.filter_words()
+        stages['filter_words'] = stage(perf_counter() - start_time)
+        start_time = perf_counter()
+        brain.save_the_analysis()
+        stages['save_the_analysis'] = stage(perf_counter() - start_time)
+    stages['analyze']['processes'] = processes
+    stages['analyze']['backend'] = backend
+
+    start_time = perf_counter()
+    Extractor(TOPIC, 'en').load_previous_analysis()
+    stages['load_previous_analysis'] = stage(perf_counter() - start_time)
+
+    start_time = perf_counter()
+    AnalysisState(TOPIC, 'en').export()
+    stages['export_json'] = stage(perf_counter() - start_time)
+
+    if plot:
+        try:
+            import matplotlib
+            matplotlib.use('Agg')  # no window is opened while timing
+            from PlotTwister import Plotter
+        except ImportError:
+            print('Could not import matplotlib, plotting is not timed.')
+        else:
+            plotter = Plotter(TOPIC, False)
+            plotter.load_summary(topic_summaries(TOPIC)['en'])
+            plotter.name = TOPIC + '_en'
+            start_time = perf_counter()
+            plotter.plot()
+            stages['plot'] = stage(perf_counter() - start_time)
+    return stages
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, directory=None, sample=100000, processes=1, plot=True, backend=PYTHON):
+    """
+    Times the pipeline on corpora of every given size.\n
+    :param sizes: numbers of tweets of the corpora
+    :param directory: directory keeping the corpora between runs, temporary one if None (removed afterwards)
+    :param sample: number of lines decoded by the codec stages
+    :param processes: number of processes analyzing the corpora
+    :param plot: whether to time plotting
+    :param backend: analysis backend of the Extractor, PYTHON or PANDAS
+    :return: results dictionary, ready to be saved as json
+    """
+    results = {'format': RESULTS_FORMAT, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'commit': current_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+               'sizes': {}}
+    blacklist = load_blacklist()
+    origin = getcwd()
+    work = directory if directory else mkdtemp(prefix='benchmark-')
+    try:
+        for size in sizes:
+            makedirs(path.join(work, str(size), 'assets'), exist_ok=True)
+            chdir(path.join(work, str(size)))
+            with open('assets/word_blacklist.txt', 'w') as file:
+                file.write('\n'.join(blacklist))
+            print('Benchmarking \x1b[1;36;40m{}\x1b[0m tweets...'.format(size))
+            results['sizes'][str(size)] = benchmark_size(size, sample, processes, plot, backend=backend)
+            chdir(origin)
+    finally:
+        chdir(origin)
+        if not directory:
+            shutil.rmtree(work)
+    return results
+
+
+def current_commit():
+    """
+    Gives the commit the benchmarked code comes from.\n
+    :return: commit hash or None if it is not known
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=path.dirname(path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_results(results, previous=None):
+    """
+    Prints times of every stage, compared to previous results if passed.\n
+    :param results: results dictionary
+    :param previous: results dictionary of an older version
+    """
+    for size, stages in results['sizes'].items():
+        print('\x1b[1;34;40m{} tweets\x1b[0m'.format(size))
+        for name, result in stages.items():
+            line = '  {:<28}{:>12} s'.format(name, round(result['seconds'], 3))
+            if 'per_tweet_us' in result:
+                line += '{:>12} us/tweet'.format(result['per_tweet_us'])
+            old = previous['sizes'].get(size, {}).get(name) if previous else None
+            if old and old['seconds'] and name != 'generate':
+                ratio = result['seconds'] / old['seconds']
+                if ratio > 1.1:
+                    line += '   \x1b[1;31;40m{}x\x1b[0m'.format(round(ratio, 2))
+                elif ratio < .9:
+                    line += '   \x1b[1;32;40m{}x\x1b[0m'.format(round(ratio, 2))
+                else:
+                    line += '   {}x'.format(round(ratio, 2))
+            print(line)
+
+
+def parse_size(text):
+    """
+    Reads a corpus size written as a number with optional k or m suffix.\n
+    :param text: i.e. 100k, 1m, 2500
+    :return: number of tweets
+    """
+    text = text.lower()
+    if text[-1] in 'km':
+        return int(float(text[:-1]) * (1000 if text[-1] == 'k' else 1000000))
+    return int(text)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and (sys.argv[1] == '-h' or sys.argv[1] == '--help'):
+        print('usage: python3 Benchmark.py [-h] [-s 100k,1m,10m] [-p 4] [-b pandas] [-d dir] [-o file] [-n]\n'
+              '       python3 Benchmark.py -c old.json new.json\n'
+              '\n'
+              'times decoding, analysis, filtering, saving, loading and plotting on generated corpora\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -s, --sizes\t\t\t comma separated numbers of tweets, default 100k,1m,10m\n'
+              '  -p, --processes\t\t number of processes analyzing the corpora\n'
+              '  -b, --backend\t\t\t analysis backend, python (default) or pandas\n'
+              '  -d, --directory\t\t keeps generated corpora in a directory, so later runs reuse them\n'
+              '  -o, --output\t\t\t results file, default benchmarks/<date>.json\n'
+              '  -n, --no-plot\t\t\t skips plotting\n'
+              '  -c, --compare\t\t\t compares two results files\n')
+        exit()
+
+    if len(sys.argv) > 1 and (sys.argv[1] == '-c' or sys.argv[1] == '--compare'):
+        if len(sys.argv) < 4:
+            print('Pass two results files in argument.')
+            exit()
+        with open(sys.argv[2], 'r') as file:
+            old_results = json.load(file)
+        with open(sys.argv[3], 'r') as file:
+            new_results = json.load(file)
+        print_results(new_results, old_results)
+        exit()
+
+    options = {'sizes': ','.join(str(size) for size in DEFAULT_SIZES), 'processes': '1', 'backend': PYTHON,
+               'directory': None, 'output': None}
+    for option in list(options):
+        for flag in ['-' + option[0], '--' + option]:
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                if len(sys.argv) == index+1:
+                    print('Pass {} in argument.'.format(option))
+                    exit()
+                options[option] = sys.argv[index+1]
+                del sys.argv[index:index+2]
+    draw = not ('-n' in sys.argv or '--no-plot' in sys.argv)
+
+    results = run_benchmarks([parse_size(size) for size in options['sizes'].split(',')], options['directory'],
+                             processes=int(options['processes']), plot=draw, backend=options['backend'])
+    output = options['output']
+    if not output:
+        makedirs('benchmarks', exist_ok=True)
+        output = 'benchmarks/' + datetime.datetime.now().strftime('%Y%m%d_%H%M%S') + '.json'
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=3)
+    print_results(results)
+    print('Saved as \x1b[1;34;40m{}\x1b[0m'.format(output))
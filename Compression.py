@@ -0,0 +1,444 @@
+import sys
+import zlib
+import struct
+
+from bisect import bisect_right
+from os import path, remove, replace
+from time import perf_counter
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+"""
+Transparent compression of stored files (topic segments and json analyses).
+A compressed file is a sequence of independently compressed blocks of whole lines, each one a complete gzip member
+(or zstd frame), so the file stays readable by gzip (or zstd) itself. Every block records its compressed and
+uncompressed size (in a gzip extra field, or a zstd skippable frame in front of it, as BGZF does), which lets readers
+find the block holding an uncompressed offset by reading a few bytes per block. Offsets kept by the indexes, shards
+and the search index are therefore the same for plain and compressed files.
+The codec of a file is given by its extension (.gz, .zst), open_stored and BlockWriter hide it from the callers.
+"""
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+NONE = 'none'  # plain files, as passed in arguments
+EXTENSIONS = {GZIP: '.gz', ZSTD: '.zst'}
+LEVELS = {GZIP: 6, ZSTD: 3}  # default compression levels
+BLOCK_SIZE = 1024 * 1024  # uncompressed bytes of lines collected into a block
+
+# gzip member header with a single extra subfield 'TP' holding block size and data size (RFC 1952)
+GZIP_HEADER = struct.Struct('<BBBBIBBH2sHII')
+GZIP_TRAILER = struct.Struct('<II')
+# zstd skippable frame holding block size and data size, followed by the compressed frame
+ZSTD_HEADER = struct.Struct('<IIII')
+ZSTD_MAGIC = 0x184D2A5E
+
+
+def available_codecs():
+    """
+    Lists codecs that can be used here.\n
+    :return: list of codec names, gzip first
+    """
+    return [GZIP, ZSTD] if zstandard is not None else [GZIP]
+
+
+def codec_of(file_path):
+    """
+    Gives codec of a file by its extension.\n
+    :param file_path: path to the file
+    :return: codec name, None for a plain file
+    """
+    for codec, extension in EXTENSIONS.items():
+        if file_path.endswith(extension):
+            return codec
+    return None
+
+
+def plain_path(file_path):
+    """
+    Strips the compression extension from a path.\n
+    :param file_path: path to a plain or compressed file
+    :return: path of the plain file
+    """
+    codec = codec_of(file_path)
+    return file_path[:-len(EXTENSIONS[codec])] if codec else file_path
+
+
+def stored_path(file_path, codec):
+    """
+    Gives path of a file stored with a codec.\n
+    :param file_path: path of the plain file
+    :param codec: codec name, None for the plain file
+    :return: path with the compression extension
+    """
+    return file_path + EXTENSIONS[codec] if codec else file_path
+
+
+def find_stored(file_path):
+    """
+    Finds a file whichever codec it was stored with.\n
+    :param file_path: path of the plain file
+    :return: path of the existing file, None if there is none
+    """
+    for codec in [None] + list(EXTENSIONS):
+        if path.exists(stored_path(file_path, codec)):
+            return stored_path(file_path, codec)
+    return None
+
+
+def compress_block(data, codec, level=None):
+    """
+    Compresses lines into a single block.\n
+    :param data: bytes of whole lines
+    :param codec: gzip or zstd
+    :param level: compression level, the codec's default if None
+    :return: bytes of the block
+    """
+    level = level if level is not None else LEVELS[codec]
+    if codec == GZIP:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        body = compressor.compress(data) + compressor.flush()
+        size = GZIP_HEADER.size + len(body) + GZIP_TRAILER.size
+        return (GZIP_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 255, 12, b'TP', 8, size, len(data)) + body +
+                GZIP_TRAILER.pack(zlib.crc32(data), len(data) & 0xffffffff))
+    if zstandard is None:
+        raise ValueError('zstd is not available, install the zstandard package')
+    frame = zstandard.ZstdCompressor(level=level).compress(data)
+    return ZSTD_HEADER.pack(ZSTD_MAGIC, 8, ZSTD_HEADER.size + len(frame), len(data)) + frame
+
+
+def decompress_block(block, codec):
+    """
+    Decompresses a block written by compress_block.\n
+    :param block: bytes of the block
+    :param codec: gzip or zstd
+    :return: bytes of the lines
+    """
+    if codec == GZIP:
+        return zlib.decompress(block, 16 + zlib.MAX_WBITS)  # checks the crc as well
+    if zstandard is None:
+        raise ValueError('zstd is not available, install the zstandard package')
+    return zstandard.ZstdDecompressor().decompress(block[ZSTD_HEADER.size:])
+
+
+def block_sizes(header, codec):
+    """
+    Reads sizes of a block from its header.\n
+    :param header: first bytes of the block
+    :param codec: gzip or zstd
+    :return: tuple of the block size and the size of its lines
+    :raise ValueError: if the header was not written by compress_block
+    """
+    if codec == GZIP:
+        fields = GZIP_HEADER.unpack(header[:GZIP_HEADER.size])
+        if fields[:2] != (0x1f, 0x8b) or fields[3] != 4 or fields[8] != b'TP':
+            raise ValueError('Not a block of a compressed topic file')
+        return fields[10], fields[11]
+    magic, _, size, data_size = ZSTD_HEADER.unpack(header[:ZSTD_HEADER.size])
+    if magic != ZSTD_MAGIC:
+        raise ValueError('Not a block of a compressed topic file')
+    return size, data_size
+
+
+class BlockWriter:
+    """
+    Writes lines to a file compressed block by block (or as they are, for plain files).\n
+    """
+
+    def __init__(self, file, codec, level=None):
+        """
+        Constructor of BlockWriter class.\n
+        :param file: file opened for binary writing
+        :param codec: gzip, zstd or None for a plain file
+        :param level: compression level, the codec's default if None
+        """
+        self.file = file
+        self.codec = codec
+        self.level = level
+        self.pending = []  # lines of the next block
+        self.pending_size = 0
+
+    def write(self, data):
+        """
+        Writes lines, blocks always end at a line boundary.\n
+        :param data: bytes of whole lines
+        """
+        if self.codec is None:
+            self.file.write(data)
+            return
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= BLOCK_SIZE:
+            self.flush()
+
+    def copy(self, source):
+        """
+        Copies a file stored with the same codec as it is, blocks of both files being complete.\n
+        :param source: file opened for binary reading
+        """
+        self.flush()
+        while True:
+            chunk = source.read(BLOCK_SIZE)
+            if not chunk:
+                break
+            self.file.write(chunk)
+
+    def flush(self):
+        """
+        Compresses pending lines into a block.
+        """
+        if self.pending:
+            self.file.write(compress_block(b''.join(self.pending), self.codec, self.level))
+            self.pending = []
+            self.pending_size = 0
+
+
+class BlockReader:
+    """
+    Binary lines of a compressed file, seekable by uncompressed offsets like a plain file.\n
+    """
+
+    def __init__(self, file_path, codec):
+        """
+        Constructor of BlockReader class.\n
+        :param file_path: path to the compressed file
+        :param codec: gzip or zstd
+        """
+        self.file = open(file_path, 'rb')
+        self.codec = codec
+        self.header_size = GZIP_HEADER.size if codec == GZIP else ZSTD_HEADER.size
+        self.blocks = None  # [uncompressed offset, stored offset] of every block, read at the first seek
+        self.buffer = b''  # decompressed lines not read yet (and the ones before them in the same block)
+        self.buffer_start = 0  # uncompressed offset of the buffer
+        self.cursor = 0  # read position in the buffer
+        self.next_block = 0  # stored offset of the block following the buffer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        self.file.close()
+
+    def load_block(self):
+        """
+        Appends the next block to the buffer.\n
+        :return: False if there are no more blocks
+        """
+        self.file.seek(self.next_block)
+        header = self.file.read(self.header_size)
+        if len(header) < self.header_size:
+            return False
+        size, _ = block_sizes(header, self.codec)
+        data = decompress_block(header + self.file.read(size - self.header_size), self.codec)
+        self.buffer_start += self.cursor
+        self.buffer = self.buffer[self.cursor:] + data
+        self.cursor = 0
+        self.next_block += size
+        return True
+
+    def readline(self):
+        """
+        Reads a line.\n
+        :return: bytes of the line with its end, empty at the end of the file
+        """
+        end = self.buffer.find(b'\n', self.cursor)
+        while end == -1:
+            if not self.load_block():
+                end = len(self.buffer) - 1
+                break
+            end = self.buffer.find(b'\n', self.cursor)
+        line = self.buffer[self.cursor:end + 1]
+        self.cursor = end + 1
+        return line
+
+    def read_blocks(self):
+        """
+        Lists blocks of the file by reading their headers.\n
+        :return: list of [uncompressed offset, stored offset] pairs
+        """
+        blocks = []
+        stored = 0
+        offset = 0
+        while True:
+            self.file.seek(stored)
+            header = self.file.read(self.header_size)
+            if len(header) < self.header_size:
+                return blocks
+            size, data_size = block_sizes(header, self.codec)
+            blocks.append([offset, stored])
+            stored += size
+            offset += data_size
+
+    def seek(self, offset):
+        """
+        Moves to an uncompressed offset, decompressing only the block holding it.\n
+        :param offset: uncompressed offset
+        """
+        if self.blocks is None:
+            self.blocks = self.read_blocks()
+        position = bisect_right(self.blocks, [offset, float('inf')]) - 1
+        self.buffer = b''
+        self.cursor = 0
+        self.buffer_start, self.next_block = self.blocks[position] if position >= 0 else (0, 0)
+        while offset - self.buffer_start > len(self.buffer) and self.load_block():
+            pass
+        self.cursor = min(offset - self.buffer_start, len(self.buffer))
+
+    def tell(self):
+        """
+        Gives the uncompressed read position.\n
+        :return: offset
+        """
+        return self.buffer_start + self.cursor
+
+
+def open_stored(file_path):
+    """
+    Opens a stored file for reading binary lines, whichever codec it was stored with.\n
+    :param file_path: path to the file, its extension telling the codec
+    :return: file object supporting iteration, readline, seek and tell (by uncompressed offsets)
+    """
+    codec = codec_of(file_path)
+    return BlockReader(file_path, codec) if codec else open(file_path, 'rb')
+
+
+def read_stored(file_path):
+    """
+    Reads a whole stored file.\n
+    :param file_path: path to the file, its extension telling the codec
+    :return: uncompressed bytes
+    """
+    with open_stored(file_path) as file:
+        return b''.join(file)
+
+
+def write_stored(file_path, data, codec=None):
+    """
+    Writes a whole file with a codec at once (through a temporary file), removing the file stored with other codecs.\n
+    :param file_path: path of the plain file
+    :param data: bytes to write
+    :param codec: gzip, zstd or None for a plain file
+    :return: path of the written file
+    """
+    with open(stored_path(file_path, codec) + '.tmp', 'wb') as file:
+        writer = BlockWriter(file, codec)
+        writer.write(data)
+        writer.flush()
+    replace(stored_path(file_path, codec) + '.tmp', stored_path(file_path, codec))
+    for other in [None] + list(EXTENSIONS):
+        if other != codec and path.exists(stored_path(file_path, other)):
+            remove(stored_path(file_path, other))
+    return stored_path(file_path, codec)
+
+
+def benchmark_codecs(lines, levels=None):
+    """
+    Measures compression ratio and throughput of codecs and levels on sample lines.\n
+    :param lines: list of binary lines
+    :param levels: dictionary codec -> list of levels, a few typical ones of every available codec by default
+    :return: list of dictionaries describing every codec and level
+    """
+    levels = levels if levels else {codec: {GZIP: [1, 6, 9], ZSTD: [1, 3, 9, 19]}[codec]
+                                    for codec in available_codecs()}
+    data = b''.join(lines)
+    chunks = [data[start:start + BLOCK_SIZE] for start in range(0, len(data), BLOCK_SIZE)]
+    results = []
+    for codec, codec_levels in levels.items():
+        for level in codec_levels:
+            start_time = perf_counter()
+            blocks = [compress_block(chunk, codec, level) for chunk in chunks]
+            compression = perf_counter() - start_time
+            start_time = perf_counter()
+            for block in blocks:
+                decompress_block(block, codec)
+            decompression = perf_counter() - start_time
+            size = sum(len(block) for block in blocks)
+            results.append({'codec': codec, 'level': level, 'ratio': round(len(data) / max(size, 1), 3),
+                            'compress_mb_s': round(len(data) / 1e6 / max(compression, 1e-9), 1),
+                            'decompress_mb_s': round(len(data) / 1e6 / max(decompression, 1e-9), 1)})
+    return results
+
+
+def benchmark_topic(topic, sample=64 * 1024 * 1024):
+    """
+    Prints compression ratio and throughput of every codec on stored tweets of a topic.\n
+    :param topic: topic whose tweets are compressed
+    :param sample: maximum number of bytes of the sample
+    """
+    from TopicStorage import TopicStorage
+
+    lines = []
+    size = 0
+    for line in TopicStorage(topic).load().read():
+        lines.append(line.encode('utf-8'))
+        size += len(lines[-1])
+        if size >= sample:
+            break
+    if not lines:
+        print('Could not find tweets of {}, proceeding.'.format(topic))
+        return
+    print('Compressing \x1b[1;36;40m{}\x1b[0m MB of \x1b[1;34;40m{}\x1b[0m tweets.'.format(round(size / 1e6, 1), topic))
+    for result in benchmark_codecs(lines):
+        print('{codec:>5} level {level:>2}: ratio \x1b[1;36;40m{ratio:>6}\x1b[0m, compression {compress_mb_s:>7} MB/s, '
+              'decompression {decompress_mb_s:>7} MB/s'.format(**result))
+
+
+def migrate_topics(codec, topic_list):
+    """
+    Stores tweets and json analyses of passed topics (or of every stored topic) with a codec,
+    later fetches and exports of the topics keep using it.\n
+    :param codec: gzip, zstd or None to decompress
+    :param topic_list: list of topics to migrate
+    """
+    from TopicStorage import TopicStorage, list_topics
+    from AnalysisState import analyzed_languages, state_path
+
+    for topic in topic_list if topic_list else list_topics():
+        start_time = perf_counter()
+        storage = TopicStorage(topic).load()
+        if not storage.segments:
+            print('Could not find tweets of {}, proceeding.'.format(topic))
+            continue
+        before = sum(path.getsize(storage.segment_path(segment)) for segment in storage.segments)
+        storage.set_codec(codec)
+        after = sum(path.getsize(storage.segment_path(segment)) for segment in storage.segments)
+        for language in analyzed_languages(topic):  # not a pattern, it would match topics sharing the prefix
+            analysis = find_stored(state_path(topic, language, '.json'))
+            if analysis is not None and codec_of(analysis) != codec:
+                write_stored(plain_path(analysis), read_stored(analysis), codec)
+        print('Stored \x1b[1;34;40m{}\x1b[0m as {}: {} MB -> {} MB in {} s.'.format(
+            topic, codec if codec else 'plain text', round(before / 1e6, 1), round(after / 1e6, 1),
+            round(perf_counter() - start_time, 3)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and (sys.argv[1] == '-m' or sys.argv[1] == '--migrate') and \
+            sys.argv[2] in available_codecs() + [NONE]:
+        migrate_topics(sys.argv[2] if sys.argv[2] != NONE else None, [arg.lower() for arg in sys.argv[3:]])
+    elif len(sys.argv) > 2 and (sys.argv[1] == '-b' or sys.argv[1] == '--benchmark'):
+        for topic in sys.argv[2:]:
+            benchmark_topic(topic.lower())
+    else:
+        print('usage: python3 Compression.py [-h] [-m codec [a b c...]] [-b a [b c...]]\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -m, --migrate codec [a,b...]\t stores tweets and json analyses of topics a, b, c... with a codec\n'
+              '  -b, --benchmark a [b,c...]\t compares ratio and throughput of codecs on tweets of topics a, b, c...\n'
+              '\n'
+              'Available codecs: {}, none stores files as plain text.\n'
+              'If no topics passed to --migrate, every stored topic is migrated.\n'
+              'Migrated topics keep their codec, new segments are compressed when a fetch seals them.\n'
+              .format(', '.join(available_codecs())))
@@ -1,200 +1,593 @@
 import sys
-import json
 
 from time import time
-from os import path, mkdir
-from TweetPeeker import unwrap_line_to_dictionary, print_topics
+from os import path
+from multiprocessing import Pool
+from TweetCodec import project_line
+from Tokenizer import Tokenizer, load_stopwords, add_stopwords, stopwords_path, stemmer_for
+from TopicStorage import TopicStorage
+from Compression import open_stored
+from AnalysisState import AnalysisState, WORDS, HASHTAGS, LANGUAGES, analyzed_languages, state_path, update_summaries
+from HeavyHitters import SpaceSaving, capacity_for_error
+from UserTable import UserTable, HyperLogLog, DEFAULT_PRECISION, is_bot
+from TimeSeries import hour_of
+from FrameAnalysis import scan_frames
+from TweetPeeker import print_topics
+from Metrics import METRICS, take_options, instrumented
 
 """
 Concucts a simple semantic analysis on gathered tweets meeting language criteria (default is english),
 checking most popular words appearing along with a keyword (topic) and hashtags.
 Stores statistics of posting dates, languages of the posts and most active users regardint each topic.
-The output is saved in json format.
+The output is saved in an SQLite analysis state (see AnalysisState.py), optionally exported in json format.
 Full list of options available with --help variable.
 """
 
+PYTHON = 'python'  # backend counting tweet by tweet, see scan()
+PANDAS = 'pandas'  # backend aggregating batches of tweets, see FrameAnalysis.py
+
 class Extractor:
     """
     Extractor class that conducts analysis on gathered tweets and saves the output into a json file.\n
     """
 
-    def __init__(self, topic, language):
+    def __init__(self, topic, language, tokenizer=None):
         """
         Constructor of Extractor class.\n
         :param topic: the topic to anayze
         :param language: language of the tweets to be analyzed
+        :param tokenizer: object splitting texts into terms (see Tokenizer.py), compiled Tokenizer of the language
+                          by default
         """
         self.topic = topic  # tweet keyword
         self.language = language  # analysis language
-        self.dates = {}  # dates distribution
-        self.followers = 0  # cumulative number of users following people that post about this topic
-        self.languages = {}  # language distribution for this keyword
-        self.hashtags = {}  # hashtags found in the tweets
-        self.words = {}  # content analysis, words contained in tweets
-        self.users = {}  # list of users which previously posted on this topic
+        self.tokenizer = tokenizer if tokenizer else Tokenizer(topic, language=language)  # turns texts into terms
+        self.dates = {}  # dates distribution of the new tweets
+        self.hours = {}  # (language, hour) -> number of the new tweets, added to the hourly series on save
+        self.followers = 0  # cumulative number of users following people that post about this topic (loaded total)
+        self.languages = {}  # language distribution of the new tweets for this keyword
+        self.hashtags = {}  # hashtags found in the new tweets
+        self.words = {}  # content analysis, words contained in the new tweets
+        self.users = UserTable()  # users who posted the new tweets, with followers at their first post (summed on save)
+        self.filtered_words = []  # blacklisted words, removed from the stored words on save
+        self.previous_languages = set()  # languages of previously analyzed tweets
         self.last_id = None  # limiter for continuous analyses (after getting new tweets only analyze the new ones)
-        self.new_last_id = None  # this is going to be saved in output file
+        self.new_last_id = None  # this is going to be saved in the analysis state
 
         self.tweets_count = 0  # how many tweets have been analyzed
         self.new_tweets_count = 0
         self.analysis_time = None  # start time of the analysis
         self.previous_10k_time = None
 
+        self.capacity = None  # terms monitored by words and hashtags summaries in approximate mode, None counts exactly
+        self.precision = None  # precision of the distinct users estimate, None counts posts of every user
+        self.retention = None  # hours kept in the hourly series (see TimeSeries.py), None keeps the stored window
+        self.stem = False  # whether words are counted by their stems (see Tokenizer.py)
+        self.members = None  # extractors of other languages sharing this one's scan, they only count content
+        self.skipped_languages = None  # languages never added as members on the fly, None disables adding them
+
     def load_previous_analysis(self):
         """
-        Loads content of previously conducted analysis for this specific topic and language.
+        Loads totals of previously conducted analysis for this specific topic and language (see AnalysisState.py).\n
+        Counters are not loaded, they only hold the new tweets and are added to the stored ones on save.\n
+        :return: True if there was a previous analysis, False otherwise
         """
-        try:
-            with open('analyses/' + self.topic + '_' + self.language + '.json', 'r') as file:
-                content = json.load(file)
-            self.last_id = content['last_id']
-            self.tweets_count = content['tweets_count']
-            self.followers = content['followers']
-            self.languages = content['languages']
-            self.dates = content['dates']
-            self.hashtags = content['hashtags']
-            self.words = content['words']
-            self.users = content['users']
-        except FileNotFoundError:
-            pass
+        state = AnalysisState(self.topic, self.language)
+        totals = state.load()
+        if totals is None:
+            return False
+        self.last_id = totals['last_id']
+        self.tweets_count = totals['tweets_count']
+        self.followers = totals['followers']
+        self.previous_languages = set(state.counters(LANGUAGES))
+        if self.capacity is None and totals['sketch_capacity']:
+            self.set_approximate(totals['sketch_capacity'])  # exact counts can not be recovered from a summary
+        if self.capacity is not None:
+            self.load_sketches(state)
+        if self.precision is None and totals['users_precision']:
+            self.set_distinct_users(totals['users_precision'])
+        if not self.stem and totals['stemmed']:
+            self.set_stemming()  # stems and whole words would be counted apart
+        if self.precision is not None:
+            state.load_users(self.users)
+        state.close()
+        return True
+
+    def set_approximate(self, capacity):
+        """
+        Switches words and hashtags to bounded-memory summaries of the most frequent terms (see HeavyHitters.py).\n
+        Blacklisted words are not counted at all, removing them from a summary afterwards would break its error bound.\n
+        :param capacity: maximum number of monitored words (and hashtags)
+        """
+        self.capacity = capacity
+        self.words = SpaceSaving(capacity)
+        self.hashtags = SpaceSaving(capacity)
+        self.words.ignored = frozenset(read_blacklist(self.language))
+
+    def load_sketches(self, state):
+        """
+        Loads stored words and hashtags into the summaries of approximate mode, exact counts are turned into summaries
+        of the most frequent ones.\n
+        :param state: AnalysisState of this extractor's analysis
+        """
+        state.load_sketch(WORDS, self.words)
+        state.load_sketch(HASHTAGS, self.hashtags)
+
+    def set_distinct_users(self, precision=DEFAULT_PRECISION):
+        """
+        Switches users to an estimate of their distinct number (see UserTable.py), for topics with too many authors
+        to count posts of each one. Followers are not summed any more, telling new users apart needs all of them.\n
+        :param precision: number of hash bits choosing the register of the estimate
+        """
+        self.precision = precision
+        self.users = HyperLogLog(precision)
+
+    def set_stemming(self):
+        """
+        Counts words by their stems (see Tokenizer.py), so different forms of a word add up.\n
+        """
+        self.stem = True
+        self.tokenizer = Tokenizer(self.topic, language=self.language, stem=True)
+        if self.language is not None and self.tokenizer.stemmer is None:
+            print('\x1b[1;31;40mCan not stem words of {} language, install nltk.\x1b[0m'.format(self.language))
 
-    def save_the_analysis(self):
+    def save_the_analysis(self, export=False):
         """
-        Sorting and saving the analysis output in a json file.
+        Adds counts of the new tweets to the analysis state.\n
+        :param export: whether to export the whole analysis as human readable json afterwards
         """
-        if not self.new_tweets_count:
+        if not self.new_tweets_count or self.language is None:
             return
-        if not path.exists('analyses'):
-            mkdir('analyses')
-
-        # sorting dates, languages and words    k-key, v-value
-        self.languages = {k: v for k, v in sorted(self.languages.items(), key=lambda lang: lang[1], reverse=True)}
-        self.dates = {k: v for k, v in sorted(self.dates.items(), key=lambda date: date[1], reverse=True)}
-        self.words = {k: v for k, v in sorted(self.words.items(), key=lambda word: word[0], reverse=False)}
-        self.words = {k: v for k, v in sorted(self.words.items(), key=lambda word: word[1], reverse=True)}
-        self.hashtags = {k: v for k, v in sorted(self.hashtags.items(), key=lambda tag: tag[0], reverse=False)}
-        self.hashtags = {k: v for k, v in sorted(self.hashtags.items(), key=lambda tag: tag[1], reverse=True)}
-        self.users = {k: v for k, v in sorted(self.users.items(), key=lambda user: user[0], reverse=False)}
-        self.users = {k: v for k, v in sorted(self.users.items(), key=lambda user: user[1], reverse=True)}
-
-        trending = {}
-        for k in list(self.hashtags)[:5]: trending[k] = self.hashtags[k]
-        for k in list(self.words)[:10]: trending[k] = self.words[k]
-
-        collection = {'last_id': self.new_last_id, 'tweets_count': self.tweets_count + self.new_tweets_count,
-                      'tweets_applying_for_analysis': self.languages.get(self.language), 'followers': self.followers,
-                      'languages': self.languages, 'dates': self.dates, 'trending': trending, 'hashtags': self.hashtags,
-                      'words': self.words, 'users': self.users}
-        with open('analyses/' + self.topic + '_' + self.language + '.json', 'w') as file:
-            json.dump(collection, file, indent=3)
-        print('Saved as \x1b[1;34;40m' + self.topic + '_' + self.language + '.json\x1b[0m\n')
-
-    def analyze(self):
+        state = AnalysisState(self.topic, self.language)
+        with METRICS.timer('analysis.save'):
+            state.save(self)
+        print('Saved as \x1b[1;34;40m' + self.topic + '_' + self.language + '.db\x1b[0m\n')
+        if export:
+            print('Exported as \x1b[1;34;40m' + state.export() + '\x1b[0m\n')
+        state.close()
+
+    def adopt(self, leader):
+        """
+        Starts the analysis state of a language seen for the first time from the state of its group leader,
+        so statistics not depending on the language include the previously analyzed tweets.\n
+        :param leader: leader of the group this extractor was added to while scanning
+        """
+        if leader.language is None or path.exists(state_path(self.topic, self.language)) or \
+                not path.exists(state_path(self.topic, leader.language)):
+            return
+        AnalysisState(self.topic, self.language).adopt(AnalysisState(self.topic, leader.language))
+        self.tweets_count = leader.tweets_count
+        self.followers = leader.followers
+
+    def analyze(self, processes=1, backend=PYTHON):
         """
         Analyzes the tweets for the topic.\n
         Counts followers, tweets themselves, checks tweets dates, and language they were written in.\n
         The biggest part is content analysis, that extracts and counts hashtags
-        and counts all the distinct words that show up in analyzed tweets.
+        and counts all the distinct words that show up in analyzed tweets.\n
+        :param processes: number of processes analyzing the file, if more than 1 the file is split into shards
+        :param backend: PYTHON to count tweet by tweet, PANDAS to aggregate batches of tweets (see FrameAnalysis.py)
         """
-        try:
-            with open('outputs/' + self.topic + '.txt', 'r') as file:
-                self.new_last_id = unwrap_line_to_dictionary(file.readline())['id']
-                file.seek(0)
+        analyze_file([self], processes, backend)
 
-                start_time = time()
-                for line in file:
-                    if self.new_tweets_count % 10000 == 0:
-                        if self.previous_10k_time:
-                            print('\x1b[35m' + str(self.new_tweets_count//1000) + 'k time:',
-                                  round((time()-self.previous_10k_time) * 1000, 3), 'ms.\x1b[0m')
-                            self.previous_10k_time = time()
-                        else:
-                            self.previous_10k_time = time()
-
-                    try:
-                        line_content = unwrap_line_to_dictionary(line)
-                        if line_content['id'] == self.last_id:
-                            break
-
-                        compare_name = line_content['screen_name'].strip('1234567890').lower()
-                        if not ('iembot' in compare_name or compare_name[:3] == 'bot' or compare_name[-3:] == 'bot'):
-
-                            # counting topic range
-                            if line_content['screen_name'] not in self.users:
-                                self.followers += int(line_content['user_followers'])
-                                self.users[line_content['screen_name']] = 1
-                            else:
-                                self.users[line_content['screen_name']] += 1
-
-
-                            # checking dates distribution
-                            date = line_content['date'].split()[0]
-                            if date in self.dates:
-                                self.dates[date] += 1
-                            else:
-                                self.dates[date] = 1
-
-                            # checking language dependency
-                            if line_content['language'] in self.languages:
-                                self.languages[line_content['language']] += 1
-                            else:
-                                self.languages[line_content['language']] = 1
-
-                            # analyzing content
-                            if line_content['language'] == self.language:
-                                words = line_content['full_text'].replace(',', '').replace('.', '').replace('!', '')\
-                                    .replace('?', '').replace('"', '').replace('\u2019', '\'').replace('\' ', ' ')\
-                                    .replace(';', ' ').replace('\u2018', ' ').replace('*', ' ').replace(': ', ' ')\
-                                    .replace(' (', ' ').replace(') ', ' ').replace(' -', ' ').replace(' i\'', ' I\'').split()
-                                for word in words:
-                                    if word.lower() not in self.topic and 'http' not in word:
-                                        if len(word) > 1:
-                                            if word[0] == '#':
-                                                if word.lower() in self.hashtags:
-                                                    self.hashtags[word.lower()] += 1
-                                                else:
-                                                    self.hashtags[word.lower()] = 1
-                                            elif len(word) > 2 or (len(word) == 2 and word == word.upper()):
-                                                if word[:-1] != word[:-1].upper():
-                                                    word = word.lower()
-                                                if word in self.words:
-                                                    self.words[word] += 1
-                                                else:
-                                                    self.words[word] = 1
-                            self.new_tweets_count += 1
-                    except (IndexError, KeyError):
-                        pass
-                self.analysis_time = time() - start_time
-                if self.new_tweets_count:
-                    print('Analyzed \x1b[1;36;40m{}\x1b[0m tweets about \x1b[1;34;40m{}\x1b[0m in {} seconds.'.
-                          format(self.new_tweets_count, self.topic, self.analysis_time))
-                    print('Average time per tweet {} ms.'.format(self.analysis_time*1000 / self.new_tweets_count))
+    def scan(self, lines, progress=True):
+        """
+        Counts tweets from passed lines until the last previously analyzed tweet is reached.\n
+        :param lines: iterable of lines from the topic file, newest tweets first
+        :param progress: whether to print time of every 10k analyzed tweets
+        :return: True if the last analyzed tweet was reached, False otherwise
+        """
+        return scan([self], lines, progress)[0]
+
+    def count_tweet(self, tweet):
+        """
+        Adds a single tweet to the statistics, tweets posted by bots are skipped.\n
+        Text of the tweet is only decoded if its language is analyzed.\n
+        :param tweet: TweetRecord of the tweet (see TweetCodec.py)
+        """
+        if not is_bot(tweet.screen_name):
+
+            # counting topic range
+            self.users.add(tweet.screen_name, tweet.user_followers)
+
+            # checking dates distribution
+            date = tweet.date.split()[0]
+            if date in self.dates:
+                self.dates[date] += 1
+            else:
+                self.dates[date] = 1
+            hour = hour_of(tweet.date)
+            if hour is not None:
+                hour = (tweet.language, hour)
+                self.hours[hour] = self.hours.get(hour, 0) + 1
+
+            # checking language dependency
+            if tweet.language in self.languages:
+                self.languages[tweet.language] += 1
+            else:
+                self.languages[tweet.language] = 1
+
+            # analyzing content
+            if tweet.language == self.language:
+                self.count_content(tweet.full_text)
+            elif self.members is not None:
+                member = self.member(tweet.language)
+                if member is not None:
+                    member.count_content(tweet.full_text)
+            self.new_tweets_count += 1
+
+    def count_content(self, text):
+        """
+        Counts words and hashtags of a tweet text.\n
+        :param text: full text of the tweet
+        """
+        if self.capacity is not None:
+            for term in self.tokenizer.terms(text):
+                if term[0] == '#':
+                    self.hashtags.add(term)
                 else:
-                    print('Found \x1b[1;36;40m0\x1b[0m new tweets about \x1b[1;34;40m' + self.topic + '\x1b[0m')
-        except FileNotFoundError:
-            print('Could not load tweets file.')
+                    self.words.add(term)
+            return
+        for term in self.tokenizer.terms(text):
+            if term[0] == '#':
+                if term in self.hashtags:
+                    self.hashtags[term] += 1
+                else:
+                    self.hashtags[term] = 1
+            elif term in self.words:
+                self.words[term] += 1
+            else:
+                self.words[term] = 1
+
+    def count_member_content(self, language, text):
+        """
+        Passes a tweet text to the member extractor of its language.\n
+        :param language: language of the tweet
+        :param text: full text of the tweet
+        """
+        member = self.member(language)
+        if member is not None:
+            member.count_content(text)
+
+    def member(self, language):
+        """
+        Gives the member extractor of a language.\n
+        Members of languages not seen in the previous analysis are added on the fly if enabled.\n
+        :param language: language of a tweet
+        :return: the member or None if the language is not analyzed
+        """
+        member = self.members.get(language)
+        if member is None:
+            if self.skipped_languages is None or language in self.skipped_languages:
+                return None
+            member = self.add_member(Extractor(self.topic, language))
+        return member
+
+    def add_member(self, member):
+        """
+        Adds extractor of another language to the group of this one, sharing the scan of the topic file.\n
+        Statistics that do not depend on the language are counted only here and copied to members by share(),
+        texts are split by the member's own tokenizer, as stopwords depend on the language.\n
+        :param member: extractor starting from the same last analyzed tweet
+        :return: the member
+        """
+        if self.members is None:
+            self.members = {}
+        if self.capacity is not None and member.capacity is None:
+            member.set_approximate(self.capacity)
+        if self.stem and not member.stem:
+            member.set_stemming()
+        member.retention = self.retention
+        member.dates, member.hours, member.languages, member.users = {}, {}, {}, None  # replaced by share()
+        self.members[member.language] = member
+        return member
+
+    def group(self):
+        """
+        Lists this extractor and its members.\n
+        :return: list of extractors
+        """
+        return [self] + list(self.members.values()) if self.members else [self]
+
+    def share(self):
+        """
+        Copies statistics not depending on the language to member extractors.
+        """
+        for member in self.group()[1:]:
+            member.new_last_id = self.new_last_id
+            member.new_tweets_count = self.new_tweets_count
+            member.languages = self.languages
+            member.dates = self.dates
+            member.hours = self.hours
+            member.users = self.users
+            member.analysis_time = self.analysis_time
+
+    def shard(self):
+        """
+        Creates an empty extractor configured like this one, used to analyze a shard of the topic file.\n
+        :return: Extractor with the same language, members and last analyzed tweet
+        """
+        partial = Extractor(self.topic, self.language, self.tokenizer)
+        partial.last_id = self.last_id
+        partial.skipped_languages = self.skipped_languages
+        if self.capacity is not None:
+            partial.set_approximate(self.capacity)
+        if self.precision is not None:
+            partial.set_distinct_users(self.precision)
+        partial.stem = self.stem
+        if self.members is not None:
+            partial.members = {}
+            for language, member in self.members.items():
+                partial_member = Extractor(self.topic, language, member.tokenizer)
+                partial_member.stem = member.stem
+                if member.capacity is not None:
+                    partial_member.set_approximate(member.capacity)  # merged into the member's summaries
+                partial.add_member(partial_member)
+        return partial
+
+    def merge(self, partial):
+        """
+        Adds statistics gathered by a shard to this extractor and its members.\n
+        :param partial: Extractor which analyzed a shard of tweets following the ones already counted here
+        """
+        if partial.users is not None:
+            self.users.merge(partial.users)
+        for counter, partial_counter in ((self.dates, partial.dates), (self.hours, partial.hours),
+                                         (self.languages, partial.languages)):
+            for k, v in partial_counter.items():
+                counter[k] = counter.get(k, 0) + v
+        self.merge_content(partial)
+        self.new_tweets_count += partial.new_tweets_count
+
+        if partial.members:
+            for language, partial_member in partial.members.items():
+                member = self.members.get(language) if self.members else None
+                if member is None:
+                    member = Extractor(self.topic, language)
+                    if partial_member.stem:
+                        member.set_stemming()
+                    member = self.add_member(member)
+                member.merge_content(partial_member)
+
+    def prepend(self, partial):
+        """
+        Adds statistics gathered by an extractor which counted tweets newer than the ones counted here (fetched
+        later, see Watcher.py), users keep followers from their newest posts as if the tweets were scanned.\n
+        :param partial: Extractor created by shard() of this one
+        """
+        partial.users.merge(self.users)
+        self.users = partial.users
+        partial.users = None
+        self.merge(partial)
+
+    def merge_content(self, partial):
+        """
+        Adds words and hashtags counted by another extractor of the same language.\n
+        :param partial: extractor to take the counts from
+        """
+        if self.capacity is not None:
+            self.hashtags.merge(partial.hashtags)
+            self.words.merge(partial.words)
+            return
+        for counter, partial_counter in ((self.hashtags, partial.hashtags), (self.words, partial.words)):
+            for k, v in partial_counter.items():
+                counter[k] = counter.get(k, 0) + v
 
     def filter_words(self):
         """
-        Filters the output off of words that are to generic. The word list is stored in assets/word_blacklist.txt\n
+        Filters the output off of words that are to generic. The word list is stored in assets/word_blacklist.txt
+        and assets/word_blacklist_<language>.txt\n
+        The tokenizer already drops them, the words are removed from the stored analysis on save,
+        in case they were added to the list later.\n
         """
+        blacklist = read_blacklist(self.language)
+        for word in blacklist:
+            self.words.pop(word, None)
+        self.filtered_words = blacklist
+
+
+def read_blacklist(language='en'):
+    """
+    Reads words filtered off the analyses of a language, stored in assets/word_blacklist.txt (every language)
+    and assets/word_blacklist_<language>.txt\n
+    :param language: language of the analysis, None for the words blacklisted in every language
+    :return: sorted list of words, empty if there is no blacklist
+    """
+    return sorted(load_stopwords(language))
+
+
+def scan(extractors, lines, progress=True):
+    """
+    Counts tweets from passed lines in every extractor until the last tweet it previously analyzed is reached.\n
+    :param extractors: extractors of the same topic file (usually group leaders)
+    :param lines: iterable of lines from the topic file, newest tweets first
+    :param progress: whether to print time of every 10k tweets analyzed by the first extractor
+    :return: list of flags telling for every extractor whether its last analyzed tweet was reached
+    """
+    first = extractors[0]
+    active = list(extractors)
+    reached = []
+    for line in lines:
+        if progress and first.new_tweets_count % 10000 == 0:
+            if first.previous_10k_time:
+                print('\x1b[35m' + str(first.new_tweets_count//1000) + 'k time:',
+                      round((time()-first.previous_10k_time) * 1000, 3), 'ms.\x1b[0m')
+                first.previous_10k_time = time()
+            else:
+                first.previous_10k_time = time()
+
         try:
-            with open('assets/word_blacklist.txt', 'r') as file:
-                blacklist = file.read().split()
-            for word in blacklist:
-                self.words.pop(word, None)
-        except FileNotFoundError:
-            pass
+            tweet = project_line(line)
+            tweet_id = tweet.id
+        except (ValueError, IndexError, KeyError):
+            continue
+        for extractor in active:
+            if tweet_id == extractor.last_id:
+                reached.append(extractor)
+            else:
+                try:
+                    extractor.count_tweet(tweet)
+                except (ValueError, IndexError, KeyError):
+                    pass
+        if len(active) + len(reached) > len(extractors):
+            active = [extractor for extractor in active if extractor not in reached]
+            if not active:
+                break
+    return [extractor in reached for extractor in extractors]
+
+
+BACKENDS = {PYTHON: scan, PANDAS: scan_frames}
+
+
+def analyze_file(extractors, processes=1, backend=PYTHON):
+    """
+    Analyzes stored tweets of the topic with every passed extractor in a single pass over its segments.\n
+    :param extractors: extractors of the same topic, each one with its own last analyzed tweet
+    :param processes: number of processes analyzing the tweets, if more than 1 the segments are split into shards
+    :param backend: PYTHON or PANDAS, the way tweets are counted
+    """
+    topic = extractors[0].topic
+    storage = TopicStorage(topic).load()
+    if not storage.lines():
+        print('Could not load tweets file.')
+        return
+    for extractor in extractors:
+        extractor.new_last_id = storage.newest_id()
+
+    start_time = time()
+    if processes > 1:
+        analyze_in_parallel(extractors, processes, storage.ranges([extractor.last_id for extractor in extractors]),
+                            backend)
+    else:
+        BACKENDS[backend](extractors, storage.read())
+    analysis_time = time() - start_time
+    record_scan(extractors, analysis_time)
+
+    for extractor in extractors:
+        extractor.analysis_time = analysis_time
+        extractor.share()
+        if extractor.new_tweets_count:
+            print('Analyzed \x1b[1;36;40m{}\x1b[0m tweets about \x1b[1;34;40m{}\x1b[0m in {} seconds.'.
+                  format(extractor.new_tweets_count, topic, analysis_time))
+            print('Average time per tweet {} ms.'.format(analysis_time*1000 / extractor.new_tweets_count))
+        else:
+            print('Found \x1b[1;36;40m0\x1b[0m new tweets about \x1b[1;34;40m' + topic + '\x1b[0m')
+
 
+def record_scan(extractors, analysis_time):
+    """
+    Records metrics of a scan of the topic file: its time, counted tweets and tokenized texts.\n
+    :param extractors: group leaders which scanned the file
+    :param analysis_time: duration of the scan in seconds
+    """
+    tweets = sum(extractor.new_tweets_count for extractor in extractors)
+    texts = sum(extractor.languages.get(brain.language, 0) for extractor in extractors for brain in extractor.group())
+    METRICS.record('analyze.scan', analysis_time)
+    METRICS.count('analyze.tweets', tweets)
+    METRICS.count('analyze.texts_tokenized', texts)
+    if analysis_time:
+        METRICS.gauge('analyze.tweets_per_second', round(tweets / analysis_time, 1))
+        METRICS.gauge('analyze.texts_per_second', round(texts / analysis_time, 1))
 
-def analyze_topics(topic_list, language):
+
+def analyze_in_parallel(extractors, processes, ranges, backend=PYTHON):
+    """
+    Splits the segments into shards aligned to lines and analyzes them in separate processes.\n
+    Partial results are merged in storage order, for every extractor the shards following the one that reached
+    its last previously analyzed tweet are dropped, so the outcome is the same as of a serial run.\n
+    :param extractors: extractors of the same topic
+    :param processes: number of worker processes
+    :param ranges: byte ranges of segment files to analyze, from the newest tweets to the oldest
+    :param backend: PYTHON or PANDAS, the way tweets are counted
+    """
+    shards = [([extractor.shard() for extractor in extractors], pieces, backend)
+              for pieces in split_into_shards(ranges, processes)]
+    done = [False] * len(extractors)
+    with Pool(processes) as pool:
+        for reached, partials in pool.imap(analyze_shard, shards):
+            for number, extractor in enumerate(extractors):
+                if not done[number]:
+                    extractor.merge(partials[number])
+                    done[number] = reached[number]
+            if all(done):
+                break
+
+
+def split_into_shards(ranges, shards):
+    """
+    Splits byte ranges of files into shards of similar size, every piece of a shard starts at the beginning of a line.\n
+    :param ranges: list of (file path, start, end) tuples, each one starting and ending at a line boundary
+    :param shards: number of shards to create
+    :return: list of shards, each one a list of (file path, start, end) tuples
+    """
+    target = max(1, -(-sum(end - start for _, start, end in ranges) // shards))
+    result = [[]]
+    room = target
+    for file_path, start, end in ranges:
+        with open_stored(file_path) as file:
+            while start < end:
+                if room <= 0:
+                    result.append([])
+                    room = target
+                if end - start <= room:
+                    cut = end
+                else:
+                    file.seek(start + room)
+                    file.readline()
+                    cut = min(file.tell(), end)
+                result[-1].append((file_path, start, cut))
+                room -= cut - start
+                start = cut
+    return [shard for shard in result if shard]
+
+
+def read_shard(pieces):
+    """
+    Reads lines of files from byte ranges.\n
+    :param pieces: list of (file path, start, end) tuples
+    :return: generator of decoded lines
+    """
+    for file_path, start, end in pieces:
+        with open_stored(file_path) as file:
+            file.seek(start)
+            position = start
+            for line in file:
+                if position >= end:
+                    break
+                position += len(line)
+                yield line.decode('utf-8')
+
+
+def analyze_shard(shard):
+    """
+    Analyzes a shard of the topic segments, executed in a worker process.\n
+    :param shard: tuple of empty shard extractors, byte ranges to read and the backend
+    :return: tuple of flags telling whether the last analyzed tweets were reached and the shard extractors
+    """
+    partials, pieces, backend = shard
+    reached = BACKENDS[backend](partials, read_shard(pieces), progress=False)
+    for partial in partials:
+        for extractor in partial.group():
+            extractor.tokenizer = None  # memoized words are not needed in the parent process
+    return reached, partials
+
+
+def analyze_topics(topic_list, language, processes=1, export=False, capacity=None, precision=None, retention=None,
+                   backend=PYTHON, stem=False):
     """
     Provided list of topics and a language to conduct the analyze in,
     calls analyze_topic() function for every topic.\n
     If topic list is empty, it will load from the topics.txt file.\n
     If None passed as language, it will analyze in default which is english.\n
     :param topic_list: list of topics to perform analyze
-    :param language: language of the posts to be content-analyzed
+    :param language: language of the posts to be content-analyzed, list of languages or 'all'
+    :param processes: number of processes analyzing every topic file
+    :param export: whether to export analyses as human readable json
+    :param capacity: terms monitored in approximate mode, None to count words and hashtags exactly
+    :param precision: precision of the distinct users estimate, None to count posts of every user
+    :param retention: hours kept in the hourly series, None to keep the stored window
+    :param backend: PYTHON or PANDAS, the way tweets are counted
+    :param stem: whether to count words by their stems
     """
     if not topic_list:
         topic_list = []
@@ -208,28 +601,193 @@ def analyze_topics(topic_list, language):
 
     for topic in topic_list:
         if language:
-            analyze_topic(topic, language)
+            analyze_topic(topic, language, processes, export, capacity, precision, retention, backend, stem)
         else:
-            analyze_topic(topic)
+            analyze_topic(topic, processes=processes, export=export, capacity=capacity, precision=precision,
+                          retention=retention, backend=backend, stem=stem)
 
 
-def analyze_topic(topic, language='en'):
+def analyze_topic(topic, language='en', processes=1, export=False, capacity=None, precision=None, retention=None,
+                  backend=PYTHON, stem=False):
     """
     Performs analysis for specified topic in specified language or in english as default.\n
+    Several languages are analyzed in a single pass over the topic file.\n
     :param topic: topic of the analysis
-    :param language: language of the analysis
+    :param language: language of the analysis, list of languages or 'all'
+    :param processes: number of processes analyzing the topic file
+    :param export: whether to export analyses as human readable json
+    :param capacity: terms monitored in approximate mode, None to count words and hashtags exactly
+    :param precision: precision of the distinct users estimate, None to count posts of every user
+    :param retention: hours kept in the hourly series, None to keep the stored window
+    :param backend: PYTHON or PANDAS, the way tweets are counted
+    :param stem: whether to count words by their stems (analyses counted that way keep counting stems)
     """
-    brain = Extractor(topic, language)
-    brain.load_previous_analysis()
+    leaders = create_extractors(topic, language, capacity, precision, retention, stem)
+    analyze_file(leaders, processes, backend)
+    save_extractors(topic, leaders, export)
 
-    brain.analyze()
-    brain.filter_words()
-    brain.save_the_analysis()
+
+def save_extractors(topic, leaders, export=False):
+    """
+    Saves analyses of every extractor of the topic and rewrites summaries of the changed ones.\n
+    :param topic: topic of the analyses
+    :param leaders: group leaders holding counts of the new tweets, shared with their members (see Extractor.share)
+    :param export: whether to export analyses as human readable json
+    """
+    for leader in leaders:
+        for member in leader.group()[1:]:
+            member.adopt(leader)  # before the leader saves, the new tweets are added to both states
+        for brain in leader.group():
+            brain.filter_words()
+            brain.save_the_analysis(export)
+    update_summaries(topic, [brain.language for leader in leaders for brain in leader.group()
+                             if brain.new_tweets_count and brain.language is not None])
+
+
+def create_extractors(topic, language, capacity=None, precision=None, retention=None, stem=False):
+    """
+    Creates extractors of the topic loaded with previous analyses, grouped by the last analyzed tweet.\n
+    Extractors of the same group share the statistics not depending on the language, so they are counted once.\n
+    With 'all' languages, every language having a previous analysis is included and languages that did not appear
+    before are added while scanning. Languages that appeared before without being analyzed are skipped,
+    as counting only the new tweets would leave their analysis incomplete (pass them explicitly instead).\n
+    :param topic: topic of the analysis
+    :param language: language of the analysis, list of languages or 'all'
+    :param capacity: terms monitored in approximate mode, None to count exactly (unless the analysis was approximate)
+    :param precision: precision of the distinct users estimate, None to count posts of every user (unless estimated)
+    :param retention: hours kept in the hourly series, None to keep the stored window
+    :param stem: whether to count words by their stems, analyses counted that way keep counting stems anyway
+    :return: list of group leaders
+    """
+    if language == 'all':
+        languages = analyzed_languages(topic)
+    elif isinstance(language, str):
+        languages = [language]
+    else:
+        languages = list(language)
+
+    for code in languages:  # users are shared by the languages, so either all or none of them estimate them
+        state = AnalysisState(topic, code)
+        totals = state.load()
+        state.close()
+        if totals and totals['users_precision']:
+            precision = totals['users_precision']
+
+    leaders = {}  # last analyzed id -> group leader
+    for code in languages:
+        brain = Extractor(topic, code)
+        brain.retention = retention
+        if capacity:
+            brain.set_approximate(capacity)
+        if precision:
+            brain.set_distinct_users(precision)
+        if stem:
+            brain.set_stemming()
+        with METRICS.timer('analysis.load'):
+            loaded = brain.load_previous_analysis()
+        if brain.last_id in leaders:
+            leader = leaders[brain.last_id]
+            if loaded and leader.capacity is not None and brain.capacity is None:
+                brain.set_approximate(leader.capacity)  # add_member would leave the summaries without stored counts
+                state = AnalysisState(topic, code)
+                brain.load_sketches(state)
+                state.close()
+            leader.add_member(brain)
+        else:
+            leaders[brain.last_id] = brain
+
+    if language == 'all':
+        if not leaders:
+            leaders[None] = Extractor(topic, None)  # counts shared statistics only, languages become its members
+            leaders[None].retention = retention
+            if capacity:
+                leaders[None].set_approximate(capacity)
+            if precision:
+                leaders[None].set_distinct_users(precision)
+            if stem:
+                leaders[None].set_stemming()
+        for leader in leaders.values():
+            leader.skipped_languages = leader.previous_languages | set(languages)
+            if leader.members is None:
+                leader.members = {}
+    return list(leaders.values())
 
 
 if __name__ == '__main__':
+    metrics_path, profile = take_options()
     topics = None
     language = None
+    processes = 1
+    export = '-j' in sys.argv or '--json' in sys.argv
+    precision = DEFAULT_PRECISION if '-u' in sys.argv or '--unique-users' in sys.argv else None
+    stem = '-s' in sys.argv or '--stem' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg not in ['-j', '--json', '-u', '--unique-users', '-s', '--stem']]
+
+    if '-x' in sys.argv or '--blacklist' in sys.argv:  # words are taken as typed, the rest of arguments is lowercased
+        code = None
+        for option in ['-l', '--language']:
+            if option in sys.argv:
+                index = sys.argv.index(option)
+                if len(sys.argv) == index+1 or len(sys.argv[index+1]) != 2:
+                    print('Pass 2 letters long language code in argument.')
+                    exit()
+                code = sys.argv[index+1].lower()
+                del sys.argv[index:index+2]
+        words = [arg for arg in sys.argv[1:] if arg not in ['-x', '--blacklist']]
+        if words:
+            added = add_stopwords(words, code)
+            print('Added \x1b[1;36;40m{}\x1b[0m words to \x1b[1;34;40m{}\x1b[0m{}'.format(
+                len(added), stopwords_path(code), (': ' + ' '.join(added)) if added else '.'))
+            print('They are removed from stored analyses of {} on their next save.'.format(
+                'the language' if code else 'every language'))
+        else:
+            print(' '.join(read_blacklist(code)))
+        exit()
+
+    if stem and stemmer_for('en') is None:
+        print('Install nltk to count words by their stems.')
+        exit()
+
+    for option in ['-p', '--processes']:  # may be passed anywhere, taken out before reading the other arguments
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or not sys.argv[index+1].isdigit():
+                print('Pass number of processes in argument.')
+                exit()
+            processes = int(sys.argv[index+1])
+            del sys.argv[index:index+2]
+
+    retention = None
+    for option in ['-r', '--retention']:
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or not sys.argv[index+1].isdigit():
+                print('Pass number of hours in argument.')
+                exit()
+            retention = int(sys.argv[index+1])
+            del sys.argv[index:index+2]
+
+    backend = PYTHON
+    for option in ['-b', '--backend']:
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or sys.argv[index+1] not in [PYTHON, PANDAS]:
+                print('Pass {} or {} backend in argument.'.format(PYTHON, PANDAS))
+                exit()
+            backend = sys.argv[index+1]
+            del sys.argv[index:index+2]
+
+    capacity = None
+    for option in ['-k', '--top-k', '-e', '--error']:
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            try:
+                value = sys.argv[index+1]
+                capacity = int(value) if option in ['-k', '--top-k'] else capacity_for_error(float(value))
+            except (IndexError, ValueError):
+                print('Pass number of monitored terms (or allowed error) in argument.')
+                exit()
+            del sys.argv[index:index+2]
 
     if len(sys.argv) > 1:
         for i in range(1, len(sys.argv)):
@@ -237,7 +795,8 @@ if __name__ == '__main__':
 
         if sys.argv[1][0] == '-':
             if sys.argv[1] == '--help' or sys.argv[1] == '-h':
-                print('usage: python3 Extractor.py [-h] [-l en] [a b c...]\n'
+                print('usage: python3 Extractor.py [-h] [-l en] [-p 4] [-j] [-k 10000 | -e 0.0001] [-u] [-s] [-r 2160] [-b pandas] [a b c...]\n'
+                      '       python3 Extractor.py -x [-l pt] [word...]\n'
                       '\n'
                       'analyze content for topics a, b, c...\n'
                       '\n'
@@ -247,16 +806,37 @@ if __name__ == '__main__':
                       'optional arguments:\n'
                       '  -h, --help\t\t\t show this help message and exit\n'
                       '  -t, --topics\t\t\t list followed topics\n'
-                      '  -l, --language\t\t language for tweets analysis\n'
+                      '  -l, --language\t\t language for tweets analysis, comma separated languages or all\n'
+                      '  -p, --processes\t\t number of processes analyzing every topic file\n'
+                      '  -j, --json\t\t\t exports analyses as human readable json\n'
+                      '  -k, --top-k\t\t\t approximate mode, counts only about k most frequent words and hashtags\n'
+                      '  -e, --error\t\t\t approximate mode, counts overestimated by at most this fraction of terms\n'
+                      '  -u, --unique-users\t\t estimates number of distinct users instead of counting their posts\n'
+                      '  -s, --stem\t\t\t counts words by their stems, requires nltk\n'
+                      '  -x, --blacklist\t\t adds words to the blacklist (of -l language), lists it without words\n'
+                      '  -r, --retention\t\t hours of tweets per hour kept before the newest one, default 90 days\n'
+                      '  -b, --backend\t\t\t python (default) counts tweet by tweet, pandas aggregates batches of them\n'
+                      '  --metrics\t\t\t writes metrics of the run to a json (or .prom) file\n'
+                      '  --profile\t\t\t cpu or memory, saves a profile of the run into profiles/\n'
                       '\n'
                       'If no arguments passed, program will follow keywords loaded from topics.txt file.\n'
                       'Default analysis language is english.\n'
+                      'Once a topic is analyzed in approximate mode (or -u, -s), its later analyses stay that way.\n'
+                      'Blacklisted words and stopwords of the analyzed language are not counted.\n'
                       '\n'
                       'example usages:\n'
                       'python3 Extractor.py example\n'
                       'python3 Extractor.py -t\n'
                       'python3 Extractor.py --language en\n'
-                      'python3 Extractor.py --language pt example topic\n')
+                      'python3 Extractor.py --language pt example topic\n'
+                      'python3 Extractor.py -l en,pt,es example\n'
+                      'python3 Extractor.py -l all example\n'
+                      'python3 Extractor.py -p 4 example\n'
+                      'python3 Extractor.py -j example\n'
+                      'python3 Extractor.py -k 10000 example\n'
+                      'python3 Extractor.py -u example\n'
+                      'python3 Extractor.py -b pandas example\n'
+                      'python3 Extractor.py -x -l pt ainda sobre\n')
                 exit()
             elif sys.argv[1] == '-t' or sys.argv[1] == '--topics':
                 print_topics()
@@ -265,8 +845,8 @@ if __name__ == '__main__':
                 if len(sys.argv) == 2:
                     print('Pass 2 letters long language code in argument.')
                     exit()
-                if len(sys.argv[2]) == 2:
-                    language = sys.argv[2]
+                if sys.argv[2] == 'all' or all(len(code) == 2 for code in sys.argv[2].split(',')):
+                    language = sys.argv[2] if ',' not in sys.argv[2] else sys.argv[2].split(',')
                     if len(sys.argv) > 3:
                         topics = [arg for arg in sys.argv[3:] if arg[0] != '-']
             else:
@@ -275,5 +855,6 @@ if __name__ == '__main__':
         else:
             topics = [arg for arg in sys.argv[1:] if arg[0] != '-']
 
-    analyze_topics(topics, language)
+    with instrumented('Extractor', metrics_path, profile):
+        analyze_topics(topics, language, processes, export, capacity, precision, retention, backend, stem)
 
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from time import time
+from TweetCodec import FIELDS, decode_line
+from TimeSeries import hour_of
+from UserTable import is_bot
+
+"""
+Vectorized analysis backend of Extractor.py (--backend pandas).
+Tweets are loaded in columnar batches and dates, hours, languages, users and followers are aggregated with pandas
+(value_counts, groupby) and numpy, only the tokenization of texts is left in Python.
+It counts the same statistics as the per-tweet scan of Extractor.py (see scan()), so analyses do not depend on it.
+"""
+
+BATCH_SIZE = 20000  # lines decoded into a single frame
+
+
+def decode_batch(lines):
+    """
+    Decodes lines of a topic file into a frame, lines that can not be decoded are skipped.\n
+    :param lines: list of lines, newest tweets first
+    :return: DataFrame with a column per tweet field, in the order of the lines
+    """
+    records = []
+    for line in lines:
+        try:
+            records.append(decode_line(line))  # faster than pandas.read_json, which also can not read legacy lines
+        except (ValueError, IndexError):
+            pass
+    frame = pd.DataFrame.from_records(records, columns=FIELDS)
+    return frame[frame['id'].notna()].reset_index(drop=True)
+
+
+def count_frame(extractor, frame):
+    """
+    Adds tweets of a frame to the statistics of an extractor (and the content of its members).\n
+    :param extractor: group leader counting the tweets
+    :param frame: tweets not analyzed by the extractor yet
+    """
+    names = frame['screen_name'].astype(str)
+    unique_names = names.unique()
+    bots = unique_names[np.fromiter((is_bot(name) for name in unique_names), bool, len(unique_names))]
+    frame = frame[~names.isin(bots)]
+    if frame.empty:
+        return
+
+    # counting topic range, followers are taken from the first (newest) post of every user
+    users = frame.groupby('screen_name', sort=False)['user_followers'].agg(['size', 'first'])
+    for screen_name, posts, followers in zip(users.index, users['size'], users['first']):
+        extractor.users.add(screen_name, int(followers), int(posts))
+
+    # checking dates distribution
+    dates = frame['date'].astype(str)
+    for date, count in dates.str.split(n=1).str[0].value_counts(sort=False).items():
+        extractor.dates[date] = extractor.dates.get(date, 0) + int(count)
+    prefixes, unique_prefixes = pd.factorize(dates.str[:13])
+    hours = np.array([hour_of(prefix) for prefix in unique_prefixes], dtype=float)[prefixes]  # NaN if not parsed
+    languages = frame['language'].astype(object).where(frame['language'].notna(), None)
+    counts = pd.DataFrame({'language': languages, 'hour': hours}).dropna(subset=['hour'])
+    for (language, hour), count in counts.groupby(['language', 'hour'], sort=False, dropna=False).size().items():
+        key = (None if pd.isna(language) else language, int(hour))
+        extractor.hours[key] = extractor.hours.get(key, 0) + int(count)
+
+    # checking language dependency
+    for language, count in languages.value_counts(sort=False, dropna=False).items():
+        language = None if pd.isna(language) else language
+        extractor.languages[language] = extractor.languages.get(language, 0) + int(count)
+
+    # analyzing content, the only part left in python
+    texts = frame['full_text'].astype(str)
+    own = (languages == extractor.language).to_numpy()
+    for text in texts[own]:
+        extractor.count_content(text)
+    if extractor.members is not None:
+        for language, group in texts[~own].groupby(languages[~own], sort=False):
+            for text in group:
+                extractor.count_member_content(language, text)
+    extractor.new_tweets_count += len(frame)
+
+
+def scan_frames(extractors, lines, progress=True, batch_size=BATCH_SIZE):
+    """
+    Counts tweets from passed lines in every extractor until the last tweet it previously analyzed is reached,
+    a batch of lines at a time (see Extractor.scan).\n
+    :param extractors: extractors of the same topic file (usually group leaders)
+    :param lines: iterable of lines from the topic file, newest tweets first
+    :param progress: whether to print time of every analyzed batch
+    :param batch_size: number of lines decoded into a single frame
+    :return: list of flags telling for every extractor whether its last analyzed tweet was reached
+    """
+    active = list(extractors)
+    reached = []
+    batch = []
+    start_time = time()
+    for line in lines:
+        batch.append(line)
+        if len(batch) < batch_size:
+            continue
+        active = count_batch(active, reached, batch)
+        batch = []
+        if progress:
+            print('\x1b[35m' + str(extractors[0].new_tweets_count//1000) + 'k time:',
+                  round((time()-start_time) * 1000, 3), 'ms.\x1b[0m')
+            start_time = time()
+        if not active:
+            break
+    if batch and active:
+        count_batch(active, reached, batch)
+    return [extractor in reached for extractor in extractors]
+
+
+def count_batch(active, reached, batch):
+    """
+    Counts a batch of lines in the extractors that did not reach their last analyzed tweet yet.\n
+    :param active: extractors still counting
+    :param reached: list the extractors reaching their last analyzed tweet are added to
+    :param batch: list of lines
+    :return: extractors still counting after the batch
+    """
+    frame = decode_batch(batch)
+    if frame.empty:
+        return active
+    ids = frame['id'].to_numpy()
+    for extractor in active:
+        stop = np.flatnonzero(ids == extractor.last_id) if extractor.last_id is not None else []
+        if len(stop):
+            reached.append(extractor)
+            count_frame(extractor, frame.iloc[:stop[0]])
+        else:
+            count_frame(extractor, frame)
+    return [extractor for extractor in active if extractor not in reached]
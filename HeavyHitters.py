@@ -0,0 +1,273 @@
+import sys
+import shutil
+
+from heapq import heappush, heappop, heapreplace
+from math import ceil
+from io import StringIO
+from contextlib import redirect_stdout
+from os import chdir, getcwd, makedirs, path
+from tempfile import mkdtemp
+from datetime import datetime
+
+"""
+Streaming top-k counter (Space-Saving, Metwally et al.) used by Extractor.py in approximate mode,
+so words and hashtags of a topic take a fixed amount of memory however many distinct terms appear.
+At most `capacity` terms are monitored. A term that is not monitored replaces the least frequent one and inherits
+its count as the error, so counts are overestimated by at most total / capacity and every term occurring more often
+than that is guaranteed to be monitored. Summaries are mergeable (Agarwal et al.), so shards analyzed in parallel
+and incremental runs keep the same bound.
+Running this script checks approximate analyses against exact counts of a generated corpus (see Benchmark.py).
+"""
+
+NEWER_ID = 1300000000000000000 + 10 ** 12  # newest tweet of the segment generated after the first analyses
+
+
+def capacity_for_error(error):
+    """
+    Gives number of monitored terms keeping the overestimation below a fraction of all counted terms.\n
+    :param error: allowed error as a fraction of the stream length, i.e. 0.0001
+    :return: capacity of the counter
+    """
+    return max(1, ceil(1 / error))
+
+
+class SpaceSaving:
+    """
+    Approximate counter of the most frequent keys, taking at most `capacity` keys worth of memory.\n
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor of SpaceSaving class.\n
+        :param capacity: maximum number of monitored keys
+        """
+        self.capacity = capacity
+        self.counts = {}  # monitored key -> estimated count
+        self.errors = {}  # monitored key -> maximum overestimation of its count
+        self.heap = []  # (count, key) entries, a count may be lower than the current one (updated when popped)
+        self.total = 0  # number of counted occurrences, including the ones of evicted keys
+        self.ignored = frozenset()  # keys that are never counted, i.e. blacklisted words
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, count=1):
+        """
+        Counts occurrences of a key, replacing the least frequent monitored key if the counter is full.\n
+        :param key: counted key
+        :param count: number of occurrences
+        """
+        if key in self.ignored:
+            return
+        self.total += count
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+            heappush(self.heap, (count, key))
+        else:
+            minimum = self.evict()
+            counts[key] = minimum + count
+            self.errors[key] = minimum
+            heappush(self.heap, (minimum + count, key))
+
+    def evict(self):
+        """
+        Stops monitoring the least frequent key.\n
+        :return: count of the evicted key
+        """
+        heap = self.heap
+        counts = self.counts
+        while True:
+            count, key = heap[0]
+            current = counts.get(key)
+            if current == count:
+                heappop(heap)
+                del counts[key]
+                del self.errors[key]
+                return count
+            if current is None:  # the key was evicted or popped before
+                heappop(heap)
+            else:
+                heapreplace(heap, (current, key))
+
+    def pop(self, key, default=None):
+        """
+        Stops monitoring a key, like dict.pop.\n
+        :param key: monitored key
+        :param default: returned if the key is not monitored
+        :return: estimated count of the key
+        """
+        if key not in self.counts:
+            return default
+        del self.errors[key]
+        return self.counts.pop(key)
+
+    def minimum(self):
+        """
+        Gives the count every key that is not monitored can have at most.\n
+        :return: the lowest monitored count if the counter is full, 0 otherwise
+        """
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def error_bound(self):
+        """
+        Gives the maximum overestimation of any count.\n
+        :return: number of occurrences
+        """
+        return self.total / self.capacity
+
+    def load(self, rows, total):
+        """
+        Replaces the monitored keys, only the most frequent ones are kept if there are more than the capacity.\n
+        :param rows: iterable of (key, count, error) tuples
+        :param total: number of occurrences counted by the loaded summary
+        """
+        rows = sorted(rows, key=lambda row: (-row[1], row[0]))[:self.capacity]
+        self.counts = {key: count for key, count, _ in rows}
+        self.errors = {key: error for key, _, error in rows}
+        self.heap = [(count, key) for key, count, _ in rows]
+        self.heap.sort()
+        self.total = total
+
+    def merge(self, other):
+        """
+        Adds keys counted by another summary. A key missing in one of the summaries gets its minimum,
+        as it could have occurred that many times there.\n
+        :param other: SpaceSaving counting other occurrences
+        """
+        own_minimum = self.minimum()
+        other_minimum = other.minimum()
+        rows = []
+        for key in set(self.counts) | set(other.counts):
+            rows.append((key, self.counts.get(key, own_minimum) + other.counts.get(key, other_minimum),
+                         self.errors.get(key, own_minimum) + other.errors.get(key, other_minimum)))
+        self.load(rows, self.total + other.total)
+
+    def items(self):
+        """
+        Lists monitored keys with their estimated counts.\n
+        :return: list of (key, count) pairs
+        """
+        return list(self.counts.items())
+
+    def rows(self):
+        """
+        Lists monitored keys with their estimated counts and errors, used to store the summary.\n
+        :return: list of (key, count, error) tuples
+        """
+        return [(key, count, self.errors[key]) for key, count in self.counts.items()]
+
+    def top(self, number):
+        """
+        Gives the most frequent keys, alphabetically when counts are equal.\n
+        :param number: number of keys
+        :return: dictionary key -> estimated count
+        """
+        return dict(sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:number])
+
+
+def write_segment(size, seed, head):
+    """
+    Stores generated tweets of the checked topic in the current directory (see Benchmark.py).\n
+    :param size: number of tweets
+    :param seed: seed of the corpus
+    :param head: False for the first segment, True for newer tweets fetched after the first analyses
+    """
+    from Benchmark import TOPIC, CorpusGenerator
+    from TopicStorage import TopicStorage
+    from TweetCodec import encode_tweet
+
+    if not head:
+        CorpusGenerator(TOPIC, seed).write(size)
+        return
+    storage = TopicStorage(TOPIC).load()
+    storage.append([(tweet['id'], encode_tweet(tweet)) for tweet in
+                    CorpusGenerator(TOPIC, seed + 1).tweets(size, NEWER_ID, datetime(2020, 6, 14))], head=True)
+    storage.seal()
+
+
+def check_mixed_group(processes=1, capacity=50, size=4000, seed=0):
+    """
+    Checks analyses of languages sharing a scan while counting words and hashtags differently.\n
+    A generated topic is analyzed exactly in pt and approximately in en, newer tweets are added and both languages
+    are analyzed together, once with each of them leading the group. The pt analysis must keep its stored counts:
+    summarized within the error bound after joining the approximate en group, exactly when leading the group.\n
+    :param processes: number of processes analyzing the topic file
+    :param capacity: terms monitored in approximate mode
+    :param size: number of tweets of each of the two generated segments
+    :param seed: seed of the corpus
+    :return: list of failed checks, empty if every check passed
+    """
+    from Benchmark import TOPIC
+    from Extractor import analyze_topic
+    from AnalysisState import AnalysisState, WORDS, HASHTAGS
+
+    failures = []
+    origin = getcwd()
+    work = mkdtemp(prefix='heavy-hitters-')
+    try:
+        with redirect_stdout(StringIO()):
+            makedirs(path.join(work, 'exact'))
+            chdir(path.join(work, 'exact'))
+            write_segment(size, seed, False)
+            write_segment(size, seed, True)
+            analyze_topic(TOPIC, ['en', 'pt'])
+            exact = {}
+            for language in ('en', 'pt'):
+                state = AnalysisState(TOPIC, language)
+                exact[language] = {kind: state.counters(kind) for kind in (WORDS, HASHTAGS)}
+                state.close()
+
+            for order in (['en', 'pt'], ['pt', 'en']):
+                makedirs(path.join(work, order[0]))
+                chdir(path.join(work, order[0]))
+                write_segment(size, seed, False)
+                analyze_topic(TOPIC, 'pt', processes)
+                analyze_topic(TOPIC, 'en', processes, capacity=capacity)
+                write_segment(size, seed, True)
+                analyze_topic(TOPIC, order, processes)
+                for language in order:
+                    state = AnalysisState(TOPIC, language)
+                    for kind in (WORDS, HASHTAGS):
+                        name = '{} {} of {} leading, {} processes'.format(language, kind, order[0], processes)
+                        truth = exact[language][kind]
+                        if language == 'pt' and order[0] == 'pt':
+                            if state.counters(kind) != truth:
+                                failures.append(name + ': counts differ from exact ones')
+                            continue
+                        sketch = SpaceSaving(capacity)
+                        state.load_sketch(kind, sketch)
+                        if sketch.total != sum(truth.values()):
+                            failures.append(name + ': {} counted, {} in the corpus'.format(
+                                sketch.total, sum(truth.values())))
+                        if any(not truth.get(key, 0) <= count <= truth.get(key, 0) + sketch.errors[key]
+                               for key, count in sketch.counts.items()):
+                            failures.append(name + ': counts out of their error bounds')
+                        if any(count > sketch.total / capacity and key not in sketch for key, count in truth.items()):
+                            failures.append(name + ': terms above the error bound are missing')
+                    state.close()
+    finally:
+        chdir(origin)
+        shutil.rmtree(work)
+    return failures
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print('usage: python3 HeavyHitters.py\n'
+              '\n'
+              'checks approximate analyses of languages sharing a scan with exact ones against exact counts\n'
+              'of a generated corpus, analyzed in 1 and 3 processes\n')
+        exit()
+
+    failures = check_mixed_group(1) + check_mixed_group(3)
+    for failure in failures:
+        print('\x1b[1;31;40m{}\x1b[0m'.format(failure))
+    if not failures:
+        print('\x1b[1;32;40mApproximate counts are within their error bounds, exact counts are kept.\x1b[0m')
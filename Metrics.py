@@ -0,0 +1,216 @@
+import sys
+import json
+
+from time import perf_counter
+from datetime import datetime
+from threading import Lock
+from contextlib import contextmanager
+from os import path, makedirs, replace
+
+"""
+Metrics of a run: counters (requests, retries, tweets, bytes), timers (latency of requests, scans, saves, renders)
+and gauges (rates, peak memory), kept in a single registry of the process and written when the script ends.
+Scripts take --metrics <file> to write them, as json or in Prometheus text format if the file ends with .prom,
+and --profile cpu|memory to capture a cProfile or tracemalloc profile of the whole run into profiles/.
+Recording is cheap (a lock and a dictionary update), hot loops record once per batch, not once per tweet.
+"""
+
+PREFIX = 'tweet_analyzer_'  # prefix of Prometheus metric names
+PROFILES = ('cpu', 'memory')
+PROFILE_LINES = 30  # entries printed and saved from a profile
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and timers, safe to update from several threads.\n
+    """
+
+    def __init__(self):
+        """
+        Constructor of Metrics class.
+        """
+        self.lock = Lock()
+        self.counters = {}  # name -> accumulated value
+        self.gauges = {}  # name -> last set value
+        self.timers = {}  # name -> [number of measurements, total seconds, longest measurement]
+
+    def count(self, name, value=1):
+        """
+        Adds to a counter.\n
+        :param name: dotted name of the counter, e.g. 'fetch.requests'
+        :param value: number to add
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """
+        Sets a gauge.\n
+        :param name: dotted name of the gauge
+        :param value: current value
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def record(self, name, seconds):
+        """
+        Adds a measurement to a timer.\n
+        :param name: dotted name of the timer, e.g. 'fetch.request'
+        :param seconds: measured time
+        """
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0., 0.])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Measures the enclosed block, also when it raises.\n
+        :param name: dotted name of the timer
+        """
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start_time)
+
+    def snapshot(self):
+        """
+        Gives all metrics as a json-serializable dictionary.\n
+        :return: dictionary with counters, gauges and timers (count, seconds, max_seconds)
+        """
+        with self.lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                    'timers': {name: {'count': count, 'seconds': round(total, 6), 'max_seconds': round(longest, 6)}
+                               for name, (count, total, longest) in self.timers.items()}}
+
+    def prometheus(self):
+        """
+        Gives all metrics in Prometheus text exposition format.\n
+        :return: text, one sample per line
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines += ['# TYPE {}_total counter'.format(metric_name(name)),
+                      '{}_total {}'.format(metric_name(name), value)]
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines += ['# TYPE {} gauge'.format(metric_name(name)), '{} {}'.format(metric_name(name), value)]
+        for name, timer in sorted(snapshot['timers'].items()):
+            lines += ['# TYPE {}_seconds summary'.format(metric_name(name)),
+                      '{}_seconds_count {}'.format(metric_name(name), timer['count']),
+                      '{}_seconds_sum {}'.format(metric_name(name), timer['seconds']),
+                      '# TYPE {}_max_seconds gauge'.format(metric_name(name)),
+                      '{}_max_seconds {}'.format(metric_name(name), timer['max_seconds'])]
+        return '\n'.join(lines) + '\n'
+
+    def save(self, file_path):
+        """
+        Writes all metrics, replacing the previous file at once.\n
+        :param file_path: path of the file, Prometheus text if it ends with .prom, json otherwise
+        """
+        directory = path.dirname(file_path)
+        if directory and not path.exists(directory):
+            makedirs(directory)
+        with open(file_path + '.tmp', 'w') as file:
+            if file_path.endswith('.prom'):
+                file.write(self.prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=1, sort_keys=True)
+        replace(file_path + '.tmp', file_path)
+
+
+METRICS = Metrics()  # registry of the running process
+count = METRICS.count
+gauge = METRICS.gauge
+record = METRICS.record
+timer = METRICS.timer
+
+
+def metric_name(name):
+    """
+    Turns a dotted metric name into a Prometheus one.\n
+    :param name: e.g. 'fetch.request'
+    :return: e.g. 'tweet_analyzer_fetch_request'
+    """
+    return PREFIX + ''.join(char if char.isalnum() else '_' for char in name)
+
+
+def take_options(argv=None):
+    """
+    Takes --metrics and --profile options out of the script arguments.\n
+    :param argv: list of arguments, sys.argv by default
+    :return: tuple of the metrics file path and the profile kind, None for the ones not passed
+    """
+    argv = sys.argv if argv is None else argv
+    options = {'--metrics': None, '--profile': None}
+    for option in options:
+        if option in argv:
+            index = argv.index(option)
+            if len(argv) == index+1 or (option == '--profile' and argv[index+1] not in PROFILES):
+                print('Pass {} in argument.'.format('a file path' if option == '--metrics' else ' or '.join(PROFILES)))
+                exit()
+            options[option] = argv[index+1]
+            del argv[index:index+2]
+    return options['--metrics'], options['--profile']
+
+
+@contextmanager
+def instrumented(script, metrics_path=None, profile=None):
+    """
+    Runs the enclosed block of a script with the chosen profiler and writes metrics and the profile afterwards,
+    also when the script exits early.\n
+    :param script: name of the script, used in the profile file name
+    :param metrics_path: file to write metrics to, None not to write them
+    :param profile: 'cpu', 'memory' or None
+    """
+    profiler = None
+    if profile == 'cpu':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'memory':
+        import tracemalloc
+        tracemalloc.start()
+    start_time = perf_counter()
+    try:
+        yield METRICS
+    finally:
+        METRICS.gauge('run.seconds', round(perf_counter() - start_time, 6))
+        if profile is not None:
+            save_profile(script, profile, profiler)
+        if metrics_path is not None:
+            METRICS.save(metrics_path)
+            print('Saved metrics as \x1b[1;34;40m{}\x1b[0m'.format(metrics_path))
+
+
+def save_profile(script, profile, profiler=None):
+    """
+    Stops the profiler and writes the profile into profiles/, the top entries are printed as well.\n
+    :param script: name of the profiled script
+    :param profile: 'cpu' or 'memory'
+    :param profiler: running cProfile.Profile for the cpu profile
+    """
+    if not path.exists('profiles'):
+        makedirs('profiles')
+    base = 'profiles/' + script + '_' + datetime.now().strftime('%Y%m%d_%H%M%S')
+    if profile == 'cpu':
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(base + '.prof')  # readable by pstats, snakeviz etc.
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        print('Saved cpu profile as \x1b[1;34;40m{}\x1b[0m'.format(base + '.prof'))
+    else:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        METRICS.gauge('memory.peak_bytes', peak)
+        lines = ['peak {} B, current {} B'.format(peak, current)]
+        lines += [str(statistic) for statistic in snapshot.statistics('lineno')[:PROFILE_LINES]]
+        with open(base + '.txt', 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        print('\n'.join(lines))
+        print('Saved memory profile as \x1b[1;34;40m{}\x1b[0m'.format(base + '.txt'))
@@ -1,58 +1,179 @@
 import sys
 import json
 
-from glob import glob
-from os import path, mkdir
+from array import array
+from os import path, mkdir, replace, cpu_count
+from hashlib import sha1
+from time import perf_counter
 from datetime import datetime
-from matplotlib import colors, pyplot as plt
+from multiprocessing import Pool
+from AnalysisState import topic_summaries
+from TimeSeries import HourlySeries
+from Metrics import METRICS, take_options, instrumented
 
 
 """
 Plots charts based on data extracted by Extractor.py.
 For now these are 3 plots: date dependency, 5 most popular hashtags, 10 mostly used words.
+With --hours the date dependency shows tweets per hour of the latest hours, read from the hourly numbers of summaries.
+Charts are rendered only for analyses whose plotted data changed since the last render, fingerprints of rendered
+data are kept in plots/<topic>/renders.json. Changed analyses of all topics are rendered in a process pool,
+matplotlib is imported only when there is something to render, with a non-interactive backend.
+Data of the charts is read from summaries of the topic's analyses (see AnalysisState.py), a single small file per
+topic, so neither the analyses directory is listed nor the full counters are parsed.
 Implementation of this script is dependent on data analysis made by Extractor.py.
 """
 
+
+def pyplot():
+    """
+    Imports pyplot with a backend rendering to files only, so no display is needed (worker processes have none).\n
+    :return: matplotlib.pyplot module
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    return plt
+
+
+def renders_path(topic):
+    """
+    Gives path of the manifest of rendered charts of a topic.\n
+    :param topic: plotted topic
+    :return: path to the manifest
+    """
+    return 'plots/' + topic + '/renders.json'
+
+
+def load_renders(topic):
+    """
+    Loads the manifest of rendered charts of a topic.\n
+    :param topic: plotted topic
+    :return: dictionary analysis name -> {'fingerprint': ..., 'files': [...]}
+    """
+    try:
+        with open(renders_path(topic), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_renders(topic, renders):
+    """
+    Saves the manifest of rendered charts of a topic, replacing the previous one at once.\n
+    :param topic: plotted topic
+    :param renders: dictionary analysis name -> {'fingerprint': ..., 'files': [...]}
+    """
+    with open(renders_path(topic) + '.tmp', 'w') as file:
+        json.dump(renders, file, indent=1)
+    replace(renders_path(topic) + '.tmp', renders_path(topic))
+
+
+def render(plotter):
+    """
+    Renders charts of a loaded analysis, executed in a worker process.\n
+    :param plotter: Plotter holding the analysis data
+    :return: tuple of the plotter's topic, analysis name, fingerprint, list of written files and render time in seconds
+    """
+    start_time = perf_counter()
+    files = plotter.plot()
+    return plotter.topic, plotter.name, plotter.fingerprint(), files, perf_counter() - start_time
+
+
 class Plotter:
 
-    def __init__(self, topic, transparency):
+    def __init__(self, topic, transparency, hours=None):
         self.topic = topic
         self.transparency = transparency
+        self.hours = hours  # number of latest hours to plot tweets per hour of, None plots tweets per day
 
         self.name = None
         self.dates = {}
         self.hashtags = {}
         self.words = {}
 
-        self.paths = None
+        self.summaries = None
+
+    def work(self, force=False):
+        """
+        Renders charts of every analysis of the topic that changed since the last render.\n
+        :param force: whether to render unchanged analyses as well
+        """
+        plot_topics([self.topic], self.transparency, self.hours, force=force)
 
-    def work(self):
-        self.load_file_paths()
+    def changed(self, renders, force=False):
+        """
+        Loads analyses of the topic and picks the ones whose plotted data differ from the last render.\n
+        :param renders: manifest of rendered charts of the topic (see load_renders)
+        :param force: whether to pick unchanged analyses as well
+        :return: list of Plotters, each one holding data of a single analysis
+        """
+        self.load_summaries()
 
-        if not self.paths:
+        if not self.summaries:
             print('Did not find statistics for keyword \x1b[1;40;31m{}\x1b[0m.'.format(self.topic))
-            return
-
-        for path in self.paths:
-            try:
-                self.load_data(path)
-                self.name = path.replace('analyses/', '').replace('.json', '')
-                self.plot()
-                print('Generated charts for keyword \x1b[1;40;32m{}\x1b[0m.'.format(self.topic))
-            except FileNotFoundError:
-                print('Could not open {} file, proceeding.'.format(path))
-
-    def load_file_paths(self):
-        self.paths = [dir for dir in glob('analyses/' + self.topic + '_*') if self.topic in dir]
-
-    def load_data(self, path):
-        with open(path, 'r') as file:
-            content = json.load(file)
-            self.dates = content['dates']
-            self.hashtags = {k: content['trending'][k] for k in content['trending'] if k[0] == '#'}
-            self.words = {k: content['trending'][k] for k in content['trending'] if k[0] != '#'}
+            return []
+
+        changed = []
+        for language, summary in sorted(self.summaries.items()):
+            plotter = Plotter(self.topic, self.transparency, self.hours)
+            plotter.name = self.topic + '_' + language
+            plotter.load_summary(summary)
+            previous = renders.get(plotter.name)
+            if not force and previous and previous['fingerprint'] == plotter.fingerprint() and \
+                    all(path.exists(chart) for chart in previous['files']):
+                print('Charts for \x1b[1;40;32m{}\x1b[0m are up to date.'.format(plotter.name))
+                METRICS.count('plot.skipped')
+                continue
+            changed.append(plotter)
+        return changed
+
+    def load_summaries(self):
+        """
+        Loads summaries of every analysis of the topic.
+        """
+        with METRICS.timer('plot.load'):
+            self.summaries = topic_summaries(self.topic)
+
+    def load_summary(self, summary):
+        """
+        Loads data of the charts from the summary of an analysis.\n
+        :param summary: summary of the analysis (see AnalysisState.summary)
+        """
+        if self.hours and summary.get('hours'):  # summaries of json analyses have no hourly numbers
+            self.dates = self.latest_hours(summary['hours']['start'], summary['hours']['counts'])
+        else:
+            self.dates = summary['dates']
+        self.hashtags = {k: summary['trending'][k] for k in summary['trending'] if k[0] == '#'}
+        self.words = {k: summary['trending'][k] for k in summary['trending'] if k[0] != '#'}
+
+    def latest_hours(self, start, counts):
+        """
+        Gives numbers of tweets in the latest hours of an hourly series, hours before its start have no tweets.\n
+        :param start: hour of the first number, None for an empty series
+        :param counts: list of numbers of tweets per hour
+        :return: dictionary 'YYYY-MM-DD HH:00' -> count
+        """
+        if start is None:
+            return {}
+        end = start + len(counts)
+        padding = max(0, start - (end - self.hours))
+        return HourlySeries(end - self.hours, array('I', [0] * padding + counts[-self.hours:])).labeled(empty=True)
+
+    def fingerprint(self):
+        """
+        Hashes everything the charts are drawn from, equal fingerprints give equal charts.\n
+        :return: hex digest
+        """
+        content = [self.dates, list(self.hashtags.items()), list(self.words.items()), self.hours, self.transparency]
+        return sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
 
     def plot(self):
+        """
+        Renders charts of the loaded analysis.\n
+        :return: list of written files
+        """
+        plt = pyplot()
         self.dates = {k: v for k, v in sorted(self.dates.items(), key=lambda date:date[0])}
         # fig, dates_step = plt.subplots()
         # dates_step.step(list(self.dates.keys())[1:-1], list(self.dates.values())[1:-1], where='mid')
@@ -65,7 +186,7 @@ class Plotter:
         dates_labels = list(self.dates.keys())[1:-1]
         dates_values = list(self.dates.values())[1:-1]
         dates_fig, dates_bar = plt.subplots()
-        fracs = [n / max(dates_values) for n in dates_values]
+        fracs = [n / (max(dates_values, default=0) or 1) for n in dates_values]
         colors = [(152*n/255, (55+200*n)/255, (100-100*n)/255) for n in fracs]
         dates_bar.bar(dates_labels, dates_values, color=colors)
         for label in dates_bar.get_xticklabels():
@@ -91,20 +212,72 @@ class Plotter:
         if not path.exists('plots/' + self.topic):
             mkdir('plots/' + self.topic)
 
-        dates_fig.savefig('plots/' + self.topic + '/' + self.name + '_dates_' +
-                          datetime.now().strftime('%Y%m%d_%H%M%S') + '.png',
-                          bbox_inches='tight', transparent=self.transparency)
-        tags_fig.savefig('plots/' + self.topic + '/' + self.name + '_hashtags_' +
-                         datetime.now().strftime('%Y%m%d_%H%M%S') + '.png',
-                         bbox_inches='tight', transparent=self.transparency)
-        words_fig.savefig('plots/' + self.topic + '/' + self.name + '_words_' +
-                          datetime.now().strftime('%Y%m%d_%H%M%S') + '.png',
-                          bbox_inches='tight', transparent=self.transparency)
+        files = [
+            'plots/' + self.topic + '/' + self.name + ('_hours_' if self.hours else '_dates_') +
+            datetime.now().strftime('%Y%m%d_%H%M%S') + '.png',
+            'plots/' + self.topic + '/' + self.name + '_hashtags_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.png',
+            'plots/' + self.topic + '/' + self.name + '_words_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.png']
+        for figure, file in zip((dates_fig, tags_fig, words_fig), files):
+            figure.savefig(file, bbox_inches='tight', transparent=self.transparency)
 
         plt.close('all')
+        return files
+
+
+def plot_topics(topics, transparency=False, hours=None, processes=1, force=False):
+    """
+    Renders charts of analyses of passed topics that changed since their last render.\n
+    :param topics: list of topics to plot
+    :param transparency: whether charts have transparent background
+    :param hours: number of latest hours to plot tweets per hour of, None plots tweets per day
+    :param processes: number of processes rendering charts
+    :param force: whether to render unchanged analyses as well
+    """
+    renders = {topic: load_renders(topic) for topic in topics}
+    plotters = []
+    for topic in topics:
+        plotters += Plotter(topic, transparency, hours).changed(renders[topic], force)
+    if processes > 1 and len(plotters) > 1:
+        with Pool(min(processes, len(plotters))) as pool:
+            results = pool.imap_unordered(render, plotters)
+            for topic, name, fingerprint, files, seconds in results:
+                renders[topic][name] = {'fingerprint': fingerprint, 'files': files}
+                METRICS.record('plot.render', seconds)
+                print('Generated charts for keyword \x1b[1;40;32m{}\x1b[0m.'.format(name))
+    else:
+        for topic, name, fingerprint, files, seconds in map(render, plotters):
+            renders[topic][name] = {'fingerprint': fingerprint, 'files': files}
+            METRICS.record('plot.render', seconds)
+            print('Generated charts for keyword \x1b[1;40;32m{}\x1b[0m.'.format(name))
+    for topic in {plotter.topic for plotter in plotters}:
+        save_renders(topic, renders[topic])
 
 
 if __name__ == '__main__':
+    metrics_path, profile = take_options()
+    hours = None
+    for option in ['-H', '--hours']:
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or not sys.argv[index+1].isdigit():
+                print('Pass number of hours in argument.')
+                exit()
+            hours = int(sys.argv[index+1])
+            del sys.argv[index:index+2]
+
+    processes = cpu_count() or 1
+    for option in ['-p', '--processes']:
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or not sys.argv[index+1].isdigit():
+                print('Pass number of processes in argument.')
+                exit()
+            processes = int(sys.argv[index+1])
+            del sys.argv[index:index+2]
+
+    force = '-f' in sys.argv or '--force' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg not in ['-f', '--force']]
+
     transparency = False
     if len(sys.argv) > 1:
         if sys.argv[1][0] == '-':
@@ -119,6 +292,5 @@ if __name__ == '__main__':
             print('No topics to plot. Pass them in argument or save in assets/topics.txt file')
             exit()
 
-    for topic in topics:
-        plotter = Plotter(topic, transparency)
-        plotter.work()
+    with instrumented('PlotTwister', metrics_path, profile):
+        plot_topics(topics, transparency, hours, processes, force)
@@ -0,0 +1,70 @@
+from time import monotonic, sleep
+from threading import Lock
+
+"""
+Token bucket limiting requests shared by every thread of the fetcher.
+Twitter allows 450 search requests in a 15 minutes window to an application (the limit is per application,
+not per topic), so topics fetched at the same time have to draw from one budget.
+A bucket holding `burst` tokens and refilled at (limit - burst) / window tokens per second never lets more than
+`limit` requests through in any window, even right after the script starts with a full bucket.
+"""
+
+SEARCH_LIMIT = 450  # search requests allowed in a window with application authentication
+SEARCH_WINDOW = 15 * 60  # length of the rate limit window in seconds
+SEARCH_BURST = 100  # requests that can be made at once before the limiter starts spacing them
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, every request takes one token and waits if there is none left.\n
+    """
+
+    def __init__(self, capacity, rate):
+        """
+        Constructor of TokenBucket class.\n
+        :param capacity: maximum number of tokens, the bucket starts full
+        :param rate: tokens added per second
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = monotonic()  # when the tokens were last refilled
+        self.waited = 0.0  # cumulative time (in seconds) requests spent waiting for a token
+        self.lock = Lock()
+
+    def refill(self):
+        """
+        Adds tokens for the time passed since the last refill, called with the lock held.
+        """
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Takes a token, blocks until one is available.\n
+        :return: time (in seconds) spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.waited += waited
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            sleep(delay)
+            waited += delay
+
+
+def search_limiter(burst=SEARCH_BURST, limit=SEARCH_LIMIT, window=SEARCH_WINDOW):
+    """
+    Creates a bucket respecting the search endpoint window.\n
+    :param burst: requests allowed at once
+    :param limit: requests allowed in a window
+    :param window: length of the window in seconds
+    :return: TokenBucket shared by the fetching threads
+    """
+    burst = min(burst, limit - 1)
+    return TokenBucket(burst, (limit - burst) / window)
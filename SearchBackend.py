@@ -0,0 +1,321 @@
+import sys
+import random
+import shutil
+import tweepy
+import datetime
+
+from json import JSONDecodeError
+from os import chdir, getcwd, path
+from tempfile import mkdtemp
+from threading import Lock
+from time import time, sleep
+from TweetCodec import decode_line
+
+"""
+Search backends used by TweetPeeker.py to request tweets.
+Every backend exposes search(query, count, max_id, since_id), returning tweets ordered from the newest to the oldest,
+and raises ServerOverloaded, SearchError or JSONDecodeError the way the Twitter API fails.
+TweepySearch queries Twitter, ReplaySearch serves recorded or synthetic tweets from memory, so pagination, retries
+and writing of the fetcher can be measured on a machine without network or access tokens.
+Running this script benchmarks the whole fetch on replayed tweets of stored topics.
+"""
+
+OVERLOADED = 'overloaded'  # injected failure answered by the server with 503
+PARSING = 'parsing'  # injected failure of decoding the response
+
+
+class ServerOverloaded(Exception):
+    """
+    Raised when the server can not handle the request at the moment, the request should be repeated.
+    """
+
+
+class SearchError(Exception):
+    """
+    Raised when the request failed and repeating it would not help.
+    """
+
+
+class TweepySearch:
+    """
+    Backend requesting tweets from Twitter standard search API (last 7 days).\n
+    """
+
+    def __init__(self, api, filters=' -filter:retweets -filter:replies '):
+        """
+        Constructor of TweepySearch class.\n
+        :param api: authenticated tweepy.API
+        :param filters: twitter API filters for eliminating certain tweets
+        """
+        self.api = api
+        self.filters = filters
+        self.retry_delay = 5  # seconds to wait before repeating a request the server was overloaded with
+
+    def search(self, query, count=100, max_id=None, since_id=None):
+        """
+        Requests a page of recent tweets containing query.\n
+        :param query: keyword(s) to search for
+        :param count: maximum number of tweets (100 at most)
+        :param max_id: id of the newest tweet to return (inclusive)
+        :param since_id: id of the newest tweet not to return (exclusive)
+        :return: list of tweepy statuses
+        :raise ServerOverloaded: if the server answered with 503
+        :raise SearchError: if the server answered with another error
+        """
+        try:
+            if since_id:
+                return self.api.search(q=query+self.filters, count=count, result_type='recent', max_id=max_id,
+                                       since_id=since_id, tweet_mode='extended', include_entities=False)
+            return self.api.search(q=query+self.filters, count=count, max_id=max_id,
+                                   tweet_mode='extended', result_type='recent', include_entities=False)
+        except tweepy.error.TweepError as error:
+            text = error.response.text if error.response is not None else str(error)
+            if text == 'status code = 503':
+                raise ServerOverloaded(text)
+            raise SearchError(text)
+
+
+class ReplayedTweet:
+    """
+    Stand-in of a tweepy status, with the attributes the fetcher reads.\n
+    """
+
+    def __init__(self, tweet):
+        """
+        Constructor of ReplayedTweet class.\n
+        :param tweet: dictionary form of a stored tweet (see TweetCodec.py)
+        """
+        self.id = int(tweet['id'])
+        self.created_at = tweet.get('date')
+        self.user = ReplayedUser(tweet)
+        self.retweet_count = tweet.get('retweet_count', 0)
+        self.favorite_count = tweet.get('favorite_count', 0)
+        self.lang = tweet.get('language')
+        self.full_text = tweet.get('full_text', '')
+
+
+class ReplayedUser:
+    """
+    Stand-in of a tweepy user, with the attributes the fetcher reads.\n
+    """
+
+    def __init__(self, tweet):
+        """
+        Constructor of ReplayedUser class.\n
+        :param tweet: dictionary form of a stored tweet (see TweetCodec.py)
+        """
+        self.screen_name = tweet.get('screen_name', '')
+        self.location = tweet.get('user_location', '')
+        self.followers_count = tweet.get('user_followers', 0)
+
+
+class ReplaySearch:
+    """
+    Backend serving tweets kept in memory, honouring count, max_id and since_id like the search API.\n
+    Failures can be injected at given requests or at random, every request can be delayed to simulate latency.
+    """
+
+    def __init__(self, latency=0.0, fail_at=None, overload_rate=0.0, parsing_rate=0.0, seed=None):
+        """
+        Constructor of ReplaySearch class.\n
+        :param latency: seconds every request takes
+        :param fail_at: dictionary of request number (counted from 1) -> OVERLOADED or PARSING
+        :param overload_rate: probability of a request failing with 503
+        :param parsing_rate: probability of a response failing to decode
+        :param seed: seed of the random failures
+        """
+        self.tweets = {}  # topic -> list of ReplayedTweet ordered from the newest to the oldest
+        self.latency = latency
+        self.fail_at = fail_at if fail_at else {}
+        self.overload_rate = overload_rate
+        self.parsing_rate = parsing_rate
+        self.random = random.Random(seed)
+        self.retry_delay = 0  # nothing to wait for, the failures are injected
+        self.requests = 0  # number of received requests
+        self.failures = 0  # number of injected failures
+        self.lock = Lock()  # guards the counters, the backend is shared by fetching threads
+
+    def add(self, topic, tweets):
+        """
+        Adds tweets of a topic, they can be newer or older than the ones already served.\n
+        :param topic: keyword(s) the tweets are found for
+        :param tweets: iterable of tweet dictionaries (see TweetCodec.py)
+        """
+        served = self.tweets.get(topic, [])
+        known = {tweet.id for tweet in served}
+        served.extend(ReplayedTweet(tweet) for tweet in tweets if int(tweet['id']) not in known)
+        served.sort(key=lambda tweet: tweet.id, reverse=True)
+        self.tweets[topic] = served
+
+    def record(self, topic):
+        """
+        Adds tweets of a topic stored in outputs/.\n
+        :param topic: stored topic
+        :return: number of tweets served for the topic
+        """
+        from TopicStorage import TopicStorage
+
+        tweets = []
+        for line in TopicStorage(topic).load().read():
+            try:
+                tweets.append(decode_line(line))
+            except (ValueError, IndexError):
+                pass
+        self.add(topic, tweets)
+        return len(self.tweets[topic])
+
+    def search(self, query, count=100, max_id=None, since_id=None):
+        """
+        Gives a page of tweets of a topic.\n
+        :param query: keyword(s) to search for
+        :param count: maximum number of tweets
+        :param max_id: id of the newest tweet to return (inclusive)
+        :param since_id: id of the newest tweet not to return (exclusive)
+        :return: list of ReplayedTweet
+        :raise ServerOverloaded: if an overload was injected
+        :raise JSONDecodeError: if a parsing error was injected
+        """
+        with self.lock:
+            self.requests += 1
+            failure = self.fail_at.get(self.requests)
+            if failure is None:
+                chance = self.random.random()
+                if chance < self.overload_rate:
+                    failure = OVERLOADED
+                elif chance < self.overload_rate + self.parsing_rate:
+                    failure = PARSING
+            if failure is not None:
+                self.failures += 1
+        if self.latency:
+            sleep(self.latency)
+        if failure == OVERLOADED:
+            raise ServerOverloaded('status code = 503')
+        if failure == PARSING:
+            raise JSONDecodeError('Injected parsing error', '', 0)
+
+        page = []
+        for tweet in self.tweets.get(query, []):
+            if max_id is not None and tweet.id > max_id:
+                continue
+            if since_id is not None and tweet.id <= since_id:
+                break
+            page.append(tweet)
+            if len(page) == count:
+                break
+        return page
+
+
+def synthetic_tweets(topic, count, newest_id=10**18, start=datetime.datetime(2020, 1, 1), seed=None):
+    """
+    Generates tweets of a topic, every one containing the topic in its text.\n
+    :param topic: keyword(s) of the tweets
+    :param count: number of tweets
+    :param newest_id: id of the newest generated tweet, older ones get lower ids
+    :param start: date of the oldest generated tweet
+    :param seed: seed of the generator
+    :return: list of tweet dictionaries ordered from the newest to the oldest
+    """
+    generator = random.Random(seed)
+    words = ['news', 'today', 'people', 'great', 'world', 'time', 'love', 'new', 'good', 'think']
+    tweets = []
+    for number in range(count):
+        tweets.append({
+            'id': newest_id - number,
+            'date': str(start + datetime.timedelta(seconds=count - number)),
+            'screen_name': 'user' + str(generator.randrange(count // 10 + 1)),
+            'user_location': '',
+            'user_followers': generator.randrange(10000),
+            'retweet_count': 0,
+            'favorite_count': 0,
+            'language': 'en',
+            'full_text': ' '.join([topic] + generator.sample(words, 5) + ['#' + generator.choice(words)])
+        })
+    return tweets
+
+
+def benchmark_fetch(backend, topics, workers=1, fresh=100):
+    """
+    Fetches topics served by a backend into an empty temporary outputs/ directory, then fetches again after
+    new tweets appeared, so both the full fetch and the head fetch with sealing are measured.\n
+    :param backend: ReplaySearch serving the topics
+    :param topics: topics to fetch
+    :param workers: number of topics fetched at the same time
+    :param fresh: number of new tweets added to every topic before the second fetch
+    :return: dictionary with times (in seconds), numbers of tweets and requests of both fetches
+    """
+    from TweetPeeker import TwitterFetcher
+
+    results = {}
+    directory = getcwd()
+    work = mkdtemp(prefix='fetch-benchmark-')
+    try:
+        chdir(work)
+        for run in ('full', 'head'):
+            if run == 'head':
+                for topic in topics:
+                    newest = backend.tweets[topic][0].id if backend.tweets.get(topic) else 10**18
+                    backend.add(topic, synthetic_tweets(topic, fresh, newest + fresh, seed=0))
+            fetcher = TwitterFetcher()
+            fetcher.backend = backend
+            fetcher.limiter = None  # the backend has no rate limit to respect
+            fetcher.topics = list(topics)
+            fetcher.set_workers(workers)
+            requests = backend.requests
+            start_time = time()
+            fetcher.fetch_topics()
+            results[run] = {'seconds': time() - start_time, 'requests': backend.requests - requests,
+                            'tweets': sum(len(backend.tweets.get(topic, [])) for topic in topics) if run == 'full'
+                            else fresh * len(topics)}
+    finally:
+        chdir(directory)
+        shutil.rmtree(work)
+    results['failures'] = backend.failures
+    return results
+
+
+if __name__ == '__main__':
+    from SearchBackend import ReplaySearch, benchmark_fetch, synthetic_tweets  # failures the fetcher catches
+
+    if len(sys.argv) < 2 or sys.argv[1] == '-h' or sys.argv[1] == '--help':
+        print('usage: python3 SearchBackend.py [-h] [-w 4] [-l 0.1] [-f 0.05] [-s 10000] a b c ...\n'
+              '\n'
+              'benchmarks fetching of topics a, b, c... replayed from outputs/ without network\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -w, --workers\t\t\t number of topics fetched at the same time\n'
+              '  -l, --latency\t\t\t seconds every request takes\n'
+              '  -f, --failures\t\t probability of a request failing with 503 or a parsing error\n'
+              '  -s, --synthetic\t\t number of generated tweets served for topics with no stored tweets\n'
+              '\n'
+              'Outputs are written to a temporary directory, stored topics are not changed.\n')
+        exit()
+
+    options = {'workers': 1, 'latency': 0.0, 'failures': 0.0, 'synthetic': 10000}
+    for option in list(options):
+        for flag in ['-' + option[0], '--' + option]:
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                try:
+                    options[option] = type(options[option])(sys.argv[index+1])
+                except (IndexError, ValueError):
+                    print('Pass {} in argument.'.format(option))
+                    exit()
+                del sys.argv[index:index+2]
+
+    replay = ReplaySearch(options['latency'], overload_rate=options['failures'] / 2,
+                          parsing_rate=options['failures'] / 2, seed=0)
+    topics = [arg.lower() for arg in sys.argv[1:] if arg[0] != '-']
+    for topic in topics:
+        if not path.exists('outputs/' + topic) and not path.exists('outputs/' + topic + '.txt'):
+            replay.add(topic, synthetic_tweets(topic, options['synthetic'], seed=0))
+        else:
+            replay.record(topic)
+
+    results = benchmark_fetch(replay, topics, options['workers'])
+    for run in ('full', 'head'):
+        seconds = results[run]['seconds']
+        print('\x1b[1;34;40m{}\x1b[0m fetch: {} tweets, {} requests in {} s ({} tweets/s).'.format(
+            run, results[run]['tweets'], results[run]['requests'], round(seconds, 3),
+            round(results[run]['tweets'] / seconds) if seconds else '-'))
+    print('Injected failures: {}'.format(results['failures']))
@@ -0,0 +1,303 @@
+import sys
+import sqlite3
+
+from os import path
+from time import time
+from TweetCodec import decode_line
+from Tokenizer import Tokenizer
+from TopicStorage import TopicStorage, SEALED, list_topics
+from TimeSeries import hour_of
+from Compression import open_stored
+
+"""
+Inverted index of stored tweets of a topic, kept in an SQLite file next to its segments (outputs/<topic>/search.db).
+Every term of a tweet (as split by the Extractor's tokenizer, lowercased) and its author (@screen_name) point to
+the segment and byte offset of the tweet's line, so a query reads only the matching lines.
+Sealed segments are indexed once, new ones are added (and compacted away ones dropped) before every query
+and after every fetch of a topic having an index, so the corpus is never rescanned.
+"""
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS segments (number INTEGER PRIMARY KEY, size INTEGER);
+CREATE TABLE IF NOT EXISTS tweets (doc INTEGER PRIMARY KEY, id INTEGER, segment INTEGER, offset INTEGER,
+                                   hour INTEGER, language TEXT);
+CREATE INDEX IF NOT EXISTS tweets_segment ON tweets (segment);
+CREATE TABLE IF NOT EXISTS postings (term TEXT, doc INTEGER, PRIMARY KEY (term, doc)) WITHOUT ROWID;
+'''
+OR = 'OR'  # separates alternatives of a query, terms of an alternative must all appear in the tweet
+
+
+def index_path(topic):
+    """
+    Gives path of the inverted index of a topic.\n
+    :param topic: indexed topic
+    :return: path to the index file
+    """
+    return 'outputs/' + topic + '/search.db'
+
+
+def parse_query(words):
+    """
+    Turns query words into alternatives of terms, i.e. "a b OR c" into [['a', 'b'], ['c']].\n
+    :param words: list of words, hashtags, @screen_names and OR separators
+    :return: list of alternatives, each one a list of lowercased terms
+    """
+    alternatives = [[]]
+    for word in words:
+        if word == OR:
+            alternatives.append([])
+        else:
+            alternatives[-1].append(word.lower())
+    return [terms for terms in alternatives if terms]
+
+
+class SearchIndex:
+    """
+    Inverted index of the sealed segments of a single topic.\n
+    """
+
+    def __init__(self, topic):
+        """
+        Constructor of SearchIndex class.\n
+        :param topic: the topic whose tweets are indexed
+        """
+        self.topic = topic
+        self.storage = TopicStorage(topic)
+        self.tokenizer = Tokenizer(topic)  # the same terms the Extractor counts
+        self.connection = None
+
+    def exists(self):
+        """
+        Checks if the topic was indexed before.\n
+        :return: True if there is an index file
+        """
+        return path.exists(index_path(self.topic))
+
+    def open(self):
+        """
+        Opens (creating if needed) the index file.\n
+        :return: the index itself
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(index_path(self.topic))
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(SCHEMA)
+        return self
+
+    def close(self):
+        """
+        Closes the index file.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def update(self):
+        """
+        Indexes sealed segments that are not indexed yet, drops segments that were compacted or removed.\n
+        :return: number of newly indexed tweets
+        """
+        self.storage.load()
+        if not self.storage.segments:
+            return 0
+        self.open()
+        sealed = {segment['number']: segment for segment in self.storage.readable() if segment['state'] == SEALED}
+        indexed = dict(self.connection.execute('SELECT number, size FROM segments'))
+        with self.connection:
+            for number, size in indexed.items():
+                if number not in sealed or sealed[number]['size'] != size:
+                    self.drop_segment(number)
+        added = 0
+        for number, segment in sealed.items():
+            if indexed.get(number) != segment['size']:
+                with self.connection:  # a segment at a time, an interrupted update keeps the finished ones
+                    added += self.index_segment(segment)
+        return added
+
+    def drop_segment(self, number):
+        """
+        Removes tweets of a segment from the index.\n
+        :param number: number of the segment
+        """
+        self.connection.execute('DELETE FROM postings WHERE doc IN (SELECT doc FROM tweets WHERE segment = ?)',
+                                (number,))
+        self.connection.execute('DELETE FROM tweets WHERE segment = ?', (number,))
+        self.connection.execute('DELETE FROM segments WHERE number = ?', (number,))
+
+    def index_segment(self, segment):
+        """
+        Adds tweets of a sealed segment to the index.\n
+        :param segment: segment description (see TopicStorage.py)
+        :return: number of indexed tweets
+        """
+        cursor = self.connection.cursor()
+        postings = []
+        offset = 0
+        tweets = 0
+        with open_stored(self.storage.segment_path(segment)) as file:
+            for line in file:
+                start = offset
+                offset += len(line)
+                try:
+                    tweet = decode_line(line.decode('utf-8'))
+                    cursor.execute('INSERT INTO tweets (id, segment, offset, hour, language) VALUES (?, ?, ?, ?, ?)',
+                                   (int(tweet['id']), segment['number'], start, hour_of(str(tweet.get('date', ''))),
+                                    tweet.get('language')))
+                except (ValueError, KeyError):
+                    continue
+                doc = cursor.lastrowid
+                terms = {term.lower() for term in self.tokenizer.terms(tweet.get('full_text', ''))}
+                terms.add('@' + str(tweet.get('screen_name', '')).lower())
+                postings.extend((term, doc) for term in terms)
+                tweets += 1
+        cursor.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?)', postings)
+        cursor.execute('INSERT OR REPLACE INTO segments VALUES (?, ?)', (segment['number'], segment['size']))
+        return tweets
+
+    def query(self, alternatives, language=None, since=None, until=None, limit=None):
+        """
+        Finds tweets containing all terms of any alternative.\n
+        :param alternatives: list of lists of lowercased terms (see parse_query), empty to match every tweet
+        :param language: language of the tweets, None for any
+        :param since: first hour of the tweets (see TimeSeries.py), None for any
+        :param until: last hour of the tweets, None for any
+        :param limit: maximum number of tweets, None for all of them
+        :return: list of (segment number, byte offset) pairs from the newest tweet to the oldest
+        """
+        self.open()
+        conditions = []
+        parameters = []
+        if alternatives:
+            compound = ' UNION '.join('SELECT doc FROM ({})'.format(  # compound operators have no precedence
+                ' INTERSECT '.join(['SELECT doc FROM postings WHERE term = ?'] * len(terms))) for terms in alternatives)
+            conditions.append('doc IN ({})'.format(compound))
+            parameters.extend(term for terms in alternatives for term in terms)
+        for condition, value in (('language = ?', language), ('hour >= ?', since), ('hour <= ?', until)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        query = 'SELECT MIN(segment), offset FROM tweets'  # offset of the row with the minimum
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' GROUP BY id ORDER BY id DESC'  # a tweet fetched twice is returned once
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        return self.connection.execute(query, parameters).fetchall()
+
+    def read(self, matches):
+        """
+        Reads matching tweets from their segments.\n
+        :param matches: list of (segment number, byte offset) pairs
+        :return: list of tweet dictionaries
+        """
+        segments = {segment['number']: segment for segment in self.storage.segments}  # paths depend on codecs
+        tweets = []
+        for number, offset in matches:
+            with open_stored(self.storage.segment_path(segments[number])) as file:
+                file.seek(offset)
+                tweets.append(decode_line(file.readline().decode('utf-8')))
+        return tweets
+
+    def search(self, words, language=None, since=None, until=None, limit=None):
+        """
+        Brings the index up to date and finds tweets matching a query.\n
+        :param words: query words (see parse_query)
+        :param language: language of the tweets, None for any
+        :param since: first hour of the tweets, None for any
+        :param until: last hour of the tweets, None for any
+        :param limit: maximum number of tweets, None for all of them
+        :return: list of tweet dictionaries from the newest to the oldest
+        """
+        self.update()
+        if not self.exists():
+            return []
+        return self.read(self.query(parse_query(words), language, since, until, limit))
+
+
+def index_topics(topic_list):
+    """
+    Builds or updates inverted indexes of passed topics, or of every stored topic if no topics passed.\n
+    :param topic_list: list of topics to index
+    """
+    for topic in topic_list if topic_list else list_topics():
+        t = time() * 1000
+        index = SearchIndex(topic)
+        added = index.update()
+        index.close()
+        print('Indexed \x1b[1;36;40m{}\x1b[0m new tweets of \x1b[1;34;40m{}\x1b[0m in {} ms.'.format(
+            added, topic, round(time() * 1000 - t, 3)))
+
+
+def parse_hour(date, last=False):
+    """
+    Turns a date passed in argument into an hour (see TimeSeries.py).\n
+    :param date: 'YYYY-MM-DD' or 'YYYY-MM-DD HH'
+    :param last: whether a whole day ends at its last hour rather than starting at its first one
+    :return: hour number, None if the date can not be parsed
+    """
+    if len(date) == len('YYYY-MM-DD'):
+        date += ' 23' if last else ' 00'
+    return hour_of(date)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and (sys.argv[1] == '-i' or sys.argv[1] == '--index'):
+        index_topics([arg.lower() for arg in sys.argv[2:] if arg[0] != '-'])
+        exit()
+
+    options = {'language': None, 'since': None, 'until': None, 'number': '20'}
+    for option in list(options):
+        for flag in ['-' + option[0], '--' + option]:
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                if len(sys.argv) == index+1:
+                    print('Pass {} in argument.'.format(option))
+                    exit()
+                options[option] = sys.argv[index+1]
+                del sys.argv[index:index+2]
+
+    if len(sys.argv) < 2 or sys.argv[1][0] == '-' or not options['number'].isdigit():
+        print('usage: python3 SearchIndex.py [-h] [-i [a b c...]]\n'
+              '       python3 SearchIndex.py [-l en] [-s 2020-06-01] [-u \'2020-06-07 12\'] [-n 20] topic [terms...]\n'
+              '\n'
+              'finds stored tweets of a topic containing all of the terms, alternatives are separated by OR\n'
+              '\n'
+              'positional arguments:\n'
+              '  topic\t\t\t\t topic to search in\n'
+              '  terms\t\t\t\t words, #hashtags or @screen_names of authors\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -i, --index [a,b...]\t\t builds or updates indexes of topics a, b, c...\n'
+              '  -l, --language\t\t language of the tweets\n'
+              '  -s, --since\t\t\t first day (or hour) of the tweets\n'
+              '  -u, --until\t\t\t last day (or hour) of the tweets\n'
+              '  -n, --number\t\t\t maximum number of printed tweets, default 20\n'
+              '\n'
+              'If no topics passed to --index, every stored topic is indexed.\n'
+              'The index of a topic is built by its first search and updated after every fetch of the topic.\n'
+              '\n'
+              'example usages:\n'
+              'python3 SearchIndex.py example vaccine\n'
+              'python3 SearchIndex.py example \'#news\' world OR @someone\n'
+              'python3 SearchIndex.py -l en -s 2020-06-01 -u 2020-06-03 example\n')
+        exit()
+
+    topic = sys.argv[1].lower()
+    since = parse_hour(options['since']) if options['since'] else None
+    until = parse_hour(options['until'], last=True) if options['until'] else None
+    if (options['since'] and since is None) or (options['until'] and until is None):
+        print('Pass dates as YYYY-MM-DD or \'YYYY-MM-DD HH\'.')
+        exit()
+
+    t = time() * 1000
+    index = SearchIndex(topic)
+    tweets = index.search(sys.argv[2:], options['language'], since, until, int(options['number']))
+    index.close()
+    for tweet in tweets:
+        print('\x1b[35m{}\x1b[0m \x1b[1;34;40m@{}\x1b[0m ({}): {}'.format(
+            tweet.get('date'), tweet.get('screen_name'), tweet.get('language'),
+            tweet.get('full_text', '').replace('\n', ' ')))
+    print('Found \x1b[1;36;40m{}\x1b[0m tweets about \x1b[1;34;40m{}\x1b[0m in {} ms.'.format(
+        len(tweets), topic, round(time() * 1000 - t, 3)))
@@ -0,0 +1,132 @@
+import sys
+
+from array import array
+from datetime import date
+
+"""
+Hourly numbers of tweets, counted by Extractor.py and plotted by PlotTwister.py.
+A series keeps consecutive hour buckets in an array starting at its first hour (counted from 1970-01-01 00:00 UTC),
+so adding new tweets only extends it and a range of hours is a slice, which the analysis state reads straight from
+the stored bytes (see AnalysisState.hourly). Buckets older than the retention window are dropped.
+"""
+
+DEFAULT_RETENTION = 24 * 90  # hours kept in a series
+HOUR_CACHE_SIZE = 100000  # maximum number of memoized date prefixes, the memo is cleared when it gets bigger
+ITEM_SIZE = array('I').itemsize
+EPOCH = date(1970, 1, 1).toordinal()
+
+hours = {}  # 'YYYY-MM-DD HH' -> hour number
+
+
+def hour_of(created_at):
+    """
+    Gives the hour bucket of a tweet date, memoized so every hour is parsed only once.\n
+    :param created_at: date of the tweet, 'YYYY-MM-DD HH:MM:SS'
+    :return: number of hours since 1970-01-01 00:00, None if the date can not be parsed
+    """
+    prefix = created_at[:13]
+    try:
+        return hours[prefix]
+    except KeyError:
+        if len(hours) > HOUR_CACHE_SIZE:
+            hours.clear()
+        try:
+            day = date(int(prefix[:4]), int(prefix[5:7]), int(prefix[8:10]))
+            hour = (day.toordinal() - EPOCH) * 24 + int(prefix[11:13])
+        except ValueError:
+            hour = None
+        hours[prefix] = hour
+        return hour
+
+
+def hour_label(hour):
+    """
+    Turns an hour bucket back into a readable date.\n
+    :param hour: number of hours since 1970-01-01 00:00
+    :return: 'YYYY-MM-DD HH:00'
+    """
+    return '{} {:02d}:00'.format(date.fromordinal(EPOCH + hour // 24), hour % 24)
+
+
+class HourlySeries:
+    """
+    Numbers of tweets in consecutive hours.\n
+    """
+
+    def __init__(self, start=None, counts=None):
+        """
+        Constructor of HourlySeries class.\n
+        :param start: hour of the first bucket, None for an empty series
+        :param counts: array('I') of bucket counts
+        """
+        self.start = start
+        self.counts = counts if counts is not None else array('I')
+
+    def __len__(self):
+        return len(self.counts)
+
+    def end(self):
+        """
+        Gives the hour following the last bucket.\n
+        :return: hour number, None for an empty series
+        """
+        return self.start + len(self.counts) if self.start is not None else None
+
+    def add(self, hour, count=1):
+        """
+        Adds tweets to a bucket, extending the series if the hour is outside of it.\n
+        :param hour: hour number
+        :param count: number of tweets
+        """
+        if self.start is None:
+            self.start = hour
+        if hour < self.start:
+            self.counts[0:0] = array('I', bytes(ITEM_SIZE * (self.start - hour)))
+            self.start = hour
+        elif hour >= self.end():
+            self.counts.extend(array('I', bytes(ITEM_SIZE * (hour - self.end() + 1))))
+        self.counts[hour - self.start] += count
+
+    def trim(self, retention, end=None):
+        """
+        Drops buckets older than the retention window.\n
+        :param retention: number of hours to keep
+        :param end: hour following the window, the end of the series by default
+        """
+        end = end if end is not None else self.end()
+        if self.start is not None and self.start < end - retention:
+            del self.counts[:min(len(self.counts), end - retention - self.start)]
+            self.start = end - retention
+
+    def to_bytes(self):
+        """
+        Gives the counts in stored form (little endian).\n
+        :return: bytes
+        """
+        counts = array('I', self.counts)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return counts.tobytes()
+
+    @staticmethod
+    def from_bytes(start, data):
+        """
+        Creates a series from its stored form.\n
+        :param start: hour of the first bucket
+        :param data: bytes written by to_bytes
+        :return: HourlySeries
+        """
+        counts = array('I')
+        counts.frombytes(data)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return HourlySeries(start, counts)
+
+    def labeled(self, empty=False):
+        """
+        Gives the series as a readable dictionary.\n
+        :param empty: whether to include hours without tweets
+        :return: dictionary 'YYYY-MM-DD HH:00' -> count
+        """
+        return {hour_label(self.start + offset): count for offset, count in enumerate(self.counts) if count or empty}
+
@@ -0,0 +1,277 @@
+import sys
+
+from time import time
+from os import path
+
+"""
+Tokenizers turning tweet texts into the terms counted by Extractor.py.
+Every tokenizer exposes terms(text), which yields normalized words and hashtags (hashtags keep their leading #),
+so the Extractor (or any other consumer) can be switched to a different implementation.
+Words blacklisted for every language are kept in assets/word_blacklist.txt, stopwords of a single language
+in assets/word_blacklist_<language>.txt; a tokenizer of a language drops both before they are counted.
+Running this script benchmarks the compiled tokenizer against the reference one.
+"""
+
+BLACKLIST = 'assets/word_blacklist.txt'
+SNOWBALL_LANGUAGES = {'ar': 'arabic', 'da': 'danish', 'de': 'german', 'en': 'english', 'es': 'spanish',
+                      'fi': 'finnish', 'fr': 'french', 'hu': 'hungarian', 'it': 'italian', 'nl': 'dutch',
+                      'no': 'norwegian', 'pt': 'portuguese', 'ro': 'romanian', 'ru': 'russian', 'sv': 'swedish'}
+
+_stopwords = {}  # language -> (modification times of its files, frozenset of words), read again after a change
+
+class LegacyTokenizer:
+    """
+    Reference tokenizer reproducing the original chain of str.replace calls of Extractor.analyze word by word.\n
+    Kept for benchmarking and for checking that other tokenizers produce identical counts.
+    """
+
+    def __init__(self, topic):
+        """
+        Constructor of LegacyTokenizer class.\n
+        :param topic: the topic whose parts are not counted as words
+        """
+        self.topic = topic
+
+    def terms(self, text):
+        """
+        Splits text into normalized terms.\n
+        :param text: full text of a tweet
+        :return: generator of words and hashtags
+        """
+        words = text.replace(',', '').replace('.', '').replace('!', '') \
+            .replace('?', '').replace('"', '').replace('’', '\'').replace('\' ', ' ') \
+            .replace(';', ' ').replace('‘', ' ').replace('*', ' ').replace(': ', ' ') \
+            .replace(' (', ' ').replace(') ', ' ').replace(' -', ' ').replace(' i\'', ' I\'').split()
+        for word in words:
+            if word.lower() not in self.topic and 'http' not in word:
+                if len(word) > 1:
+                    if word[0] == '#':
+                        yield word.lower()
+                    elif len(word) > 2 or (len(word) == 2 and word == word.upper()):
+                        if word[:-1] != word[:-1].upper():
+                            word = word.lower()
+                        yield word
+
+
+class Tokenizer:
+    """
+    Compiled tokenizer giving the same terms as LegacyTokenizer.\n
+    Preprocessing keeps the order of the original replacements (it changes the output), but skips the ones
+    that can not apply to the text, i.e. unicode quotes in ascii-only texts.
+    The per-word decision is memoized, so every distinct word is normalized only once, stopword lookups
+    and stemming included.
+    """
+
+    def __init__(self, topic, cache_size=1000000, language=None, stem=False):
+        """
+        Constructor of Tokenizer class.\n
+        :param topic: the topic whose parts are not counted as words
+        :param cache_size: maximum number of memoized words, the memo is cleared when it gets bigger
+        :param language: language of the texts, its stopwords are dropped, None keeps every word
+        :param stem: whether to reduce lowercase words to their stems (requires nltk), e.g. 'elections' to 'elect'
+        """
+        self.topic = topic
+        self.cache_size = cache_size
+        self.cache = {}  # word -> normalized term, or None if the word is not counted
+        self.stopwords = load_stopwords(language) if language is not None else frozenset()
+        self.stemmer = stemmer_for(language) if stem else None
+
+    def normalize(self, word):
+        """
+        Decides whether a word is counted and in which form.\n
+        :param word: word split from a preprocessed text
+        :return: normalized term or None if the word is skipped
+        """
+        lower = word.lower()
+        if lower in self.topic or 'http' in word or len(word) < 2:
+            return None
+        if word[0] == '#':
+            return lower
+        if len(word) > 2 or word == word.upper():
+            if word[:-1] != word[:-1].upper():
+                word = lower
+            if word in self.stopwords:
+                return None
+            if self.stemmer is not None and word == lower:
+                return self.stemmer(word)
+            return word
+        return None
+
+    def split(self, text):
+        """
+        Preprocesses text and splits it into raw words.\n
+        :param text: full text of a tweet
+        :return: list of words
+        """
+        text = text.replace(',', '').replace('.', '').replace('!', '').replace('?', '').replace('"', '')
+        if text.isascii():
+            text = text.replace('\' ', ' ').replace(';', ' ').replace('*', ' ')
+        else:
+            text = text.replace('’', '\'').replace('\' ', ' ').replace(';', ' ').replace('‘', ' ').replace('*', ' ')
+        if ':' in text:
+            text = text.replace(': ', ' ')
+        if '(' in text or ')' in text:
+            text = text.replace(' (', ' ').replace(') ', ' ')
+        if '-' in text:
+            text = text.replace(' -', ' ')
+        if ' i\'' in text:
+            text = text.replace(' i\'', ' I\'')
+        return text.split()
+
+    def terms(self, text):
+        """
+        Splits text into normalized terms.\n
+        :param text: full text of a tweet
+        :return: list of words and hashtags
+        """
+        cache = self.cache
+        if len(cache) > self.cache_size:
+            cache.clear()
+        terms = []
+        for word in self.split(text):
+            try:
+                term = cache[word]
+            except KeyError:
+                term = cache[word] = self.normalize(word)
+            if term is not None:
+                terms.append(term)
+        return terms
+
+
+def stopwords_path(language=None):
+    """
+    Gives path of the stopword list of a language.\n
+    :param language: 2 letters long language code, None for the words blacklisted in every language
+    :return: path of the list, the file may not exist
+    """
+    return BLACKLIST if language is None else BLACKLIST[:-len('.txt')] + '_' + language + '.txt'
+
+
+def load_stopwords(language):
+    """
+    Gives words not counted in a language: the ones blacklisted in every language and its own stopwords.\n
+    The set is read once and read again only when one of the lists changes.\n
+    :param language: 2 letters long language code
+    :return: frozenset of words
+    """
+    files = (stopwords_path(), stopwords_path(language))
+    times = tuple(path.getmtime(file) if path.exists(file) else None for file in files)
+    loaded = _stopwords.get(language)
+    if loaded is None or loaded[0] != times:
+        words = set()
+        for file_path, modified in zip(files, times):
+            if modified is not None:
+                with open(file_path, 'r') as file:
+                    words.update(file.read().split())
+        loaded = _stopwords[language] = (times, frozenset(words))
+    return loaded[1]
+
+
+def add_stopwords(words, language=None):
+    """
+    Adds words to the stopword list of a language.\n
+    :param words: list of words, normalized like tokenized ones (lowercased unless written in capitals)
+    :param language: 2 letters long language code, None to blacklist the words in every language
+    :return: list of words that were not in the list yet
+    """
+    words = [word if word[:-1] == word[:-1].upper() else word.lower() for word in words]
+    file_path = stopwords_path(language)
+    try:
+        with open(file_path, 'r') as file:
+            listed = file.read().split()
+    except FileNotFoundError:
+        listed = []
+    added = [word for word in dict.fromkeys(words) if word not in listed]
+    if added:
+        with open(file_path, 'w') as file:
+            file.write('\n'.join(listed + added))
+    return added
+
+
+def stemmer_for(language):
+    """
+    Creates a memoizable stemming function of a language, Snowball stemmers of nltk are used if it is installed.\n
+    :param language: 2 letters long language code
+    :return: function turning a word into its stem or None if the language can not be stemmed
+    """
+    if language not in SNOWBALL_LANGUAGES:
+        return None
+    try:
+        from nltk.stem.snowball import SnowballStemmer
+    except ImportError:
+        return None
+    return SnowballStemmer(SNOWBALL_LANGUAGES[language]).stem
+
+
+def count_terms(tokenizer, texts):
+    """
+    Counts terms of passed texts the way Extractor does.\n
+    :param tokenizer: tokenizer to use
+    :param texts: list of tweet texts
+    :return: tuple of words and hashtags dictionaries
+    """
+    words = {}
+    hashtags = {}
+    for text in texts:
+        for term in tokenizer.terms(text):
+            if term[0] == '#':
+                hashtags[term] = hashtags.get(term, 0) + 1
+            else:
+                words[term] = words.get(term, 0) + 1
+    return words, hashtags
+
+
+def benchmark(texts, topic, repeat=3):
+    """
+    Times both tokenizers on the same texts and checks they produce identical counts.\n
+    :param texts: list of tweet texts
+    :param topic: topic used by the tokenizers
+    :param repeat: how many times each tokenizer is run, the best time is taken
+    :return: dictionary with best times (in seconds) of both tokenizers and the comparison result
+    """
+    results = {}
+    counts = {}
+    for name, tokenizer_class in (('legacy', LegacyTokenizer), ('compiled', Tokenizer)):
+        best = None
+        for _ in range(repeat):
+            tokenizer = tokenizer_class(topic)
+            start_time = time()
+            counts[name] = count_terms(tokenizer, texts)
+            elapsed = time() - start_time
+            best = elapsed if best is None or elapsed < best else best
+        results[name] = best
+    results['identical'] = counts['legacy'] == counts['compiled']
+    return results
+
+
+if __name__ == '__main__':
+    from TweetCodec import decode_line
+    from TopicStorage import TopicStorage
+
+    if len(sys.argv) < 2 or sys.argv[1][0] == '-':
+        print('usage: python3 Tokenizer.py topic [language]\n'
+              '\n'
+              'benchmarks tokenizers on stored tweets of a topic written in language (default en)\n')
+        exit()
+    topic = sys.argv[1].lower()
+    language = sys.argv[2].lower() if len(sys.argv) > 2 else 'en'
+
+    texts = []
+    for line in TopicStorage(topic).load().read():
+        try:
+            tweet = decode_line(line)
+            if tweet['language'] == language:
+                texts.append(tweet['full_text'])
+        except (ValueError, KeyError):
+            pass
+    if not texts:
+        print('Could not load tweets of the topic.')
+        exit()
+
+    results = benchmark(texts, topic)
+    print('Tokenized \x1b[1;36;40m{}\x1b[0m texts about \x1b[1;34;40m{}\x1b[0m.'.format(len(texts), topic))
+    print('legacy:   {} ms.'.format(round(results['legacy'] * 1000, 3)))
+    print('compiled: {} ms. ({}x)'.format(round(results['compiled'] * 1000, 3),
+                                         round(results['legacy'] / results['compiled'], 2) if results['compiled'] else '-'))
+    print('\x1b[1;32;40mCounts are identical.\x1b[0m' if results['identical'] else
+          '\x1b[1;31;40mCounts differ!\x1b[0m')
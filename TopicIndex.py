@@ -0,0 +1,184 @@
+import json
+
+from os import path, replace, remove, stat
+from TweetCodec import decode_line
+from Compression import open_stored, plain_path
+
+"""
+Sidecar index of a topic file (i.e. a segment, outputs/<topic>/000001.txt -> outputs/<topic>/000001.idx).
+Keeps the newest and oldest tweet id, number of lines and id -> byte offset checkpoints, so the fetcher
+does not have to read the file to continue fetching and the extractor can seek to already analyzed tweets.
+The index is maintained on every append and compaction, a stale or missing index is rebuilt from the file.
+Offsets and size count uncompressed bytes, a compressed segment (000001.txt.gz) shares the index of the plain one.
+"""
+
+CHECKPOINT_INTERVAL = 10000  # lines between two regular checkpoints
+
+
+def index_path(file_path):
+    """
+    Gives path of the index belonging to a topic file.\n
+    :param file_path: path to the topic file
+    :return: path to the index file
+    """
+    file_path = plain_path(file_path)
+    return file_path[:-len('.txt')] + '.idx' if file_path.endswith('.txt') else file_path + '.idx'
+
+
+class TopicIndex:
+    """
+    Index of a single topic file, tweets in the file are ordered from the newest to the oldest.\n
+    """
+
+    def __init__(self, file_path):
+        """
+        Constructor of TopicIndex class.\n
+        :param file_path: path to the indexed topic file
+        """
+        self.file_path = file_path
+        self.max_id = None  # id of the newest tweet (first line)
+        self.min_id = None  # id of the oldest tweet (last line)
+        self.lines = 0  # number of tweets in the file
+        self.size = 0  # size of the (uncompressed) content in bytes
+        self.stored = 0  # size of the file on disk
+        self.mtime = None  # modification time of the file when the index was saved
+        self.checkpoints = []  # [tweet id, byte offset of its line] pairs, ordered by offset
+
+    def load(self):
+        """
+        Loads the index from disk, rebuilds and saves it if it is missing or does not match the file.\n
+        :return: the index itself
+        """
+        try:
+            with open(index_path(self.file_path), 'r') as file:
+                content = json.load(file)
+            self.max_id = content['max_id']
+            self.min_id = content['min_id']
+            self.lines = content['lines']
+            self.size = content['size']
+            self.stored = content.get('stored', content['size'])  # indexes of older versions had plain files only
+            self.mtime = content['mtime']
+            self.checkpoints = content['checkpoints']
+            if self.is_current():
+                return self
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        self.rebuild()
+        if self.lines:
+            self.save()
+        return self
+
+    def is_current(self):
+        """
+        Checks if the index describes the file as it is on disk.\n
+        :return: True if size and modification time of the file match the index
+        """
+        try:
+            info = stat(self.file_path)
+            return info.st_size == self.stored and info.st_mtime_ns == self.mtime
+        except FileNotFoundError:
+            return self.size == 0
+
+    def rebuild(self):
+        """
+        Builds the index by reading the whole file, only lines at checkpoints are decoded.
+        """
+        self.__init__(self.file_path)
+        last_line = None
+        try:
+            with open_stored(self.file_path) as file:
+                for line in file:
+                    if self.lines % CHECKPOINT_INTERVAL == 0:
+                        self.add_checkpoint(line)
+                    last_line = line
+                    self.size += len(line)
+                    self.lines += 1
+        except FileNotFoundError:
+            return
+        if last_line is not None:
+            try:
+                self.min_id = int(decode_line(last_line.decode('utf-8'))['id'])
+            except (ValueError, KeyError):
+                pass
+        self.stored = stat(self.file_path).st_size
+        self.mtime = stat(self.file_path).st_mtime_ns
+
+    def add_checkpoint(self, line):
+        """
+        Adds a checkpoint for a line starting at the current end of the indexed content.\n
+        :param line: line in bytes
+        """
+        try:
+            tweet_id = int(decode_line(line.decode('utf-8'))['id'])
+        except (ValueError, KeyError):
+            return
+        self.checkpoints.append([tweet_id, self.size])
+        if self.max_id is None:
+            self.max_id = tweet_id
+
+    def append(self, tweets):
+        """
+        Registers lines that were just appended to the end of the file.\n
+        :param tweets: list of (tweet id, encoded line) pairs in the order they were written
+        """
+        for tweet_id, line in tweets:
+            tweet_id = int(tweet_id)
+            if self.lines % CHECKPOINT_INTERVAL == 0:
+                self.checkpoints.append([tweet_id, self.size])
+            self.max_id = tweet_id if self.max_id is None else max(self.max_id, tweet_id)
+            self.min_id = tweet_id if self.min_id is None else min(self.min_id, tweet_id)
+            self.size += len(line.encode('utf-8'))
+            self.lines += 1
+
+    def extend(self, other):
+        """
+        Registers content of another topic file appended to the end of this one (merging files).\n
+        The first line of the other file always becomes a checkpoint.\n
+        :param other: index of the appended file
+        """
+        for tweet_id, offset in other.checkpoints:
+            self.checkpoints.append([tweet_id, offset + self.size])
+        for tweet_id in (other.max_id, other.min_id):
+            if tweet_id is not None:
+                self.max_id = tweet_id if self.max_id is None else max(self.max_id, tweet_id)
+                self.min_id = tweet_id if self.min_id is None else min(self.min_id, tweet_id)
+        self.lines += other.lines
+        self.size += other.size
+
+    def offset_of(self, tweet_id):
+        """
+        Finds byte offset of a tweet's line, only tweets at checkpoints can be found.\n
+        :param tweet_id: id of the tweet
+        :return: offset of the line or None if the tweet is not a checkpoint
+        """
+        if tweet_id is None:
+            return None
+        for checkpoint_id, offset in self.checkpoints:
+            if checkpoint_id == tweet_id:
+                return offset
+        return None
+
+    def save(self):
+        """
+        Saves the index next to the topic file, replacing the previous one at once.
+        """
+        try:
+            info = stat(self.file_path)
+            self.stored = info.st_size
+            self.mtime = info.st_mtime_ns
+        except FileNotFoundError:
+            self.stored = 0
+            self.mtime = None
+        content = {'max_id': self.max_id, 'min_id': self.min_id, 'lines': self.lines, 'size': self.size,
+                   'stored': self.stored, 'mtime': self.mtime, 'checkpoints': self.checkpoints}
+        with open(index_path(self.file_path) + '.tmp', 'w') as file:
+            json.dump(content, file)
+        replace(index_path(self.file_path) + '.tmp', index_path(self.file_path))
+
+    def remove(self):
+        """
+        Removes the index file from disk.
+        """
+        if path.exists(index_path(self.file_path)):
+            remove(index_path(self.file_path))
+
@@ -0,0 +1,291 @@
+import sys
+
+from os import path, stat
+from time import time
+from AnalysisState import AnalysisState, WORDS, HASHTAGS, USERS, DATES, LANGUAGES, JOURNAL_SUFFIXES, analyzed_languages
+from UserTable import HyperLogLog
+
+"""
+Questions spanning several topics, answered from their analysis states (see AnalysisState.py) without exporting them:
+combined most frequent words and hashtags, users shared by topics, dates series aligned to common days and shares
+of languages. States are opened lazily, answers are cached until a state changes (its files or its last tweet).
+The most frequent terms of several topics are merged from the ranking index of every state: terms are read from the
+most frequent ones on and looked up in the other states by their key, reading stops once no unread term can make it
+into the top (threshold algorithm), so only a small prefix of every state is read. Shared users are joined inside
+SQLite, users estimated by HyperLogLog are compared by merging their registers.
+"""
+
+MERGE_BATCH = 100  # terms read from every state in a single round of merging
+
+
+class TopicQuery:
+    """
+    Analysis states of several topics in a language, with cached answers to questions comparing them.\n
+    """
+
+    def __init__(self, topics, language='en'):
+        """
+        Constructor of TopicQuery class, no state is opened yet.\n
+        :param topics: list of compared topics
+        :param language: language of the analyses, words and hashtags depend on it
+        """
+        self.topics = list(topics)
+        self.language = language
+        self.states = {}  # topic -> opened AnalysisState
+        self.cache = {}  # question -> (fingerprints of the involved states, answer)
+
+    def missing(self):
+        """
+        Lists topics that were not analyzed in the language.\n
+        :return: list of topics
+        """
+        return [topic for topic in self.topics if not AnalysisState(topic, self.language).exists()]
+
+    def state(self, topic):
+        """
+        Gives the opened state of a topic, a json analysis is imported the first time.\n
+        :param topic: one of the topics
+        :return: AnalysisState
+        """
+        if topic not in self.states:
+            state = AnalysisState(topic, self.language)
+            if state.load() is None:
+                raise FileNotFoundError('{} was not analyzed in {}'.format(topic, self.language))
+            self.states[topic] = state
+        return self.states[topic]
+
+    def fingerprint(self, topic):
+        """
+        Tells a version of a topic's state apart from others, its files change with every save.\n
+        :param topic: one of the topics
+        :return: tuple of modification times and sizes of the state and its journal, with the last analyzed tweet
+        """
+        state = self.state(topic)
+        files = []
+        for suffix in ('',) + JOURNAL_SUFFIXES[:1]:
+            if path.exists(state.path + suffix):
+                info = stat(state.path + suffix)
+                files += [info.st_mtime_ns, info.st_size]
+        row = state.connection.execute('SELECT value FROM meta WHERE key = ?', ('last_id',)).fetchone()
+        return tuple(files) + (row[0] if row else None,)
+
+    def cached(self, question, topics, answer):
+        """
+        Gives the cached answer to a question while the involved states did not change, answers it otherwise.\n
+        :param question: hashable description of the question
+        :param topics: topics the answer depends on
+        :param answer: function answering the question
+        :return: the answer
+        """
+        fingerprints = tuple(self.fingerprint(topic) for topic in topics)
+        entry = self.cache.get((question, tuple(topics)))
+        if entry is not None and entry[0] == fingerprints:
+            return entry[1]
+        result = answer()
+        self.cache[(question, tuple(topics))] = (fingerprints, result)
+        return result
+
+    def close(self):
+        """
+        Closes the opened states, cached answers are kept.
+        """
+        for state in self.states.values():
+            state.close()
+        self.states = {}
+
+    def top_terms(self, kind=WORDS, k=10, topics=None):
+        """
+        Gives the most frequent words or hashtags of the topics taken together.\n
+        :param kind: WORDS or HASHTAGS
+        :param k: number of terms
+        :param topics: compared topics, all of them by default
+        :return: list of (term, total count, list of counts in every topic), the most frequent first
+        """
+        topics = topics if topics is not None else self.topics
+        return self.cached(('top', kind, k), topics, lambda: self.merge_top(kind, k, topics))
+
+    def merge_top(self, kind, k, topics):
+        """
+        Merges ranked counters of the topics until the top terms are known, see top_terms.
+        """
+        if k < 1:
+            return []
+        states = [self.state(topic) for topic in topics]
+        cursors = [state.connection.execute('SELECT key, count FROM counters WHERE kind = ? ORDER BY count DESC, key',
+                                            (kind,)) for state in states]
+        last = [0] * len(states)  # count of the last read term of every state, no unread term counts more there
+        exhausted = [False] * len(states)
+        totals = {}  # term -> list of counts in every state
+        while not all(exhausted):
+            new_terms = []
+            for number, cursor in enumerate(cursors):
+                if exhausted[number]:
+                    continue
+                rows = cursor.fetchmany(MERGE_BATCH)
+                if len(rows) < MERGE_BATCH:
+                    exhausted[number] = True
+                    last[number] = 0  # every term of the state was read
+                else:
+                    last[number] = rows[-1][1]
+                for term, _ in rows:
+                    if term not in totals:
+                        totals[term] = None
+                        new_terms.append(term)
+            found = [state.counts(kind, new_terms) for state in states]
+            for term in new_terms:
+                totals[term] = [counts.get(term, 0) for counts in found]
+            if len(totals) >= k:
+                kth = sorted((sum(counts) for counts in totals.values()), reverse=True)[k - 1]
+                if kth > sum(last):  # an unread term counts at most the last read count in every state (ties by term)
+                    break
+        for cursor in cursors:
+            cursor.close()
+        ranking = sorted(totals.items(), key=lambda item: (-sum(item[1]), item[0]))[:k]
+        return [(term, sum(counts), counts) for term, counts in ranking]
+
+    def user_overlap(self, topics=None):
+        """
+        Gives numbers of users who posted about both topics of every pair.\n
+        :param topics: compared topics, all of them by default
+        :return: dictionary (topic, other topic) -> {'shared': users, 'jaccard': shared / users of either topic,
+                 'estimated': whether users are estimated by HyperLogLog}
+        """
+        topics = topics if topics is not None else self.topics
+        overlap = {}
+        for number, topic in enumerate(topics):
+            for other in topics[number + 1:]:
+                overlap[(topic, other)] = self.cached((USERS,), [topic, other],
+                                                      lambda: self.shared_users(topic, other))
+        return overlap
+
+    def shared_users(self, topic, other):
+        """
+        Counts users of both topics, by a join of their counters or by their HyperLogLog estimates.\n
+        :param topic: one of the topics
+        :param other: another topic
+        :return: see user_overlap
+        """
+        state, other_state = self.state(topic), self.state(other)
+        first, second = state.distinct_users(), other_state.distinct_users()
+        precisions = [state.load()['users_precision'], other_state.load()['users_precision']]
+        if any(precisions):
+            precision = max(precision for precision in precisions if precision)
+            union = HyperLogLog(precision)
+            for current in (state, other_state):
+                estimate = HyperLogLog(precision)
+                current.load_users(estimate)  # counted users are added one by one
+                union.merge(estimate)
+            shared = min(max(0, first + second - round(union.estimate())), first, second)  # estimates may disagree
+        else:
+            state.connection.execute('ATTACH DATABASE ? AS other', (other_state.path,))
+            try:
+                shared = state.connection.execute('SELECT COUNT(*) FROM counters c JOIN other.counters o '
+                                                  'ON o.kind = c.kind AND o.key = c.key WHERE c.kind = ?',
+                                                  (USERS,)).fetchone()[0]
+            finally:
+                state.connection.execute('DETACH DATABASE other')
+        either = first + second - shared
+        return {'shared': shared, 'jaccard': round(shared / either, 6) if either else 0., 'estimated': any(precisions)}
+
+    def dates(self, topics=None):
+        """
+        Aligns numbers of tweets per day of the topics to common days.\n
+        :param topics: compared topics, all of them by default
+        :return: tuple of the sorted list of days and dictionary topic -> list of numbers of tweets on these days
+        """
+        topics = topics if topics is not None else self.topics
+        series = {topic: self.cached((DATES,), [topic], lambda: self.state(topic).counters(DATES)) for topic in topics}
+        days = sorted(set().union(*series.values()))
+        return days, {topic: [counts.get(day, 0) for day in days] for topic, counts in series.items()}
+
+    def language_shares(self, topics=None):
+        """
+        Gives shares of languages in tweets of every topic.\n
+        :param topics: compared topics, all of them by default
+        :return: dictionary topic -> {language: share of tweets}, languages from the most frequent one
+        """
+        topics = topics if topics is not None else self.topics
+        shares = {}
+        for topic in topics:
+            languages = self.cached((LANGUAGES,), [topic], lambda: self.state(topic).counters(LANGUAGES))
+            total = sum(languages.values())
+            shares[topic] = {language: round(count / total, 6) for language, count in languages.items() if total}
+        return shares
+
+
+def print_comparison(query, k=10, questions=(WORDS, HASHTAGS, USERS, DATES, LANGUAGES)):
+    """
+    Prints answers to questions comparing the topics of a query.\n
+    :param query: TopicQuery of analyzed topics
+    :param k: number of printed terms
+    :param questions: kinds of compared statistics
+    """
+    start_time = time()
+    for kind in (WORDS, HASHTAGS):
+        if kind in questions:
+            print('\x1b[1;34;40mTop {} {}\x1b[0m ({})'.format(k, kind, ', '.join(query.topics)))
+            for term, total, counts in query.top_terms(kind, k):
+                print('{:<24} {:>10}  {}'.format(term, total, ' '.join('{:>8}'.format(count) for count in counts)))
+    if USERS in questions and len(query.topics) > 1:
+        print('\x1b[1;34;40mShared users\x1b[0m')
+        for (topic, other), overlap in query.user_overlap().items():
+            print('{} & {}: {}{} users, jaccard {}'.format(topic, other, '~' if overlap['estimated'] else '',
+                                                          overlap['shared'], overlap['jaccard']))
+    if DATES in questions:
+        days, series = query.dates()
+        print('\x1b[1;34;40mTweets per day\x1b[0m')
+        print('{:<12} {}'.format('', ' '.join('{:>10}'.format(topic[:10]) for topic in series)))
+        for number, day in enumerate(days):
+            print('{:<12} {}'.format(day, ' '.join('{:>10}'.format(counts[number]) for counts in series.values())))
+    if LANGUAGES in questions:
+        print('\x1b[1;34;40mLanguage shares\x1b[0m')
+        for topic, shares in query.language_shares().items():
+            print('{}: {}'.format(topic, ', '.join('{} {}%'.format(language, round(100 * share, 1))
+                                                   for language, share in list(shares.items())[:5])))
+    print('Compared in \x1b[1;36;40m{}\x1b[0m ms.'.format(round((time() - start_time) * 1000, 3)))
+
+
+if __name__ == '__main__':
+    options = {'language': 'en', 'k': '10'}
+    for option, flags in (('language', ['-l', '--language']), ('k', ['-k', '--top-k'])):
+        for flag in flags:
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                if len(sys.argv) == index+1:
+                    print('Pass {} in argument.'.format(option))
+                    exit()
+                options[option] = sys.argv[index+1]
+                del sys.argv[index:index+2]
+    questions = [kind for kind in (WORDS, HASHTAGS, USERS, DATES, LANGUAGES) if '--' + kind in sys.argv]
+    topics = [arg.lower() for arg in sys.argv[1:] if arg[0] != '-']
+
+    if not topics or not options['k'].isdigit() or len(topics) + len(questions) < len(sys.argv) - 1:
+        print('usage: python3 TopicQuery.py [-h] [-l en] [-k 10] [--words] [--hashtags] [--users] [--dates] '
+              '[--languages] a b c...\n'
+              '\n'
+              'compares analyses of topics a, b, c...\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -l, --language\t\t language of the analyses, default en\n'
+              '  -k, --top-k\t\t\t number of the most frequent words and hashtags, default 10\n'
+              '  --words, --hashtags\t\t the most frequent words (or hashtags) of the topics taken together\n'
+              '  --users\t\t\t users who posted about both topics of every pair\n'
+              '  --dates\t\t\t tweets per day of the topics, aligned to common days\n'
+              '  --languages\t\t\t shares of languages in tweets of every topic\n'
+              '\n'
+              'Everything is compared if no question passed.\n'
+              '\n'
+              'example usages:\n'
+              'python3 TopicQuery.py example topic\n'
+              'python3 TopicQuery.py -l pt -k 20 --words --hashtags example topic\n')
+        exit()
+
+    query = TopicQuery(topics, options['language'])
+    for topic in query.missing():
+        print('Could not find analysis of {} in {}, proceeding. Analyzed in: {}'.format(
+            topic, options['language'], ', '.join(analyzed_languages(topic)) or 'none'))
+        query.topics.remove(topic)
+    if query.topics:
+        print_comparison(query, int(options['k']), questions or (WORDS, HASHTAGS, USERS, DATES, LANGUAGES))
+    query.close()
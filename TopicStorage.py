@@ -0,0 +1,490 @@
+import sys
+import json
+
+from glob import glob
+from time import time
+from threading import Lock, Thread
+from os import path, mkdir, rename, replace, remove
+from TopicIndex import TopicIndex, index_path
+from Compression import BlockWriter, open_stored, stored_path
+from Metrics import METRICS
+
+"""
+Segmented storage of tweets gathered for a topic.
+Every topic is a directory (outputs/<topic>/) of numbered segment files and a manifest listing them
+from the newest to the oldest. Tweets inside a segment are ordered from the newest to the oldest as well.
+A fetch only writes its own segment, which becomes immutable (sealed) once the fetch is complete,
+so refreshing a topic no longer copies its whole history. Small sealed segments can be compacted into bigger ones.
+Legacy outputs/<topic>.txt and outputs/<topic>_head.txt files are moved into segments on first use.
+A topic can keep its sealed segments compressed (see Compression.py), open segments being appended to stay plain
+until they are sealed. Readers go through open_stored, so they do not depend on the codec of a segment.
+"""
+
+COMPACTION_SIZE = 64 * 1024 * 1024  # segments are compacted until they reach this size (in bytes)
+WRITE_BUFFER = 1024 * 1024  # bytes of lines buffered by a segment writer
+
+SEALED = 'sealed'  # complete segment, never changed again (until compacted with its neighbours)
+HEAD = 'head'  # newest tweets being fetched, the gap to older segments is not filled yet, readers skip it
+BACKFILL = 'backfill'  # older tweets being fetched, appended behind all other segments
+
+
+class TopicStorage:
+    """
+    Segments and manifest of a single topic.\n
+    """
+
+    def __init__(self, topic):
+        """
+        Constructor of TopicStorage class.\n
+        :param topic: the topic whose tweets are stored
+        """
+        self.topic = topic
+        self.directory = 'outputs/' + topic
+        self.segments = []  # segment descriptions ordered from the newest to the oldest
+        self.next_number = 1  # number of the next created segment
+        self.codec = None  # codec sealed segments are compressed with, None to keep them plain
+        self.indexes = {}  # segment number -> TopicIndex, loaded when needed
+        self.lock = Lock()  # guards the manifest when compacting in background
+
+    def load(self):
+        """
+        Loads the manifest, moves legacy topic files into segments if there are any.\n
+        :return: the storage itself
+        """
+        try:
+            with open(self.directory + '/manifest.json', 'r') as file:
+                content = json.load(file)
+            self.segments = content['segments']
+            self.next_number = content['next_number']
+            self.codec = content.get('codec')
+        except FileNotFoundError:
+            self.migrate()
+        for segment in self.segments:
+            if segment['state'] != SEALED:  # could be interrupted between writing tweets and saving the manifest
+                self.update_summary(segment, self.index(segment))
+        return self
+
+    def migrate(self):
+        """
+        Turns legacy outputs/<topic>.txt file into a sealed segment and outputs/<topic>_head.txt into a head one.
+        """
+        for legacy_path, state in (('outputs/' + self.topic + '.txt', SEALED),
+                                   ('outputs/' + self.topic + '_head.txt', HEAD)):
+            if not path.exists(legacy_path):
+                continue
+            if not path.exists(self.directory):
+                mkdir(self.directory)
+            segment = self.create_segment(state, newest=True)
+            rename(legacy_path, self.segment_path(segment))
+            if path.exists(index_path(legacy_path)):
+                rename(index_path(legacy_path), index_path(self.segment_path(segment)))
+            self.update_summary(segment, TopicIndex(self.segment_path(segment)).load())
+        if self.segments:
+            self.save()
+
+    def save(self):
+        """
+        Saves the manifest, replacing the previous one at once.
+        """
+        if not path.exists(self.directory):
+            mkdir(self.directory)
+        with open(self.directory + '/manifest.json.tmp', 'w') as file:
+            json.dump({'segments': self.segments, 'next_number': self.next_number, 'codec': self.codec}, file, indent=1)
+        replace(self.directory + '/manifest.json.tmp', self.directory + '/manifest.json')
+
+    def segment_path(self, segment):
+        """
+        Gives path of a segment file.\n
+        :param segment: segment description
+        :return: path to the segment file
+        """
+        return stored_path(self.directory + '/' + str(segment['number']).zfill(6) + '.txt', segment.get('codec'))
+
+    def create_segment(self, state, newest):
+        """
+        Adds a new empty segment to the manifest (without saving it).\n
+        :param state: state of the segment
+        :param newest: True to place the segment in front of the others, False to place it behind them
+        :return: segment description
+        """
+        segment = self.new_segment(state)
+        if newest:
+            self.segments.insert(0, segment)
+        else:
+            self.segments.append(segment)
+        return segment
+
+    def new_segment(self, state):
+        """
+        Describes a new empty segment, not placed in the manifest yet.\n
+        :param state: state of the segment
+        :return: segment description
+        """
+        segment = {'number': self.next_number, 'state': state, 'max_id': None, 'min_id': None, 'lines': 0, 'size': 0,
+                   'codec': None}
+        self.next_number += 1
+        return segment
+
+    def index(self, segment):
+        """
+        Gives index of a segment, loading it if needed.\n
+        :param segment: segment description
+        :return: TopicIndex of the segment file
+        """
+        if segment['number'] not in self.indexes:
+            self.indexes[segment['number']] = TopicIndex(self.segment_path(segment)).load()
+        return self.indexes[segment['number']]
+
+    @staticmethod
+    def update_summary(segment, index):
+        """
+        Copies newest and oldest id, lines and size of a segment from its index.\n
+        :param segment: segment description
+        :param index: TopicIndex of the segment file
+        """
+        segment['max_id'] = index.max_id
+        segment['min_id'] = index.min_id
+        segment['lines'] = index.lines
+        segment['size'] = index.size
+
+    def readable(self):
+        """
+        Lists segments readers should go through, head segments (with a gap behind them) are left out.\n
+        :return: list of segment descriptions from the newest to the oldest
+        """
+        return [segment for segment in self.segments if segment['state'] != HEAD and segment['lines']]
+
+    def head(self):
+        """
+        Gives the head segment left by an interrupted fetch of the newest tweets.\n
+        :return: segment description or None
+        """
+        if self.segments and self.segments[0]['state'] == HEAD and self.segments[0]['lines']:
+            return self.segments[0]
+        return None
+
+    def newest_id(self):
+        """
+        Gives id of the newest tweet readers can see.\n
+        :return: tweet id or None if there are no tweets
+        """
+        readable = self.readable()
+        return readable[0]['max_id'] if readable else None
+
+    def oldest_id(self):
+        """
+        Gives id of the oldest stored tweet.\n
+        :return: tweet id or None if there are no tweets
+        """
+        stored = [segment for segment in self.segments if segment['lines']]
+        return stored[-1]['min_id'] if stored else None
+
+    def lines(self):
+        """
+        Counts tweets readers can see.\n
+        :return: number of tweets
+        """
+        return sum(segment['lines'] for segment in self.readable())
+
+    def writer(self, head):
+        """
+        Opens the segment new tweets are appended to, creating it if needed.\n
+        :param head: True for the newest tweets (fetched since the newest stored one), False for older ones
+        :return: SegmentWriter of the segment
+        """
+        return SegmentWriter(self, head)
+
+    def append(self, tweets, head):
+        """
+        Appends encoded tweets to the open segment, creating it if needed.\n
+        :param tweets: list of (tweet id, encoded line) pairs ordered from the newest to the oldest
+        :param head: True for the newest tweets (fetched since the newest stored one), False for older ones
+        """
+        writer = self.writer(head)
+        writer.write(tweets)
+        writer.close()
+
+    def seal(self):
+        """
+        Marks open segments as complete, called when a fetch finished.\n
+        :return: number of sealed segments
+        """
+        with self.lock:
+            sealed = []
+            for segment in self.segments:
+                if segment['state'] != SEALED:
+                    segment['state'] = SEALED
+                    sealed.append(segment)
+            self.segments = [segment for segment in self.segments if segment['lines']]
+            if sealed:
+                self.save()
+            for segment in sealed:
+                if segment['lines'] and segment.get('codec') != self.codec:
+                    self.recompress(segment, self.codec)
+            return len(sealed)
+
+    def ranges(self, last_ids=None):
+        """
+        Lists byte ranges of segment files readers should go through, from the newest tweets to the oldest.\n
+        If all passed tweets are found in the segments, ranges end at the oldest of them.\n
+        :param last_ids: ids of previously analyzed tweets, None to list everything
+        :return: list of (file path, start, end) tuples
+        """
+        readable = self.readable()
+        stop = None  # (segment position, offset) of the oldest last id
+        if last_ids and None not in last_ids:
+            for last_id in last_ids:
+                position = next((number for number, segment in enumerate(readable)
+                                 if segment['min_id'] <= last_id <= segment['max_id']), None)
+                if position is None:
+                    stop = None
+                    break
+                offset = self.index(readable[position]).offset_of(last_id)
+                offset = readable[position]['size'] if offset is None else offset
+                if stop is None or (position, offset) > stop:
+                    stop = (position, offset)
+            if stop is not None:
+                readable = readable[:stop[0] + 1]
+        ranges = [(self.segment_path(segment), 0, segment['size']) for segment in readable]
+        if stop is not None:
+            ranges[-1] = (ranges[-1][0], 0, stop[1])
+        return [piece for piece in ranges if piece[1] < piece[2]]
+
+    def read(self):
+        """
+        Reads tweets lines readers can see.\n
+        :return: generator of lines from the newest tweet to the oldest
+        """
+        for segment in self.readable():
+            with open_stored(self.segment_path(segment)) as file:
+                for line in file:
+                    yield line.decode('utf-8')
+
+    def refresh(self):
+        """
+        Rebuilds indexes of all segments and saves the manifest, used after segment files were rewritten.
+        """
+        with self.lock:
+            self.indexes = {}
+            for segment in self.segments:
+                index = TopicIndex(self.segment_path(segment))
+                index.rebuild()
+                index.save()
+                self.update_summary(segment, index)
+            self.save()
+
+    def recompress(self, segment, codec):
+        """
+        Rewrites a sealed segment with another codec, its index is kept as offsets do not change.\n
+        The manifest is switched to the new file once it is complete, the previous file is removed afterwards.\n
+        :param segment: segment description
+        :param codec: gzip, zstd or None for a plain file
+        """
+        previous = dict(segment)
+        segment['codec'] = codec
+        with open(self.segment_path(segment) + '.tmp', 'wb') as output:
+            writer = BlockWriter(output, codec)
+            with open_stored(self.segment_path(previous)) as source:
+                for line in source:
+                    writer.write(line)
+            writer.flush()
+        replace(self.segment_path(segment) + '.tmp', self.segment_path(segment))
+        index = TopicIndex(self.segment_path(segment))
+        index.extend(self.index(previous))
+        index.save()
+        self.indexes[segment['number']] = index
+        self.save()
+        remove(self.segment_path(previous))
+
+    def set_codec(self, codec):
+        """
+        Sets the codec sealed segments are stored with and rewrites the ones stored with another codec.\n
+        :param codec: gzip, zstd or None for plain files
+        """
+        with self.lock:
+            self.codec = codec
+            for segment in self.segments:
+                if segment['state'] == SEALED and segment.get('codec') != codec:
+                    self.recompress(segment, codec)
+            self.save()
+
+    def compact(self, max_size=COMPACTION_SIZE):
+        """
+        Joins neighbouring sealed segments into bigger ones, until they reach max_size.\n
+        The new segment replaces the joined ones in the manifest at once, their files are removed afterwards.\n
+        :param max_size: size in bytes compacted segments should not exceed
+        :return: number of joined segments
+        """
+        with self.lock:
+            runs = []  # lists of neighbouring sealed segments to join
+            run = []
+            run_size = 0
+            for segment in self.segments:
+                if segment['state'] == SEALED and run_size + segment['size'] <= max_size:
+                    run.append(dict(segment))
+                    run_size += segment['size']
+                    continue
+                if len(run) > 1:
+                    runs.append(run)
+                run, run_size = ([dict(segment)], segment['size']) if segment['state'] == SEALED else ([], 0)
+            if len(run) > 1:
+                runs.append(run)
+
+        joined = 0
+        for run in runs:
+            start_time = time()
+            with self.lock:
+                compacted = self.new_segment(SEALED)  # placed in the manifest when its file is complete
+                compacted['codec'] = self.codec
+            index = TopicIndex(self.segment_path(compacted))
+            with open(self.segment_path(compacted) + '.tmp', 'wb') as output:
+                writer = BlockWriter(output, compacted['codec'])
+                for segment in run:
+                    if segment.get('codec') == compacted['codec']:  # blocks are copied as they are
+                        with open(self.segment_path(segment), 'rb') as source:
+                            writer.copy(source)
+                    else:
+                        with open_stored(self.segment_path(segment)) as source:
+                            for line in source:
+                                writer.write(line)
+                    index.extend(TopicIndex(self.segment_path(segment)).load())
+                writer.flush()
+            replace(self.segment_path(compacted) + '.tmp', self.segment_path(compacted))
+            index.save()
+            self.update_summary(compacted, index)
+
+            with self.lock:
+                numbers = [segment['number'] for segment in self.segments]
+                position = numbers.index(run[0]['number'])
+                self.segments[position:position + len(run)] = [compacted]
+                self.save()
+            for segment in run:
+                self.indexes.pop(segment['number'], None)
+                remove(self.segment_path(segment))
+                TopicIndex(self.segment_path(segment)).remove()
+            joined += len(run)
+            METRICS.count('storage.bytes_merged', sum(segment['size'] for segment in run))
+            METRICS.record('storage.compact', time() - start_time)
+        return joined
+
+    def compact_in_background(self, max_size=COMPACTION_SIZE):
+        """
+        Starts compaction in a separate thread, the script waits for it to finish before exiting.\n
+        :param max_size: size in bytes compacted segments should not exceed
+        :return: the started thread
+        """
+        thread = Thread(target=self.compact, args=(max_size,), name='compaction-' + self.topic)
+        thread.start()
+        return thread
+
+
+class SegmentWriter:
+    """
+    Long-lived handle appending tweets to the open (head or backfill) segment of a topic.\n
+    Lines go through a buffered file, the index and the manifest are saved only when the writer is flushed.
+    Until then, a crash loses at most the buffered lines, the segment summary is repaired when the storage is loaded.\n
+    """
+
+    def __init__(self, storage, head):
+        """
+        Constructor of SegmentWriter class.\n
+        :param storage: TopicStorage of the topic
+        :param head: True for the newest tweets (fetched since the newest stored one), False for older ones
+        """
+        self.storage = storage
+        with storage.lock:
+            state = HEAD if head else BACKFILL
+            if storage.segments and storage.segments[0 if head else -1]['state'] == state:
+                self.segment = storage.segments[0 if head else -1]
+            else:
+                self.segment = storage.create_segment(state, newest=head)
+            self.index = storage.index(self.segment)  # loaded before writing, otherwise a new segment is indexed twice
+        self.file = None  # opened with the first lines, so an empty segment leaves no file
+        self.pending = False  # whether there are lines the index and manifest do not know about
+
+    def write(self, tweets):
+        """
+        Appends encoded tweets to the segment.\n
+        :param tweets: list of (tweet id, encoded line) pairs ordered from the newest to the oldest
+        """
+        if not tweets:
+            return
+        if self.file is None:
+            if not path.exists(self.storage.directory):
+                mkdir(self.storage.directory)
+            self.file = open(self.storage.segment_path(self.segment), 'ab', buffering=WRITE_BUFFER)
+        data = ''.join([line for _, line in tweets]).encode('utf-8')
+        self.file.write(data)
+        METRICS.count('storage.bytes_written', len(data))
+        self.index.append(tweets)
+        self.pending = True
+
+    def flush(self):
+        """
+        Writes buffered lines to the segment file, then saves its index and the manifest.
+        """
+        if not self.pending:
+            return
+        with self.storage.lock:
+            self.file.flush()
+            self.index.save()
+            self.storage.update_summary(self.segment, self.index)
+            self.storage.save()
+        self.pending = False
+
+    def close(self):
+        """
+        Flushes the writer and closes the segment file.
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def list_topics():
+    """
+    Lists topics having stored tweets, including ones still kept in legacy outputs/<topic>.txt files.\n
+    :return: sorted list of topics
+    """
+    topics = {path.basename(path.dirname(manifest)) for manifest in glob('outputs/*/manifest.json')}
+    topics |= {path.basename(legacy)[:-len('.txt')] for legacy in glob('outputs/*.txt') if not legacy.endswith('_head.txt')}
+    return sorted(topics)
+
+
+def topic_codec(topic):
+    """
+    Gives the codec sealed segments of a topic are compressed with, without loading its storage.\n
+    :param topic: stored topic
+    :return: codec name, None for plain files or topics not stored yet
+    """
+    try:
+        with open('outputs/' + topic + '/manifest.json', 'r') as file:
+            return json.load(file).get('codec')
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def compact_topics(topic_list):
+    """
+    Compacts segments of passed topics, or of every stored topic if no topics passed.\n
+    :param topic_list: list of topics to compact
+    """
+    for topic in topic_list if topic_list else list_topics():
+        t = time() * 1000
+        joined = TopicStorage(topic).load().compact()
+        print('Compacted \x1b[1;36;40m{}\x1b[0m segments of \x1b[1;34;40m{}\x1b[0m in {} ms.'.format(
+            joined, topic, round(time() * 1000 - t, 3)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and (sys.argv[1] == '-c' or sys.argv[1] == '--compact'):
+        compact_topics([arg.lower() for arg in sys.argv[2:] if arg[0] != '-'])
+    else:
+        print('usage: python3 TopicStorage.py [-h] [-c [a b c...]]\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -c, --compact [a,b...]\t joins small segments of topics a, b, c...\n'
+              '\n'
+              'If no topics passed to --compact, every stored topic is compacted.\n')
@@ -0,0 +1,224 @@
+import sys
+import json
+
+from os import replace
+from Compression import BlockWriter, open_stored, codec_of
+
+"""
+Encodes and decodes tweets stored in outputs/ files, shared by the fetcher, the extractor and every other reader.
+Format version 2 (current) is JSON Lines - one json object per tweet, one tweet per line, newest tweets first.
+Format version 1 is the legacy "{ 'key':'value', ... }" line, which is still readable and can be converted
+to the current format with the --convert option.
+Readers needing only a few fields use project_line, which leaves full_text (the last and longest field) undecoded
+until it is read.
+"""
+
+FORMAT_VERSION = 2
+FIELDS = ('id', 'date', 'screen_name', 'user_location', 'user_followers', 'retweet_count', 'favorite_count',
+          'language', 'full_text')
+NUMERIC_FIELDS = ('id', 'user_followers', 'retweet_count', 'favorite_count')
+
+TEXT_KEY = ',"full_text":'  # can not appear inside a json string, where quotes are escaped
+ID_KEY = '"id":'  # keys of the fields needed for every tweet, in the order the fetcher writes them
+DATE_KEY = '"date":'
+NAME_KEY = '"screen_name":'
+FOLLOWERS_KEY = '"user_followers":'
+LANGUAGE_KEY = '"language":'
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+_decoder = json.JSONDecoder()
+_decode = _decoder.decode
+_scan = _decoder.scan_once  # (value, end) of the json value starting at a position
+
+
+def line_version(line):
+    """
+    Tells which format version the line was written in.\n
+    :param line: line read from an output file
+    :return: format version number
+    """
+    return FORMAT_VERSION if line[:2] == '{"' else 1
+
+
+def encode_tweet(tweet):
+    """
+    Turns a tweet dictionary into a single line of the current format.\n
+    :param tweet: json-style dictionary of a tweet
+    :return: encoded line, including the trailing newline
+    """
+    return _encoder.encode(tweet) + '\n'
+
+
+def decode_line(line):
+    """
+    Turns a line of any known format version into a tweet dictionary.\n
+    :param line: line read from an output file
+    :return: dictionary form of the tweet
+    :raise ValueError: if the line can not be decoded
+    """
+    if line[:2] == '{"':
+        return _decode(line)
+    return unwrap_line_to_dictionary(line)
+
+
+class TweetRecord:
+    """
+    Fields of a tweet the analysis needs, full_text is decoded from the line when it is read for the first time.\n
+    """
+
+    __slots__ = ('id', 'date', 'screen_name', 'user_followers', 'language', 'line', 'text_start', 'text')
+
+    def __init__(self, fields, line=None, text_start=None):
+        """
+        Constructor of TweetRecord class.\n
+        :param fields: dictionary of decoded fields, full_text included unless it is deferred
+        :param line: line the deferred full_text is decoded from
+        :param text_start: position of the full_text value in the line
+        :raise KeyError: if a field the analysis needs is missing
+        """
+        self.id = fields['id']
+        self.date = fields['date']
+        self.screen_name = fields['screen_name']
+        self.user_followers = fields['user_followers']
+        self.language = fields['language']
+        self.line = line
+        self.text_start = text_start
+        self.text = fields['full_text'] if line is None else None
+
+    @property
+    def full_text(self):
+        """
+        Gives text of the tweet, decoding it if it was deferred.\n
+        :return: full text of the tweet
+        :raise ValueError: if the deferred value can not be decoded
+        """
+        if self.line is not None:
+            try:
+                self.text = _scan(self.line, self.text_start)[0]
+            except StopIteration:  # raised by the scanner when no value starts there
+                raise ValueError('no full_text value in line')
+            self.line = None
+        return self.text
+
+
+_new_record = TweetRecord.__new__  # creates records of projected lines without the fields dictionary
+
+
+def project_line(line):
+    """
+    Turns a line of any known format version into a TweetRecord, decoding full_text of current lines only
+    when it is read.\n
+    Only values of the needed fields are scanned, in place, other fields are never decoded. On the generated corpus
+    (see Benchmark.py) this is 25-30% cheaper than decode_line, short of the halved parse cost aimed at:
+    the remaining cost is mostly the per-field calls, not json decoding.\n
+    :param line: line read from an output file
+    :return: TweetRecord of the tweet
+    :raise ValueError: if the line can not be decoded
+    :raise KeyError: if the line misses a field the analysis needs
+    """
+    if line[:2] == '{"':
+        position = line.find(TEXT_KEY)
+        if position != -1:
+            record = _new_record(TweetRecord)
+            try:  # keys can not appear inside json strings, every one is searched after the previous value
+                record.id, start = _scan(line, line.index(ID_KEY, 0, position) + len(ID_KEY))
+                record.date, start = _scan(line, line.index(DATE_KEY, start, position) + len(DATE_KEY))
+                record.screen_name, start = _scan(line, line.index(NAME_KEY, start, position) + len(NAME_KEY))
+                record.user_followers, start = _scan(line, line.index(FOLLOWERS_KEY, start, position) +
+                                                     len(FOLLOWERS_KEY))
+                record.language, start = _scan(line, line.index(LANGUAGE_KEY, start, position) + len(LANGUAGE_KEY))
+            except (ValueError, StopIteration):  # another key order, the fields are decoded as a whole
+                return TweetRecord(decode_line(line))
+            record.line = line
+            record.text_start = position + len(TEXT_KEY)  # full_text is the last field, as written by the fetcher
+            record.text = None
+            return record
+    return TweetRecord(decode_line(line))
+
+
+def unwrap_line_to_dictionary(line):
+    '''
+    Gets a line in legacy (version 1) format containing tweet data and returns it in a form of a dictionary.\n
+    Values containing the ', ' separator (i.e. quotes in tweet texts) are glued back to the key they belong to.\n
+    :param line: line to turn into a dictionary
+    :return: dictionary form of passed line (tweet)
+    :raise ValueError: if the line does not contain any key
+    '''
+    line = line.rstrip('\n')
+    if line[:3] == '{ \'':
+        line = line[3:]
+    if line[-3:] == '\' }':
+        line = line[:-3]
+
+    d = dict()
+    key = None
+    for pair in line.split('\', \''):
+        name, separator, value = pair.partition('\':\'')
+        if separator and name.isidentifier():
+            key = name
+            d[key] = value
+        elif key is not None:
+            d[key] += '\', \'' + pair
+    if key is None:
+        raise ValueError('Not a tweet line: ' + line[:50])
+
+    for key in NUMERIC_FIELDS:
+        if key in d and d[key].isdigit():
+            d[key] = int(d[key])
+    return d
+
+
+def convert_file(file_path):
+    """
+    Rewrites an output file in the current format version. Lines that can not be decoded are dropped.\n
+    The file is replaced only after the whole content has been converted, its index has to be rebuilt afterwards.\n
+    :param file_path: path to the file to convert
+    :return: tuple of converted and dropped lines counts
+    """
+    converted = 0
+    dropped = 0
+    with open_stored(file_path) as source:
+        with open(file_path + '.tmp', 'wb') as target:
+            writer = BlockWriter(target, codec_of(file_path))  # a compressed segment stays compressed
+            for line in source:
+                try:
+                    writer.write(encode_tweet(decode_line(line.decode('utf-8'))).encode('utf-8'))
+                    converted += 1
+                except (ValueError, IndexError):
+                    dropped += 1
+            writer.flush()
+    replace(file_path + '.tmp', file_path)
+    return converted, dropped
+
+
+def convert_topics(topic_list):
+    """
+    Converts stored tweets of passed topics, or of every stored topic if no topics passed.\n
+    Legacy outputs/<topic>.txt files are moved into topic segments first.\n
+    :param topic_list: list of topics to convert
+    """
+    from TopicStorage import TopicStorage, list_topics
+
+    for topic in topic_list if topic_list else list_topics():
+        storage = TopicStorage(topic).load()
+        if not storage.segments:
+            print('Could not find tweets of {}, proceeding.'.format(topic))
+            continue
+        for segment in storage.segments:
+            converted, dropped = convert_file(storage.segment_path(segment))
+            print('Converted \x1b[1;36;40m{}\x1b[0m lines of \x1b[1;34;40m{}\x1b[0m ({} dropped).'.format(
+                converted, storage.segment_path(segment), dropped))
+        storage.refresh()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and (sys.argv[1] == '-c' or sys.argv[1] == '--convert'):
+        convert_topics([arg.lower() for arg in sys.argv[2:] if arg[0] != '-'])
+    else:
+        print('usage: python3 TweetCodec.py [-h] [-c [a b c...]]\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -c, --convert [a,b...]\t converts stored tweets of topics a, b, c... to the current format\n'
+              '\n'
+              'If no topics passed to --convert, every stored topic is converted.\n')
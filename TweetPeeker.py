@@ -4,20 +4,31 @@ import tweepy
 from pandas import DataFrame
 from numpy import array
 from json import JSONDecodeError
-from os import path, mkdir, rename, remove
-from subprocess import check_output
+from os import path, mkdir
 from time import time, sleep
-from subprocess import CalledProcessError
+from queue import Queue
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from RateLimiter import search_limiter
+from SearchBackend import TweepySearch, ServerOverloaded, SearchError
+from TweetCodec import encode_tweet
+from TopicStorage import TopicStorage
+from SearchIndex import SearchIndex
+from Metrics import METRICS, take_options, instrumented
 
 
 """
 This script queries Twitter API for tweets (used API is free but it only allows to access last 7 days).
 It supports storing a topic list, re-fetching topics (meaning it wont fetch the same posts twice even if interrupted or crashed),
-It saves the output in json-like format which was suitable for this purpose.
+It saves the output in JSON Lines format, see TweetCodec.py for the details.
+Several topics can be fetched at the same time, sharing one rate limit budget (see RateLimiter.py).
+Pages of a topic are written by a background thread (see PageWriter), so the next page is requested meanwhile.
 There is also an option to execute it along with Extractor.py script to concuct analysis on gathered posts.
 Full list of options is available with --help variable.
 """
 
+PIPELINE_DEPTH = 4  # fetched pages waiting to be written, fetching of a topic waits when there are more
+
 class TwitterFetcher:
 
     def __init__(self):
@@ -25,20 +36,18 @@ class TwitterFetcher:
         Initializes the fetcher object.
         """
         self.api = None  # api connection to twitter
+        self.backend = None  # search backend requests go to (see SearchBackend.py)
         self.auth = None  # user authentication object
-        self.query = None  # currently used keyword(s)
-        self.max_id = None  # limits twitter queries -> pagination matters
-        self.since_id = None  # takes care of not fetching tweets that are already saved in a file
         self.topics = []  # list of topics to fetch tweets for
-        self.existing_topic = None  # flag saying if the file for current query already exists
-        self.filters = ' -filter:retweets -filter:replies '  # twitter API filters for eliminating certain tweets
+        self.compact_segments = False  # whether to compact topic segments in background after fetching
         self.request_counter = 0  # how many requests have been made since start of the script
-        self.received_tweets = 0  # cumulative number of tweets received for a specific topic
-        self.tweets_matching_keyword = 0  # how many of received tweets actually had keyword in their texts
+        self.request_lock = Lock()  # guards request_counter when topics are fetched concurrently
+        self.limiter = search_limiter()  # rate limit budget shared by all topics (see RateLimiter.py), None for no limit
+        self.workers = 1  # number of topics fetched at the same time
+        self.analyses = {}  # topic -> LiveAnalysis counting fetched tweets in memory (see Watcher.py)
 
         self.perform_analysis = False
         self.analysis_language = None
-        self.retry_counter = 3  # initializing counter for retries on json decode error
 
     def authenticate(self, customer_token_path='tokens/ConsumerToken', customer_secret_path='tokens/ConsumerSecret'):
         """
@@ -54,6 +63,7 @@ class TwitterFetcher:
                 customer_secret = file.readline().strip()
             self.auth = tweepy.AppAuthHandler(customer_token, customer_secret)
             self.api = tweepy.API(self.auth, wait_on_rate_limit=True)
+            self.backend = TweepySearch(self.api)
         except FileNotFoundError:
             raise Exception('Could not find customer token/secret file.')
 
@@ -63,42 +73,171 @@ class TwitterFetcher:
         """
         self.perform_analysis = True
 
-    def update_query(self, query):
+    def set_compact_segments(self):
         """
-        Updates current query for use in twitter queries.\n
-        Resets bunch of variables.\n
-        :param query: new query (keyword[s]) to be used
+        Sets self.compact_segments variable to True
         """
-        self.query = query
-        self.max_id = None
-        self.since_id = None
-        self.received_tweets = 0
-        self.tweets_matching_keyword = 0
-        self.retry_counter = 3
-        self.update_limit_id()
+        self.compact_segments = True
+
+    def set_workers(self, workers):
+        """
+        Sets number of topics fetched at the same time.\n
+        :param workers: number of fetching threads
+        """
+        self.workers = max(1, workers)
+
+    def next_request(self):
+        """
+        Waits for the shared rate limit budget and counts the request.\n
+        :return: number of the request since start of the script
+        """
+        if self.limiter is not None:
+            waited = self.limiter.acquire()
+            if waited:
+                METRICS.record('fetch.rate_limit_wait', waited)
+        with self.request_lock:
+            self.request_counter += 1
+            return self.request_counter
 
     def fetch_topics(self):
         """
         Fetches tweets for all topics contained in self.topics\n
-        If self.perform_analysis flag set to True, analyzes every topic after fetching.
-        """
-        for topic in self.topics:
-            self.update_query(topic)
-            self.follow_topic()
-            if self.perform_analysis:
-                if not self.analysis_language:
-                    analyze_topic(topic)
-                else:
-                    analyze_topic(topic, self.analysis_language)
+        With more than one worker, topics are fetched concurrently, each topic by a single thread,
+        so its pages are still requested and written in order.\n
+        If self.perform_analysis flag set to True, analyzes every topic after fetching.\n
+        If self.compact_segments flag set to True, compacts segments of every topic in background afterwards.
+        """
+        if self.workers == 1:
+            for topic in self.topics:
+                self.finish_topic(self.fetch_topic(topic))
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fetch') as executor:
+            futures = [executor.submit(self.fetch_topic, topic) for topic in self.topics]
+            for future in as_completed(futures):
+                self.finish_topic(future.result())  # analysis runs in the main thread while others keep fetching
+        if self.limiter is not None:
+            print('Waited \x1b[1;36;40m{} s\x1b[0m for the rate limit in total.'.format(round(self.limiter.waited, 3)))
+
+    def fetch_topic(self, topic):
+        """
+        Fetches all new tweets of a single topic.\n
+        :param topic: keyword(s) to fetch tweets for
+        :return: TopicFetch holding state of the finished fetch
+        """
+        fetch = TopicFetch(self, topic)
+        fetch.follow_topic()
+        return fetch
+
+    def finish_topic(self, fetch):
+        """
+        Analyzes and compacts a fetched topic if requested, adds the new segment to its search index if it has one.\n
+        Fetched tweets counted in memory by a watched topic are added to its counts.\n
+        :param fetch: TopicFetch of the finished fetch
+        """
+        if fetch.query in self.analyses:
+            self.analyses[fetch.query].settle()
+        index = SearchIndex(fetch.query)
+        if index.exists():
+            index.update()
+            index.close()
+        if self.perform_analysis:
+            if not self.analysis_language:
+                analyze_topic(fetch.query)
+            else:
+                analyze_topic(fetch.query, self.analysis_language)
+        if self.compact_segments:
+            fetch.storage.compact_in_background()
+
+    def extract_data_into_frame(self, tweets):
+        """
+        For extracting tweets into pandas data frame. (Used in one of the first versions abandoned due to data format)\n
+        :param tweets: tweets to extract into frame\n
+        :return: pandas data frame containing tweets info
+        """
+        frame = DataFrame()
+
+        frame['id'] = array([tweet.id for tweet in tweets])
+        frame['date'] = array([tweet.created_at for tweet in tweets])
+        frame['user_location'] = array([tweet.user.location.replace('\n', ' ') for tweet in tweets])
+        # if 'sc:' not in tweet.user.location and 'ig:' not in tweet.user.location and '#' not in tweet.user.location])
+        frame['users_followers'] = array([tweet.user.followers_count for tweet in tweets])
+        frame['retweet_count'] = array([tweet.retweet_count for tweet in tweets])
+        frame['favorite_count'] = array([tweet.favorite_count for tweet in tweets])
+        frame['language'] = array([tweet.lang for tweet in tweets])
+        frame['full_text'] = array([tweet.full_text.replace('\n', ' ') for tweet in tweets])
+
+        # frame = frame.reindex(index=frame.index[::-1])
+        return frame
+
+    def extract_data_to_json_format(self, tweets):
+        """
+        Extracts list of tweets into a json formatted dictionary.\n
+        :param tweets: tweets to extract into dictionary
+        :return: json-style dictionary containing tweets
+        """
+        json_style = {'tweets': []}
+
+        for tweet in tweets:  # [::-1]:
+            json_style['tweets'].append({
+                'id': tweet.id,
+                'date': tweet.created_at,
+                'screen_name': tweet.user.screen_name,
+                'user_location': tweet.user.location.replace('\n', ' '),
+                'user_followers': tweet.user.followers_count,
+                'retweet_count': tweet.retweet_count,
+                'favorite_count': tweet.favorite_count,
+                'language': tweet.lang,
+                'full_text': tweet.full_text.replace('\n', ' ')  # for some reason some tweets still break the line
+            })
+
+        return json_style
+
+
+class TopicFetch:
+    """
+    State of fetching a single topic, so several topics can be fetched at once by one TwitterFetcher.\n
+    """
+
+    def __init__(self, fetcher, query):
+        """
+        Prepares fetching of a topic, loads limiting ids from its storage.\n
+        :param fetcher: TwitterFetcher providing search backend and the shared rate limit budget
+        :param query: keyword(s) to be used
+        """
+        self.fetcher = fetcher
+        self.query = query  # used keyword(s)
+        self.max_id = None  # limits twitter queries -> pagination matters
+        self.since_id = None  # takes care of not fetching tweets that are already saved in a file
+        self.existing_topic = None  # flag saying if the file for current query already exists
+        self.received_tweets = 0  # cumulative number of tweets received for the topic
+        self.tweets_matching_keyword = 0  # how many of received tweets actually had keyword in their texts
+        self.retry_counter = 3  # initializing counter for retries on json decode error
+        self.storage = TopicStorage(query).load()  # segments of the topic tweets (see TopicStorage.py)
+        self.pages = None  # PageWriter writing fetched pages while the following ones are requested
+        self.update_limit_id()
 
     def follow_topic(self):
         """
         Requests all new tweets starting from just released ones.\n
         Runs until there are no more tweets returned by twitter.\n
         Prints some text and numbers to follow the progress.\n
+        Pages fetched before the end (or an interruption) of the topic are always written.\n
+        """
+        if not path.exists('outputs'):
+            mkdir('outputs')
+
+        self.pages = PageWriter(self.storage, self.fetcher.analyses.get(self.query))
+        try:
+            self.follow_pages()
+        finally:
+            self.pages.close()
+
+    def follow_pages(self):
+        """
+        Requests pages of tweets until there are no more of them, see follow_topic.
         """
         while True:
-            self.request_counter += 1
             tweets = self.get_tweets()
             if not tweets:
                 if not self.max_id and not self.since_id:
@@ -108,9 +247,10 @@ class TwitterFetcher:
                     print('There are no new tweets about {}'.format(self.query))
                     return
                 if self.existing_topic and not self.since_id:
+                    self.pages.drain()  # limits are read from the storage
                     self.update_limit_id(True)
                 else:
-                    print('Fetched {} tweets containing this keyword.'.format(self.received_tweets))
+                    print('Fetched {} tweets containing {}.'.format(self.received_tweets, self.query))
                     if self.tweets_matching_keyword == self.received_tweets:
                         print('\x1b[1;32;40m' + 'All of them contained the keyword: ' + self.query + '\x1b[0m')
                     elif self.tweets_matching_keyword >= .9 * self.received_tweets:
@@ -125,12 +265,12 @@ class TwitterFetcher:
                     else:
                         print('\x1b[1;31;40m' + str(self.tweets_matching_keyword) + ' contained the keyword: ' +
                               self.query + '   (0%> x >40%)' + '\x1b[0m')
-                    if self.received_tweets > 0 and self.existing_topic:
-                        self.merge_output_files()
+                    self.pages.drain()
+                    self.merge_output_files()
                     return
             else:
                 self.retry_counter = 3
-                formatted = self.extract_data_to_json_format(tweets)
+                formatted = self.fetcher.extract_data_to_json_format(tweets)
                 self.append_to_file(formatted)
 
     def get_tweets(self):
@@ -138,39 +278,33 @@ class TwitterFetcher:
         Requests tweets in pack of 100 (maximum allowed) applying filters.\n
         :returns: tweets received from twitter requested for a keyword
         """
-        if self.query is None:
-            print('Query not set.')
-            return
-
+        request = self.fetcher.next_request()
+        backend = self.fetcher.backend
         try:
             if self.since_id:
-                print('Requesting tweets containing:', self.query, '\t max_id =', self.max_id, '\t since_id =',
-                                                       self.since_id, '\t(', self.request_counter, ')')
-
-                tweets = self.api.search(q=self.query+self.filters, count=100, result_type='recent', max_id=self.max_id,
-                                         since_id=self.since_id, tweet_mode='extended', include_entities=False)
+                print('Requesting tweets containing: {}\t max_id = {}\t since_id = {}\t( {} )'.format(
+                    self.query, self.max_id, self.since_id, request))
             else:
-                print('Requesting tweets containing:', self.query, '\t max_id =', self.max_id,
-                      '\t(', self.request_counter, ')')
-
-                tweets = self.api.search(q=self.query+self.filters, count=100, max_id=self.max_id,
-                                         tweet_mode='extended', result_type='recent', include_entities=False)
-
-        except tweepy.error.TweepError as error:
-            if error.response.text == 'status code = 503':
-                print('Server overloaded, waiting 5 sec...')
-                sleep(5)
-                self.request_counter += 1
-                return self.get_tweets()
-            else:
-                print(error.response.text)
-                exit()
+                print('Requesting tweets containing: {}\t max_id = {}\t( {} )'.format(self.query, self.max_id, request))
+            with METRICS.timer('fetch.request'):
+                tweets = backend.search(self.query, count=100, max_id=self.max_id, since_id=self.since_id)
+
+        except ServerOverloaded:
+            print('Server overloaded, waiting {} sec...'.format(backend.retry_delay))
+            METRICS.count('fetch.overloaded')
+            with METRICS.timer('fetch.overload_wait'):
+                sleep(backend.retry_delay)
+            return self.get_tweets()
+
+        except SearchError as error:
+            print(error)
+            exit()
 
         except JSONDecodeError:  # tweepy unhandled exception
             if self.retry_counter == 0:  # we dont want to make a deadlock, but a few tries may be helpful
                 return
             print('\x1b[1;31;40mParsing error occured. Retrying.\x1b[0m\n')
-            self.request_counter += 1
+            METRICS.count('fetch.parsing_errors')
             self.retry_counter -= 1
             return self.get_tweets()
 
@@ -184,6 +318,7 @@ class TwitterFetcher:
             print('\x1b[1;32;40m' + 'Received tweets: ' + str(len(tweets)) + '\x1b[0m\n')
 
         self.received_tweets += len(tweets)
+        METRICS.count('fetch.tweets_received', len(tweets))
         if tweets:
             self.max_id = int(tweets[-1].id)-1
         return self.filter_tweets_matching_keyword(tweets)  # returns only the ones that have the keyword in their text
@@ -200,127 +335,44 @@ class TwitterFetcher:
             if self.query in tweet.full_text.lower():
                 matching.append(tweet)
                 self.tweets_matching_keyword += 1
+        METRICS.count('fetch.tweets_matching', len(matching))
         return matching
 
     def update_limit_id(self, since=False):
         """
-        Loads query limiting id from file and stores it in object variable.\n
+        Loads query limiting id from the topic storage manifest and stores it in object variable.\n
         :param since: Switches between limiter we want to load from file since_id/max_id
         """
-        test_number = 0
-        line = None
-        while test_number < 3:  # tries 3 times, because sometimes first try was unsuccessful for some reason
-            try:
-                if since:
-                    line = str(check_output(['head', '-1', 'outputs/'+self.query+'.txt'])).lstrip('b"{ ').rstrip(' }\\n\"')
-                else:
-                    line = str(check_output(['tail', '-1', 'outputs/'+self.query+'.txt'])).lstrip('b"{ ').rstrip(' }\\n\"')
-            except CalledProcessError:
-                if since:
-                    print('Could not load since_id from a file (attempt {})'.format(test_number+1))
-                else:
-                    print('Could not load max_id from a file (attempt {})'.format(test_number+1))
-            finally:
-                test_number += 1
-
-            if line is not None:
-                if since:
-                    self.since_id = int(unwrap_line_to_dictionary(line)['id'])  # sets since_id, its exclusive
-                    if path.exists('outputs/' + self.query + '_head.txt'):
-                        line = str(check_output(['tail', '-1', 'outputs/' + self.query + '_head.txt'])).lstrip(
-                            'b"{ ').rstrip(' }\\n\"')
-                        self.max_id = int(unwrap_line_to_dictionary(line)['id'])-1
-                    else:
-                        self.max_id = None  # this must be set to none, otherwise no tweets could be retrieved
-                else:
-                    self.max_id = int(unwrap_line_to_dictionary(line)['id'])-1  # sets max_id which is inclusive
-                    self.existing_topic = True
-
-    def extract_data_into_frame(self, tweets):
-        """
-        For extracting tweets into pandas data frame. (Used in one of the first versions abandoned due to data format)\n
-        :param tweets: tweets to extract into frame\n
-        :return: pandas data frame containing tweets info
-        """
-        frame = DataFrame()
-
-        frame['id'] = array([tweet.id for tweet in tweets])
-        frame['date'] = array([tweet.created_at for tweet in tweets])
-        frame['user_location'] = array([tweet.user.location.replace('\n', ' ') for tweet in tweets])
-        # if 'sc:' not in tweet.user.location and 'ig:' not in tweet.user.location and '#' not in tweet.user.location])
-        frame['users_followers'] = array([tweet.user.followers_count for tweet in tweets])
-        frame['retweet_count'] = array([tweet.retweet_count for tweet in tweets])
-        frame['favorite_count'] = array([tweet.favorite_count for tweet in tweets])
-        frame['language'] = array([tweet.lang for tweet in tweets])
-        frame['full_text'] = array([tweet.full_text.replace('\n', ' ') for tweet in tweets])
-
-        # frame = frame.reindex(index=frame.index[::-1])
-        return frame
-
-    def extract_data_to_json_format(self, tweets):
-        """
-        Extracts list of tweets into a json formatted dictionary.\n
-        :param tweets: tweets to extract into dictionary
-        :return: json-style dictionary containing tweets
-        """
-        json_style = {'tweets': []}
-
-        for tweet in tweets:  # [::-1]:
-            json_style['tweets'].append({
-                'id': tweet.id,
-                'date': tweet.created_at,
-                'screen_name': tweet.user.screen_name,
-                'user_location': tweet.user.location.replace('\n', ' '),
-                'user_followers': tweet.user.followers_count,
-                'retweet_count': tweet.retweet_count,
-                'favorite_count': tweet.favorite_count,
-                'language': tweet.lang,
-                'full_text': tweet.full_text.replace('\n', ' ')  # for some reason some tweets still break the line
-            })
-
-        return json_style
+        if not self.storage.lines():
+            return
+        if since:
+            self.since_id = self.storage.newest_id()  # sets since_id, its exclusive
+            if self.storage.head():
+                self.max_id = self.storage.head()['min_id']-1
+            else:
+                self.max_id = None  # this must be set to none, otherwise no tweets could be retrieved
+        else:
+            self.max_id = self.storage.oldest_id()-1  # sets max_id which is inclusive
+            self.existing_topic = True
 
     def append_to_file(self, data):
         """
-        Saves tweets at the end of a respective file.\n
+        Hands tweets to the page writer, which saves them at the end of the open segment of the topic
+        (head segment when fetching the newest tweets) while the next page is requested.\n
         :param data: json-formatted tweets dictionary
         """
-        if not path.exists('outputs'):
-            mkdir('outputs')
-
-        with open('outputs/' + self.query + '_head.txt' if self.since_id else
-                  'outputs/' + self.query + '.txt', 'a') as output:
-            for tweet in data['tweets']:
-                buffer = '{ '
-                key_number = 1
-                for key in tweet:
-                    buffer += '\'' + str(key) + '\':' + '\'' + str(tweet[key]) + '\''
-                    if key_number < len(tweet.keys()):
-                        buffer += ', '
-                    else:
-                        buffer += ' }\n'
-                    key_number += 1
-                output.write(buffer)
+        self.pages.put(data['tweets'], head=bool(self.since_id))
 
     def merge_output_files(self):
         """
-        Merges two files containing tweets of the same topic.\n
-        Reads topic file line by line and attaches it to topic_head, then removes topic file and changes head's name.\n
+        Seals segments written by this fetch, so they become visible to readers and are never changed again.\n
+        Previously stored tweets are not copied, whatever their number.\n
         """
-        if self.tweets_matching_keyword:
-            try:
-                with open('outputs/' + self.query + '.txt', 'r') as input_handle:
-                    t = time() * 1000
-                    with open('outputs/' + self.query + '_head.txt', 'a') as output_handle:
-                        for line in input_handle:
-                            output_handle.write(line)
-                        print('Merged output files in \x1b[1;36;40m{} ms\x1b[0m.\n'.format(time() * 1000 - t))
-                        output_handle.close()
-                    input_handle.close()
-                remove('outputs/' + self.query + '.txt')
-                rename('outputs/' + self.query + '_head.txt', 'outputs/' + self.query + '.txt')
-            except FileNotFoundError:
-                print('Could not open desired file')
+        t = time() * 1000
+        with METRICS.timer('storage.seal'):
+            sealed = self.storage.seal()
+        if sealed:
+            print('Sealed output segments of {} in \x1b[1;36;40m{} ms\x1b[0m.\n'.format(self.query, time() * 1000 - t))
 
     def save_statistics(self):  # subject to development
         """
@@ -334,24 +386,95 @@ class TwitterFetcher:
             file.write(str(self.tweets_matching_keyword) + ' / ' + str(self.received_tweets) + '\n')
 
 
-def unwrap_line_to_dictionary(line):
-    '''
-    Gets a line containing tweet data and returns it in a form of a dictionary\n
-    :param line: line to turn into a dictionary
-    :return: dictionary form of passed line (tweet)
-    '''
-    # preprocessing done for posts containing i.e. quotes
-    if line[0] == '\'':
-        line = line.strip('\'').rstrip('\\n')
-    if line[2] == '\\':
-        line = line.replace('\\', '')
+class PageWriter:
+    """
+    Background thread encoding fetched pages and appending them to a topic storage through a long-lived
+    segment writer, so disk and encoding time hide behind the network latency of the next request.
+    Written pages are also counted by the in-memory analysis of a watched topic (see Watcher.py).\n
+    """
+
+    def __init__(self, storage, analysis=None):
+        """
+        Constructor of PageWriter class, starts the writing thread.\n
+        :param storage: TopicStorage of the fetched topic
+        :param analysis: LiveAnalysis counting written tweets (see Watcher.py), None if they are not counted
+        """
+        self.storage = storage
+        self.analysis = analysis
+        self.queue = Queue(maxsize=PIPELINE_DEPTH)  # fetching waits when the writer falls this many pages behind
+        self.writer = None  # SegmentWriter of the open segment
+        self.head = None  # whether the open segment is the head one
+        self.error = None  # exception raised by writing, passed on to the fetching thread
+        self.thread = Thread(target=self.run, name='writer-' + storage.topic)
+        self.thread.start()
+
+    def put(self, tweets, head):
+        """
+        Queues a page to be written.\n
+        :param tweets: list of tweet dictionaries ordered from the newest to the oldest
+        :param head: True for the newest tweets (fetched since the newest stored one), False for older ones
+        :raise Exception: the error writing a previous page failed with
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put((tweets, head))
+
+    def run(self):
+        """
+        Writes queued pages until the writer is closed, executed in the writing thread.
+        """
+        while True:
+            page = self.queue.get()
+            try:
+                if page is None:
+                    return
+                if self.error is None:  # pages following a failed one are dropped, a gap would break limiting ids
+                    self.write(*page)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
 
-    line = line.lstrip('{ \'').rstrip('\' }')
-    d = dict()
-    for pair in line.split('\', \''):
-        pair = pair.split('\':\'')
-        d[pair[0]] = pair[1]
-    return d
+    def write(self, tweets, head):
+        """
+        Encodes and appends a page, flushing the segment once the fetching thread is not ahead.\n
+        :param tweets: list of tweet dictionaries
+        :param head: whether the tweets go to the head segment
+        """
+        if self.writer is not None and self.head != head:
+            self.writer.close()
+            self.writer = None
+        if self.writer is None:
+            self.writer = self.storage.writer(head)
+            self.head = head
+        lines = [(tweet['id'], encode_tweet(tweet)) for tweet in tweets]
+        self.writer.write(lines)
+        if self.analysis is not None:  # only written tweets are counted, the rest is left to the next analysis
+            self.analysis.feed(lines, head)
+        if self.queue.empty():  # summary saved while the next page is requested
+            self.writer.flush()
+
+    def drain(self):
+        """
+        Waits until every queued page is written, then flushes and closes the open segment.\n
+        :raise Exception: the error writing a page failed with
+        """
+        self.queue.join()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Writes the queued pages and stops the writing thread.
+        """
+        try:
+            self.drain()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
 
 
 def display_help():
@@ -359,7 +482,7 @@ def display_help():
     Displays help message for script usage.\n
     """
     print('usage: python3 TweetPeeker.py [-h][-t]\n'
-          '       python3 TweetPeeker.py [-r] [-d][-a] a b c ...\n'
+          '       python3 TweetPeeker.py [-r] [-d][-a][-c] [-w 4] [--metrics m.json] [--profile cpu] a b c ...\n'
           '\n'
           'fetch tweets about topics a, b, c...\n'
           '\n'
@@ -368,10 +491,14 @@ def display_help():
           '\n'
           'optional arguments:\n'
           '  -a, --analyze\t\t\t performs analysis for the topics after fetching\n'
+          '  -c, --compact\t\t\t compacts segments of the topics in background after fetching\n'
           '  -d, --dry-run [a,b...]\t runs without saving passed topics to the file\n'
           '  -h, --help\t\t\t show this help message and exit\n'
           '  -r, --remove [a,b...]\t\t remove keywords from topic list\n'
           '  -t, --topics\t\t\t list followed topics\n'
+          '  -w, --workers\t\t\t number of topics fetched at the same time\n'
+          '  --metrics\t\t\t writes metrics of the run to a json (or .prom) file\n'
+          '  --profile\t\t\t cpu or memory, saves a profile of the run into profiles/\n'
           '\n'
           'If no arguments passed, program will follow keywords loaded from topics.txt file '
           'if no such file exists, it will ask you for a keyword to follow, '
@@ -386,7 +513,8 @@ def display_help():
           'python3 TweetPeeker.py --remove example \'another topic\'\n'
           'python3 TweetPeeker.py -da example\n'
           'python3 TweetPeeker.py -a ge -d \'language specified\'\n'
-          'python3 TweetPeeker.py -a --dry-run topic1 topic2 \'another topic\'\n')
+          'python3 TweetPeeker.py -a --dry-run topic1 topic2 \'another topic\'\n'
+          'python3 TweetPeeker.py -w 4\n')
 
 
 def print_topics():
@@ -429,11 +557,22 @@ def remove_topics():
 
 if __name__ == '__main__':
     lurk = TwitterFetcher()
+    metrics_path, profile = take_options()
+
+    for option in ['-w', '--workers']:  # may be passed anywhere, taken out before reading the other arguments
+        if option in sys.argv:
+            index = sys.argv.index(option)
+            if len(sys.argv) == index+1 or not sys.argv[index+1].isdigit():
+                print('Pass number of workers in argument.')
+                exit()
+            lurk.set_workers(int(sys.argv[index+1]))
+            del sys.argv[index:index+2]
 
     dry_run = True if ('-d' in sys.argv or '--dry-run' in sys.argv or
                        '-ad' in sys.argv or '-da' in sys.argv) else None
     analyze = True if ('-a' in sys.argv or '--analyze' in sys.argv or
                        '-ad' in sys.argv or '-da' in sys.argv) else False
+    compact = '-c' in sys.argv or '--compact' in sys.argv
 
     if len(sys.argv) == 1:  # when executed without arguments
         try:
@@ -459,7 +598,7 @@ if __name__ == '__main__':
                 exit()
             index = sys.argv.index(arg[0])  # index of the argument that triggered analysis
             if len(sys.argv) > index+1:  # check if there is anything behind the trigger
-                if len(sys.argv[index+1]) == 2:  # check if it (probably) is a language code
+                if len(sys.argv[index+1]) == 2 and sys.argv[index+1][0] != '-':  # (probably) a language code
                     lurk.analysis_language = sys.argv[index+1]
             from Extractor import analyze_topic
 
@@ -473,7 +612,7 @@ if __name__ == '__main__':
             if sys.argv[1] == '--remove' or sys.argv[1] == '-r':
                 remove_topics()
                 exit()
-            if sys.argv[1] in ['-a', '-da', '-ad', '-d', '--analyze', '--dry-run']:
+            if sys.argv[1] in ['-a', '-da', '-ad', '-d', '-c', '--analyze', '--dry-run', '--compact']:
                 pass
             else:
                 print("Incorrect usage, for help use --help option.\n")
@@ -505,6 +644,9 @@ if __name__ == '__main__':
 
     if analyze:
         lurk.set_perform_analysis()
+    if compact:
+        lurk.set_compact_segments()
 
-    lurk.authenticate()
-    lurk.fetch_topics()
+    with instrumented('TweetPeeker', metrics_path, profile):
+        lurk.authenticate()
+        lurk.fetch_topics()
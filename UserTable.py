@@ -0,0 +1,145 @@
+from array import array
+from hashlib import blake2b
+from math import log
+
+"""
+Users who posted about a topic, counted by Extractor.py.
+UserTable interns screen names: every user gets an integer id, post and follower counts are kept in arrays indexed by
+it, so a user costs a single dictionary entry instead of one in every counter.
+For topics with too many authors to track, HyperLogLog estimates only the number of distinct authors
+(Flajolet et al.), taking 2^precision bytes however many authors there are. Its registers are mergeable,
+so shards analyzed in parallel and incremental runs give the same estimate as a single pass.
+"""
+
+DEFAULT_PRECISION = 14  # 16 KiB of registers, standard error of about 0.8%
+BOT_CACHE_SIZE = 1000000  # maximum number of memoized screen names, the memo is cleared when it gets bigger
+
+bot_names = {}  # screen name -> whether it belongs to a bot
+
+
+def is_bot(screen_name):
+    """
+    Checks whether a screen name looks like a bot's, the decision is memoized so it is made once per user.\n
+    :param screen_name: screen name of the author
+    :return: True if the tweets of the author should be skipped
+    """
+    try:
+        return bot_names[screen_name]
+    except KeyError:
+        if len(bot_names) > BOT_CACHE_SIZE:
+            bot_names.clear()
+        compare_name = screen_name.strip('1234567890').lower()
+        bot = 'iembot' in compare_name or compare_name[:3] == 'bot' or compare_name[-3:] == 'bot'
+        bot_names[screen_name] = bot
+        return bot
+
+
+class UserTable:
+    """
+    Post counts of users and their followers at the first counted post, indexed by interned ids.\n
+    """
+
+    def __init__(self):
+        """
+        Constructor of UserTable class.\n
+        """
+        self.ids = {}  # screen name -> id
+        self.names = []  # id -> screen name
+        self.posts = array('I')  # id -> number of posts
+        self.followers = array('Q')  # id -> number of followers at the first post
+
+    def __contains__(self, screen_name):
+        return screen_name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def add(self, screen_name, followers, posts=1):
+        """
+        Counts posts of a user, followers are remembered only for users seen for the first time.\n
+        :param screen_name: screen name of the author
+        :param followers: number of the author's followers
+        :param posts: number of posts
+        """
+        user = self.ids.get(screen_name)
+        if user is None:
+            self.followers.append(int(followers))  # first, so a malformed number does not leave a half added user
+            self.ids[screen_name] = len(self.names)
+            self.names.append(screen_name)
+            self.posts.append(posts)
+        else:
+            self.posts[user] += posts
+
+    def merge(self, other):
+        """
+        Adds users counted by another table, their followers are kept from the table which saw them first (this one).\n
+        :param other: UserTable counting posts following the ones counted here
+        """
+        for screen_name, posts, followers in zip(other.names, other.posts, other.followers):
+            self.add(screen_name, followers, posts)
+
+    def items(self):
+        """
+        Lists users with their post counts, like dict.items.\n
+        :return: iterator of (screen name, posts) pairs
+        """
+        return zip(self.names, self.posts)
+
+    def first_followers(self):
+        """
+        Lists users with their followers at the first counted post.\n
+        :return: iterator of (screen name, followers) pairs
+        """
+        return zip(self.names, self.followers)
+
+
+class HyperLogLog:
+    """
+    Estimate of the number of distinct keys, taking 2^precision bytes.\n
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        """
+        Constructor of HyperLogLog class.\n
+        :param precision: number of hash bits choosing the register, 4 to 18
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)  # register -> highest rank seen
+
+    def add(self, screen_name, followers=None, posts=1):
+        """
+        Counts a user, the same way as UserTable does.\n
+        :param screen_name: screen name of the author
+        :param followers: number of the author's followers, not kept
+        :param posts: number of posts, not kept
+        """
+        digest = blake2b(screen_name.encode('utf-8'), digest_size=8).digest()  # unlike hash(), stable across runs
+        value = int.from_bytes(digest, 'big')
+        bits = 64 - self.precision
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        register = value >> bits
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        """
+        Adds keys counted by another estimate of the same precision.\n
+        :param other: HyperLogLog
+        """
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        """
+        Estimates the number of distinct counted keys, small numbers are counted by empty registers.\n
+        :return: estimated number of keys
+        """
+        size = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+        raw = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(0)
+        if raw <= 2.5 * size and empty:
+            return size * log(size / empty)
+        return raw
@@ -0,0 +1,317 @@
+import sys
+import json
+
+from time import time, sleep
+from threading import Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from TweetCodec import project_line
+from TweetPeeker import TwitterFetcher
+from AnalysisState import topic_summaries
+from Extractor import analyze_topic, create_extractors, save_extractors
+from Metrics import METRICS, take_options, instrumented
+
+"""
+Keeps fetching topics on a schedule and analyzes the fetched tweets on the fly, in a single long-running process.
+Analyses of the topics are loaded once (see LiveAnalysis), every written page of tweets is counted right away by the
+page writer of TweetPeeker.py, so neither the analysis is reloaded nor the stored tweets are scanned after a fetch.
+Counts are saved to the analysis states at checkpoints, then only totals are loaded again (see AnalysisState.py).
+Tweets fetched after the last checkpoint are stored anyway, the next analysis of the topic counts them after a crash.
+Current statistics of the topics are served as json on a local port, e.g. http://localhost:8080/stats/<topic>,
+metrics of the process (see Metrics.py) in Prometheus text format at /metrics.
+"""
+
+DEFAULT_INTERVAL = 300  # seconds between the starts of two fetches of the topics
+DEFAULT_CHECKPOINT = 900  # seconds between two saves of the analyses
+DEFAULT_PORT = 8080  # local port statistics are served on, 0 disables serving
+
+
+class LiveAnalysis:
+    """
+    Analysis of a watched topic held in memory, fed with the fetched tweets by the page writer.\n
+    Tweets are counted like by a scan of the topic file: only the ones newer than the last analyzed tweet and with
+    the newest tweets first, pages fetched since the newest stored tweet are counted apart and added in front.\n
+    """
+
+    def __init__(self, topic, language='en', capacity=None, precision=None, retention=None):
+        """
+        Constructor of LiveAnalysis class, loads the analysis.\n
+        :param topic: watched topic
+        :param language: language of the analysis, list of languages or 'all'
+        :param capacity: terms monitored in approximate mode, None to count words and hashtags exactly
+        :param precision: precision of the distinct users estimate, None to count posts of every user
+        :param retention: hours kept in the hourly series, None to keep the stored window
+        """
+        self.topic = topic
+        self.language = language
+        self.capacity = capacity
+        self.precision = precision
+        self.retention = retention
+        self.lock = Lock()  # feeding happens in the writing thread, statistics are read by the serving ones
+        self.leaders = []  # group leaders counting the tweets since the last checkpoint (see create_extractors)
+        self.newer = []  # for every leader, shard counting tweets newer than the stored ones, None if there are none
+        self.newest_id = None  # id of the newest counted tweet
+        self.summaries = {}  # summaries of the saved analyses, language -> summary
+        self.checkpoint_time = None  # time of the last checkpoint
+        self.load()
+
+    def load(self):
+        """
+        Creates extractors loaded with totals of the saved analyses.
+        """
+        self.leaders = create_extractors(self.topic, self.language, self.capacity, self.precision, self.retention)
+        self.newer = [None] * len(self.leaders)
+        self.newest_id = None
+        self.summaries = topic_summaries(self.topic)
+        self.checkpoint_time = time()
+
+    def feed(self, lines, head):
+        """
+        Counts a written page of tweets.\n
+        :param lines: list of (tweet id, encoded line) pairs, ordered from the newest to the oldest tweet
+        :param head: True for tweets newer than the stored ones, False for older ones
+        """
+        fed = 0
+        with self.lock:
+            for number, leader in enumerate(self.leaders):
+                if head:
+                    if self.newer[number] is None:
+                        self.newer[number] = leader.shard()
+                    counter = self.newer[number]
+                else:
+                    counter = leader
+                for tweet_id, line in lines:
+                    tweet_id = int(tweet_id)
+                    if leader.last_id is not None and tweet_id <= leader.last_id:
+                        continue  # analyzed before, or older than the analyzed ones, which a scan never reaches
+                    try:
+                        counter.count_tweet(project_line(line))
+                    except (ValueError, IndexError, KeyError):
+                        continue
+                    self.newest_id = tweet_id if self.newest_id is None else max(self.newest_id, tweet_id)
+                    fed += 1
+            METRICS.count('watch.tweets_fed', fed)
+
+    def settle(self):
+        """
+        Adds the tweets newer than the stored ones to the counts, called once a fetch of the topic ended.
+        """
+        with self.lock:
+            for number, leader in enumerate(self.leaders):
+                if self.newer[number] is not None:
+                    leader.prepend(self.newer[number])
+                    self.newer[number] = None
+
+    def checkpoint(self, export=False):
+        """
+        Saves the counted tweets to the analyses and starts counting again from their totals.\n
+        :param export: whether to export analyses as human readable json
+        :return: number of saved tweets
+        """
+        self.settle()
+        with self.lock, METRICS.timer('watch.checkpoint'):
+            saved = sum(leader.new_tweets_count for leader in self.leaders)
+            if saved:
+                for leader in self.leaders:
+                    leader.new_last_id = self.newest_id
+                    leader.share()
+                save_extractors(self.topic, self.leaders, export)
+            self.load()
+        return saved
+
+    def statistics(self):
+        """
+        Gives the current statistics of every analyzed language, the saved ones with the tweets counted since.\n
+        Trending terms are the ones of the last checkpoint.\n
+        :return: dictionary language -> statistics
+        """
+        with self.lock:
+            statistics = {}
+            for leader, newer in zip(self.leaders, self.newer):
+                counters = [leader] if newer is None else [leader, newer]
+                pending = sum(counter.new_tweets_count for counter in counters)
+                for brain in leader.group():
+                    if brain.language is None:
+                        continue
+                    summary = self.summaries.get(brain.language, {})
+                    dates = dict(summary.get('dates', {}))
+                    languages = dict(summary.get('languages', {}))
+                    for counter in counters:
+                        for date, count in counter.dates.items():
+                            dates[date] = dates.get(date, 0) + count
+                        for language, count in counter.languages.items():
+                            language = language if language is not None else 'null'  # key of json summaries
+                            languages[language] = languages.get(language, 0) + count
+                    statistics[brain.language] = {
+                        'tweets_count': summary.get('tweets_count', 0) + pending, 'pending_tweets': pending,
+                        'tweets_applying_for_analysis': languages.get(brain.language),
+                        'last_id': self.newest_id if self.newest_id is not None else summary.get('last_id'),
+                        'languages': languages, 'dates': dates, 'trending': summary.get('trending', {}),
+                        'checkpoint': round(self.checkpoint_time)}
+            return statistics
+
+
+class StatsHandler(BaseHTTPRequestHandler):
+    """
+    Serves statistics of the watched topics: /stats lists all of them, /stats/<topic> a single one,
+    /metrics gives metrics of the process.\n
+    """
+
+    analyses = {}  # topic -> LiveAnalysis, set by the server
+
+    def do_GET(self):
+        parts = [unquote(part) for part in self.path.split('?')[0].split('/') if part]
+        if parts == ['metrics']:
+            body = METRICS.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ['stats']:
+            self.respond(200, {topic: analysis.statistics() for topic, analysis in self.analyses.items()})
+        elif len(parts) == 2 and parts[0] == 'stats' and parts[1] in self.analyses:
+            self.respond(200, self.analyses[parts[1]].statistics())
+        else:
+            self.respond(404, {'error': 'unknown path', 'topics': sorted(self.analyses)})
+
+    def respond(self, status, content):
+        """
+        Sends a json response.\n
+        :param status: HTTP status code
+        :param content: json-serializable content
+        """
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # requests are not printed between the fetching progress
+
+
+def serve_statistics(analyses, port=DEFAULT_PORT):
+    """
+    Starts serving statistics of the watched topics on a local port, in a background thread.\n
+    :param analyses: dictionary topic -> LiveAnalysis
+    :param port: port to listen on
+    :return: the running server
+    """
+    handler = type('Handler', (StatsHandler,), {'analyses': analyses})
+    server = ThreadingHTTPServer(('localhost', port), handler)
+    Thread(target=server.serve_forever, name='stats', daemon=True).start()
+    return server
+
+
+def watch(fetcher, language='en', interval=DEFAULT_INTERVAL, checkpoint=DEFAULT_CHECKPOINT, port=DEFAULT_PORT,
+          cycles=None, processes=1, export=False, capacity=None, precision=None, retention=None):
+    """
+    Fetches the fetcher's topics every interval and counts the fetched tweets in memory, until interrupted.\n
+    Tweets stored before are analyzed once at the start, analyses are saved every checkpoint and at the end.\n
+    :param fetcher: authenticated TwitterFetcher with the topics to watch
+    :param language: language of the analyses, list of languages or 'all'
+    :param interval: seconds between the starts of two fetches
+    :param checkpoint: seconds between two saves of the analyses
+    :param port: local port statistics are served on, 0 not to serve them
+    :param cycles: number of fetches to make, None to watch until interrupted
+    :param processes: number of processes analyzing the stored tweets at the start
+    :param export: whether to export analyses as human readable json at checkpoints
+    :param capacity: terms monitored in approximate mode, None to count words and hashtags exactly
+    :param precision: precision of the distinct users estimate, None to count posts of every user
+    :param retention: hours kept in the hourly series, None to keep the stored window
+    """
+    for topic in fetcher.topics:
+        analyze_topic(topic, language, processes, export, capacity, precision, retention)
+        fetcher.analyses[topic] = LiveAnalysis(topic, language, capacity, precision, retention)
+    server = serve_statistics(fetcher.analyses, port) if port else None
+    if server is not None:
+        print('Serving statistics on \x1b[1;34;40mhttp://localhost:{}/stats\x1b[0m'.format(server.server_address[1]))
+
+    fetches = 0
+    try:
+        while cycles is None or fetches < cycles:
+            start_time = time()
+            fetcher.fetch_topics()
+            fetches += 1
+            for topic, analysis in fetcher.analyses.items():
+                if time() - analysis.checkpoint_time >= checkpoint:
+                    print('Saved \x1b[1;36;40m{}\x1b[0m tweets about \x1b[1;34;40m{}\x1b[0m.'.format(
+                        analysis.checkpoint(export), topic))
+            if cycles is None or fetches < cycles:
+                sleep(max(0., interval - (time() - start_time)))
+    except KeyboardInterrupt:
+        print('Stopped watching.')
+    finally:
+        for topic, analysis in fetcher.analyses.items():
+            print('Saved \x1b[1;36;40m{}\x1b[0m tweets about \x1b[1;34;40m{}\x1b[0m.'.format(
+                analysis.checkpoint(export), topic))
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    metrics_path, profile = take_options()
+    options = {'interval': str(DEFAULT_INTERVAL), 'checkpoint': str(DEFAULT_CHECKPOINT), 'port': str(DEFAULT_PORT),
+               'language': 'en', 'workers': '1', 'processes': '1'}
+    flags = {'interval': '-i', 'checkpoint': '-k', 'port': '-P', 'language': '-l', 'workers': '-w', 'processes': '-p'}
+    for option in list(options):
+        for flag in [flags[option], '--' + option]:
+            if flag in sys.argv:
+                index = sys.argv.index(flag)
+                if len(sys.argv) == index+1:
+                    print('Pass {} in argument.'.format(option))
+                    exit()
+                options[option] = sys.argv[index+1]
+                del sys.argv[index:index+2]
+    export = '-j' in sys.argv or '--json' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg not in ['-j', '--json']]
+
+    if (len(sys.argv) > 1 and sys.argv[1][0] == '-') or \
+            not all(options[option].isdigit() for option in options if option != 'language'):
+        print('usage: python3 Watcher.py [-h] [-i 300] [-k 900] [-P 8080] [-l en] [-w 4] [-p 4] [-j]\n'
+              '                         [--metrics m.json] [--profile cpu] [a b c...]\n'
+              '\n'
+              'fetches topics a, b, c... on a schedule and analyzes fetched tweets on the fly\n'
+              '\n'
+              'positional arguments:\n'
+              '  a, b, c...\t\t\t topics to watch, the ones from assets/topics.txt by default\n'
+              '\n'
+              'optional arguments:\n'
+              '  -h, --help\t\t\t show this help message and exit\n'
+              '  -i, --interval\t\t seconds between the starts of two fetches, default {}\n'
+              '  -k, --checkpoint\t\t seconds between two saves of the analyses, default {}\n'
+              '  -P, --port\t\t\t local port statistics are served on, 0 not to serve them, default {}\n'
+              '  -l, --language\t\t language of the analyses, \'all\' for every language\n'
+              '  -w, --workers\t\t\t number of topics fetched at the same time\n'
+              '  -p, --processes\t\t number of processes analyzing tweets stored before the start\n'
+              '  -j, --json\t\t\t exports analyses as human readable json at every checkpoint\n'
+              '  --metrics\t\t\t writes metrics of the run to a json (or .prom) file\n'
+              '  --profile\t\t\t cpu or memory, saves a profile of the run into profiles/\n'
+              '\n'
+              'Statistics of all topics are served at /stats, of a single one at /stats/<topic>.\n'
+              'Analyses are saved at every checkpoint and when interrupted with Ctrl+C.\n'
+              '\n'
+              'example usages:\n'
+              'python3 Watcher.py -i 600 -k 3600 -l all example\n'
+              'python3 Watcher.py -P 0 -w 4\n'.format(DEFAULT_INTERVAL, DEFAULT_CHECKPOINT, DEFAULT_PORT))
+        exit()
+
+    lurk = TwitterFetcher()
+    lurk.set_workers(int(options['workers']))
+    lurk.topics = [arg.lower() for arg in sys.argv[1:]]
+    if not lurk.topics:
+        try:
+            with open('assets/topics.txt', 'r') as file:
+                lurk.topics = [line.strip() for line in file if line.strip()]
+        except FileNotFoundError:
+            print('No topics to watch. Pass them in argument or save in assets/topics.txt file')
+            exit()
+    language = options['language'].split(',') if ',' in options['language'] else options['language']
+
+    with instrumented('Watcher', metrics_path, profile):
+        lurk.authenticate()
+        watch(lurk, language, int(options['interval']), int(options['checkpoint']), int(options['port']),
+              processes=int(options['processes']), export=export)